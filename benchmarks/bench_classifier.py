@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark del clasificador local de comercios (`tx_enrich.MerchantClassifier`)
+con un historial sintético.
+
+Cada marca tiene una clasificación (con un poco de ruido) y aparece con
+variantes del nombre ("UBER RIDES", "UBER *TRIP BOGOTA"...). Se entrena con
+una parte de las variantes y se evalúa con las que no vio. Mide:
+
+- Entrenamiento desde los conteos por comercio (lo que hace el sync) y desde
+  las transacciones.
+- Inferencia por comercio, en µs (la primera pasada también calcula los
+  pesos de cada n-grama, que luego quedan en caché).
+- Calibración: en cada rango de confianza, qué fracción de las predicciones
+  acierta la clasificación completa, y para cada umbral candidato cuántos
+  comercios lo pasan y con qué precisión.
+
+Con `--history` hace la evaluación sobre el historial real exportado por
+finance_export.py (requiere pyarrow): entrena con el 80% más antiguo y
+evalúa con las transacciones posteriores de comercios que no están en esa
+parte (justo los que la memoria no conoce). Es la tabla con la que hay que
+revisar `CLASSIFIER_MIN_CONFIDENCE`.
+
+Uso:
+    python3 benchmarks/bench_classifier.py [--txs 50000] [--brands 800]
+    python3 benchmarks/bench_classifier.py --history .cache/finance_transactions
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tx_enrich import (  # noqa: E402
+    CLASSIFIER_MIN_CONFIDENCE, MerchantClassifier, merchant_counts, merchant_fields, normalize_merchant,
+)
+
+CATEGORIAS = {
+    'Comida': ['Restaurantes', 'Domicilios/Rappi', 'Cafés'],
+    'Transporte': ['Uber/Taxi', 'Gasolina', 'Parqueadero'],
+    'Mercado': ['', 'Supermercado'],
+    'Software': ['Cloud', 'Suscripciones'],
+    'Hogar': ['Servicios', 'Arriendo'],
+    'Salud': ['Farmacia', 'Médico'],
+    'Ocio': ['Cine', 'Viajes'],
+    'Ropa': [''],
+    'Ingresos': ['Salario', 'Transferencias'],
+}
+# Las marcas de estas categorías son abonos (type 'credit').
+CREDITO = {'Ingresos'}
+UMBRALES = [0.5, 0.7, 0.8, 0.9, 0.95, 0.99]
+SUFIJOS = ['', 'COLOMBIA', 'BOGOTA', 'MEDELLIN', '*TRIP', 'SAS', 'PAGOS', 'ONLINE', 'CALLE 80',
+           'EXPRESS', 'CENTRO', 'WEB']
+LETRAS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def make_brands(rnd, n):
+    brands = {}
+    while len(brands) < n:
+        name = ''.join(rnd.choice(LETRAS) for _ in range(rnd.randint(3, 8))).upper()
+        cat = rnd.choice(list(CATEGORIAS))
+        brands[name] = {'type': 'credit' if cat in CREDITO else 'debit',
+                        'category': cat, 'subcategory': rnd.choice(CATEGORIAS[cat]),
+                        'context': 'business' if rnd.random() < 0.2 else 'personal'}
+    return brands
+
+
+def make_history(rnd, brands, n_txs, noise=0.05):
+    """Transacciones de entrenamiento y títulos de prueba nunca vistos."""
+    train_sufijos, test_sufijos = SUFIJOS[:8], SUFIJOS[8:]
+    nombres = list(brands)
+    pesos = [1 / (i + 1) for i in range(len(nombres))]   # Zipf: unas pocas marcas dominan
+    txs = []
+    for name in rnd.choices(nombres, pesos, k=n_txs):
+        label = brands[name]
+        if rnd.random() < noise:
+            cat = rnd.choice([c for c in CATEGORIAS if c not in CREDITO])
+            label = {**label, 'category': cat, 'subcategory': rnd.choice(CATEGORIAS[cat])}
+        txs.append({'title': f"{name} {rnd.choice(train_sufijos)}".strip(), **label})
+    vistas = {tx['title'].split()[0] for tx in txs}
+    test = [(f"{name} {suf}", brands[name]) for name in nombres if name in vistas for suf in test_sufijos]
+    return txs, test
+
+
+def split_history(rows, train_fraction=0.8):
+    """Separa el historial real en entrenamiento (lo más antiguo) y prueba:
+    las transacciones posteriores de comercios que no aparecen antes."""
+    rows = sorted(rows, key=lambda r: (r.get('date') or '', str(r.get('timestamp') or '')))
+    cut = int(len(rows) * train_fraction)
+    train = rows[:cut]
+    vistos = {normalize_merchant(r.get('title', '')) for r in train}
+    test = [(r['title'], merchant_fields(r)) for r in rows[cut:]
+            if normalize_merchant(r.get('title', '')) not in vistos]
+    return train, test
+
+
+def evaluar(preds, test):
+    """Calibración por rango de confianza y cobertura/precisión por umbral
+    (acierto = la clasificación completa coincide)."""
+    resultados = [(conf, label == esperado) for (label, conf), (_, esperado) in
+                  ((p, t) for p, t in zip(preds, test) if p and p[0] is not None)]
+    rangos = [(0.0, 0.5), (0.5, 0.7), (0.7, 0.9), (0.9, 0.99), (0.99, 1.01)]
+    print(f"\n{'confianza':>12} {'n':>6} {'aciertos':>9}")
+    for lo, hi in rangos:
+        hits = [ok for conf, ok in resultados if lo <= conf < hi]
+        if hits:
+            print(f"{lo:>5.2f}–{min(hi, 1):<5.2f} {len(hits):>6} {sum(hits) / len(hits):>9.1%}")
+
+    print(f"\n{'umbral':>7} {'cobertura':>10} {'precisión':>10}")
+    for umbral in UMBRALES:
+        usados = [ok for conf, ok in resultados if conf >= umbral]
+        marca = '  ← CLASSIFIER_MIN_CONFIDENCE' if umbral == CLASSIFIER_MIN_CONFIDENCE else ''
+        print(f"{umbral:>7.2f} {len(usados) / max(len(test), 1):>10.1%} "
+              f"{sum(usados) / max(len(usados), 1):>10.1%}{marca}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del clasificador local de comercios")
+    parser.add_argument('--txs', type=int, default=50000)
+    parser.add_argument('--brands', type=int, default=800)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--history', metavar='CARPETA',
+                        help="Evalúa con el historial real exportado por finance_export.py.")
+    args = parser.parse_args()
+
+    if args.history:
+        from finance_export import load
+        txs, test = split_history(load(args.history).to_pylist())
+        print(f"Historial real: {len(txs)} transacciones de entrenamiento, "
+              f"{len(test)} de prueba (comercios nuevos)")
+    else:
+        rnd = random.Random(args.seed)
+        txs, test = make_history(rnd, make_brands(rnd, args.brands), args.txs)
+
+    t0 = time.perf_counter()
+    counts = merchant_counts(txs)
+    t_counts = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    clf = MerchantClassifier.from_counts(counts)
+    t_train = time.perf_counter() - t0
+    print(f"Entrenamiento: {len(txs)} transacciones, {len(counts)} comercios — "
+          f"conteos {t_counts * 1000:.0f} ms + clasificador {t_train * 1000:.0f} ms")
+
+    t0 = time.perf_counter()
+    preds = [clf.predict(title) for title, _ in test]
+    t_frio = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for title, _ in test:
+        clf.predict(title)
+    t_pred = time.perf_counter() - t0
+    print(f"Inferencia: {t_pred / max(len(test), 1) * 1e6:.1f} µs por comercio "
+          f"({t_frio / max(len(test), 1) * 1e6:.1f} µs la primera pasada; {len(test)} comercios nuevos)")
+
+    evaluar(preds, test)
+
+
+if __name__ == '__main__':
+    main()
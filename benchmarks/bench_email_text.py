@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la extracción de texto de correos (email_text.py).
+
+Compara `email_text` contra la versión anterior (BeautifulSoup con
+"html.parser" y `+=`) sobre las plantillas HTML de notificaciones bancarias
+de `benchmarks/fixtures/`, en tres formas de payload de Gmail: solo HTML,
+multipart/alternative (texto + HTML) y multipart/mixed anidado con adjunto.
+
+Uso:
+    python3 benchmarks/bench_email_text.py [--repeat 200]
+
+La comparación con BeautifulSoup solo corre si `bs4` está instalado.
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from email_text import email_text, html_to_text  # noqa: E402
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:  # bs4 ya no es dependencia del sync
+    BeautifulSoup = None
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+MAX_BODY_CHARS = 3500
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def payloads(html):
+    """Las tres formas de payload de Gmail para una plantilla."""
+    plain = html_to_text(html)
+    return {
+        'html': {'mimeType': 'text/html', 'body': {'data': _b64(html)}},
+        'alternative': {'mimeType': 'multipart/alternative', 'parts': [
+            {'mimeType': 'text/plain', 'body': {'data': _b64(plain)}},
+            {'mimeType': 'text/html', 'body': {'data': _b64(html)}},
+        ]},
+        'mixed': {'mimeType': 'multipart/mixed', 'parts': [
+            {'mimeType': 'multipart/related', 'parts': [
+                {'mimeType': 'text/html', 'body': {'data': _b64(html)}},
+                {'mimeType': 'image/png', 'body': {'attachmentId': 'logo', 'size': 5120}},
+            ]},
+            {'mimeType': 'application/pdf', 'filename': 'comprobante.pdf',
+             'body': {'attachmentId': 'pdf', 'size': 40960}},
+        ]},
+    }
+
+
+def legacy_extract(payload):
+    """Versión anterior de `extract_email_body` (referencia)."""
+    text_content = ""
+
+    def get_text_from_parts(parts):
+        nonlocal text_content
+        for part in parts:
+            mime_type = part.get("mimeType")
+            data = part.get("body", {}).get("data")
+            if mime_type == "text/plain" and data:
+                text_content += base64.urlsafe_b64decode(data).decode("utf-8")
+            elif mime_type == "text/html" and data:
+                html = base64.urlsafe_b64decode(data).decode("utf-8")
+                text_content += BeautifulSoup(html, "html.parser").get_text(separator="\n")
+            elif "parts" in part:
+                get_text_from_parts(part["parts"])
+
+    if "parts" in payload:
+        get_text_from_parts(payload["parts"])
+    else:
+        data = payload.get("body", {}).get("data")
+        if data:
+            decoded = base64.urlsafe_b64decode(data).decode("utf-8")
+            if "html" in payload.get("mimeType", ""):
+                decoded = BeautifulSoup(decoded, "html.parser").get_text(separator="\n")
+            text_content = decoded
+    return text_content.strip()
+
+
+def _time(fn, payload, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(payload)
+    return (time.perf_counter() - t0) / repeat, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de email_text")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    nuevo = lambda p: email_text(p, MAX_BODY_CHARS)[:MAX_BODY_CHARS]  # noqa: E731
+    viejo = lambda p: legacy_extract(p)[:MAX_BODY_CHARS]  # noqa: E731
+    totales = {'nuevo': 0.0, 'viejo': 0.0}
+
+    print(f"{'plantilla':<30} {'forma':<12} {'KB':>5} {'nuevo ms':>9} {'bs4 ms':>8} {'×':>6}")
+    for name in sorted(os.listdir(FIXTURES)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+            html = f.read()
+        for forma, payload in payloads(html).items():
+            t_nuevo, texto = _time(nuevo, payload, args.repeat)
+            assert '$' in texto, f"{name}/{forma}: no se extrajo el monto"
+            totales['nuevo'] += t_nuevo
+            fila = f"{name:<30} {forma:<12} {len(html) / 1024:>5.1f} {t_nuevo * 1e3:>9.3f}"
+            if BeautifulSoup is not None:
+                t_viejo, _ = _time(viejo, payload, args.repeat)
+                totales['viejo'] += t_viejo
+                fila += f" {t_viejo * 1e3:>8.3f} {t_viejo / t_nuevo:>6.1f}"
+            print(fila)
+
+    if BeautifulSoup is not None:
+        print(f"\nTotal: nuevo {totales['nuevo'] * 1e3:.2f} ms · bs4 {totales['viejo'] * 1e3:.2f} ms "
+              f"· ×{totales['viejo'] / totales['nuevo']:.1f}")
+    else:
+        print(f"\nTotal: nuevo {totales['nuevo'] * 1e3:.2f} ms (bs4 no instalado: sin comparación)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark de finance_insights.py con transacciones sintéticas.
+
+Compara `compute_insights` (columnas de NumPy + sumas agrupadas) contra
+`por_transaccion`, un recorrido en Python puro que hace lo mismo que los
+`useMemo` de Insights.jsx (un bucle por métrica sobre cada transacción), y
+verifica que den los mismos números. Mide por separado la carga en
+columnas (`Columns`), que incluye leer los dicts.
+
+Uso:
+    python3 benchmarks/bench_insights.py [--sizes 1000,10000,100000] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import finance_insights as fi  # noqa: E402
+
+TODAY = datetime.date(2026, 10, 17)
+CATEGORIAS = ['Comida', 'Transporte', 'Hogar', 'Servicios', 'Software', 'Salud', 'Ocio',
+              'Ingresos', 'Financiero y Deudas', 'general']
+
+
+def make_txs(n, seed=7, days=730):
+    rnd = random.Random(seed)
+    txs = []
+    for _ in range(n):
+        date = TODAY - datetime.timedelta(days=rnd.randrange(days))
+        tipo = rnd.choices(['debit', 'credit', 'transfer'], [85, 10, 5])[0]
+        cat = rnd.choice(CATEGORIAS)
+        txs.append({
+            'date': date.isoformat(),
+            'amount': round(rnd.uniform(2, 300), 2) if rnd.random() < 0.1 else rnd.randrange(1000, 900000),
+            'currency': 'USD' if rnd.random() < 0.1 else 'COP',
+            'type': tipo,
+            'category': {'name': cat} if rnd.random() < 0.02 else cat,
+            'context': rnd.choice(fi.CONTEXTS),
+            'destinationContext': rnd.choice(fi.CONTEXTS) if tipo == 'transfer' else None,
+            'title': f"Comercio {rnd.randrange(500)}",
+        })
+    return txs
+
+
+def por_transaccion(txs, today):
+    """Referencia: bucles por transacción, como Insights.jsx."""
+    def grupos(t):
+        out = ['unified']
+        if t.get('context') in fi.CONTEXTS:
+            out.append(t['context'])
+        dest = t.get('destinationContext')
+        if t.get('type') == 'transfer' and dest in fi.CONTEXTS and dest != t.get('context'):
+            out.append(dest)
+        return out
+
+    mes, prev = today.strftime('%Y-%m'), (today.replace(day=1) - datetime.timedelta(days=1)).strftime('%Y-%m')
+    res = {g: {'spent': 0.0, 'income': 0.0, 'prevSpent': 0.0, 'daily': [0.0] * fi.DAILY_DAYS,
+               'cats': defaultdict(float), 'biggest': None, 'days': set()} for g in fi.GROUPS}
+    for t in txs:
+        amount = t['amount'] * fi.EXCHANGE_RATE if t.get('currency') == 'USD' else t['amount']
+        d = datetime.date.fromisoformat(t['date'])
+        cat = fi.normalize_category(t.get('category'))
+        for g in grupos(t):
+            r = res[g]
+            r['days'].add(d)
+            if t['type'] == 'transfer':
+                continue
+            if t['date'][:7] == mes:
+                r['spent' if t['type'] == 'debit' else 'income'] += amount
+                if t['type'] == 'debit':
+                    r['cats'][cat] += amount
+            elif t['date'][:7] == prev and t['type'] == 'debit':
+                r['prevSpent'] += amount
+            ago = (today - d).days
+            if t['type'] == 'debit' and 0 <= ago < fi.DAILY_DAYS:
+                r['daily'][fi.DAILY_DAYS - 1 - ago] += amount
+                if r['biggest'] is None or amount > r['biggest']:
+                    r['biggest'] = amount
+    for r in res.values():
+        cursor = today if today in r['days'] else today - datetime.timedelta(days=1)
+        streak = 0
+        while cursor in r['days']:
+            streak += 1
+            cursor -= datetime.timedelta(days=1)
+        r['streak'] = streak
+    return res
+
+
+def verificar(doc, ref):
+    # La racha de finance_insights no pasa del inicio de la ventana.
+    tope = (TODAY - datetime.date.fromisoformat(doc['windowStart'])).days + 1
+    for g in fi.GROUPS:
+        c, r = doc['contexts'][g], ref[g]
+        assert abs(c['month']['spent'] - r['spent']) < 1e-3, g
+        assert abs(c['month']['income'] - r['income']) < 1e-3, g
+        assert abs(c['cashflow'][-2]['expenses'] - r['prevSpent']) < 1e-3, g
+        assert all(abs(a - b) < 1e-3 for a, b in zip(c['daily'], r['daily'])), g
+        assert {x['name']: round(x['amount'], 3) for x in c['categories']} == \
+            {k: round(v, 3) for k, v in r['cats'].items() if v > 0}, g
+        assert (c['biggest'] or {}).get('amount') == r['biggest'], g
+        assert c['streak'] == min(r['streak'], tope), g
+
+
+def medir(fn, repeat):
+    mejor = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de finance_insights")
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'columnas ms':>12} {'numpy ms':>10} {'python ms':>10} {'x':>6}")
+    for n in (int(s) for s in args.sizes.split(',')):
+        txs = make_txs(n)
+        t_cols, cols = medir(lambda: fi.Columns(txs), args.repeat)
+        t_np, doc = medir(lambda: fi.compute_insights(cols, TODAY), args.repeat)
+        t_py, ref = medir(lambda: por_transaccion(txs, TODAY), args.repeat)
+        verificar(doc, ref)
+        print(f"{n:>8} {t_cols * 1000:>12.1f} {t_np * 1000:>10.1f} {t_py * 1000:>10.1f} "
+              f"{t_py / t_np:>6.1f}")
+    print("✅ Mismos resultados en ambas implementaciones.")
+
+
+if __name__ == '__main__':
+    main()
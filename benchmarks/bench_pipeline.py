@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark de punta a punta del sync, sin red.
+
+Corre `gmail_finanzas_sync.main()` contra los dobles en memoria de
+`benchmarks/fakes.py` (Gmail con N correos generados desde `fixtures/`,
+Gemini con respuestas enlatadas, Firestore y FCM), cada uno con su latencia
+simulada: primero el sync normal y luego, sobre lo recién sincronizado,
+`--reprocess-last N --dry-run`. Para cada tamaño muestra el throughput, las
+etapas más costosas (p50/p95 según run_metrics) y las RPC a cada servicio.
+
+Uso:
+    python3 benchmarks/bench_pipeline.py [--sizes 10,100,1000] [--workers 4]
+        [--llm-batch 1] [--gemini-rpm 6000] [--gemini-concurrency 4]
+        [--gemini-errors 0.0] [--push-digest] [--gmail-ms 20] [--gemini-ms 150] [--firestore-ms 10]
+        [--json ARCHIVO]
+
+Requiere las dependencias del sync (requirements.txt) instaladas, aunque no
+hace falta ninguna credencial.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fakes  # noqa: E402
+import gmail_finanzas_sync as sync  # noqa: E402
+import push_notify  # noqa: E402
+
+TOP_STAGES = 6
+
+
+def correr(argv, db, gmail, gemini, fcm):
+    """Ejecuta `main()` con los dobles y devuelve (segundos, resumen de
+    métricas). La salida del sync se descarta."""
+    sync.conectar_db = lambda: db
+    sync.authenticate_gmail = lambda db: gmail
+    sync.gemini_client = lambda api_key: gemini
+    push_notify._messaging().send_each_for_multicast = fcm.send_each_for_multicast
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'metrics.jsonl')
+        sys.argv = ['gmail_finanzas_sync.py', '--no-cache', '--metrics-out', out] + argv
+        t0 = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            sync.main()
+        elapsed = time.perf_counter() - t0
+        with open(out, encoding='utf-8') as f:
+            resumen = json.loads(f.readlines()[-1])
+    return elapsed, resumen
+
+
+def escenarios(n, args):
+    """Sync normal de `n` correos y, sobre el mismo estado, el re-proceso
+    `--reprocess-last n --dry-run`. Devuelve un resultado por escenario."""
+    db = fakes.FakeFirestore(latency=args.firestore_ms / 1e3)
+    db.data['fcm_tokens'] = {'tok-benchmark': {'platform': 'web'}}
+    gmail = fakes.FakeGmail(fakes.make_emails(n), latency=args.gmail_ms / 1e3)
+    gemini = fakes.FakeGenai(latency=args.gemini_ms / 1e3, error_rate=args.gemini_errors)
+    fcm = fakes.FakeMessaging(latency=args.fcm_ms / 1e3)
+
+    argv = ['--workers', str(args.workers), '--llm-batch', str(args.llm_batch),
+            '--gemini-rpm', str(args.gemini_rpm), '--gemini-concurrency', str(args.gemini_concurrency)]
+    if args.push_digest:
+        argv.append('--push-digest')
+    for modo, extra in (('sync', []), ('reprocess', ['--reprocess-last', str(n), '--dry-run'])):
+        db.rpc.clear()
+        gmail.rpc.clear()
+        gemini.calls = gemini.errors = fcm.calls = 0
+        antes = len(db.data.get('finance_transactions', {}))
+        elapsed, resumen = correr(argv + extra, db, gmail, gemini, fcm)
+        yield {
+            'n': n,
+            'modo': modo,
+            'segundos': round(elapsed, 3),
+            'correos_s': round(n / elapsed, 1) if elapsed else None,
+            'transacciones': len(db.data.get('finance_transactions', {})) - antes,
+            'rpc': {
+                'gmail': dict(gmail.rpc),
+                'gemini': gemini.calls,
+                'gemini_429': gemini.errors,
+                'firestore': dict(db.rpc),
+                'fcm': fcm.calls,
+            },
+            'stages': resumen['stages'],
+            'counters': resumen['counters'],
+        }
+
+
+def imprimir(res):
+    rpc = res['rpc']
+    gmail_total = sum(rpc['gmail'].values())
+    fs_total = sum(v for k, v in rpc['firestore'].items() if k != 'docs_read')
+    print(f"\n▶ {res['modo']} · {res['n']} correos: {res['segundos']:.2f} s "
+          f"({res['correos_s']} correos/s) · {res['transacciones']} transacciones")
+    print(f"  RPC → Gmail {gmail_total} {rpc['gmail']}")
+    print(f"        Gemini {rpc['gemini']} ({rpc['gemini_429']} con 429) · FCM {rpc['fcm']} · Firestore {fs_total} {rpc['firestore']}")
+    etapas = sorted(res['stages'].items(), key=lambda kv: kv[1]['total_ms'], reverse=True)
+    print(f"  {'etapa':<24} {'n':>6} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for stage, s in etapas[:TOP_STAGES]:
+        print(f"  {stage:<24} {s['n']:>6} {s['total_ms']:>10.1f} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline de sync")
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help="Cantidades de correos separadas por coma.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--llm-batch', type=int, default=1)
+    parser.add_argument('--gemini-rpm', type=int, default=6000,
+                        help="Cuota simulada de Gemini (--gemini-rpm del sync).")
+    parser.add_argument('--gemini-concurrency', type=int, default=4)
+    parser.add_argument('--gemini-errors', type=float, default=0.0,
+                        help="Fracción de llamadas a Gemini que fallan con 429 (se reintentan).")
+    parser.add_argument('--push-digest', action='store_true',
+                        help="Corre el sync con --push-digest (un solo push por corrida).")
+    parser.add_argument('--gmail-ms', type=float, default=20,
+                        help="Latencia simulada por request (o batch) de Gmail.")
+    parser.add_argument('--gemini-ms', type=float, default=150,
+                        help="Latencia simulada por llamada a Gemini.")
+    parser.add_argument('--firestore-ms', type=float, default=10,
+                        help="Latencia simulada por RPC de Firestore.")
+    parser.add_argument('--fcm-ms', type=float, default=30,
+                        help="Latencia simulada por envío de push.")
+    parser.add_argument('--json', metavar='ARCHIVO',
+                        help="Agrega los resultados como líneas JSON a ARCHIVO.")
+    args = parser.parse_args()
+
+    print(f"⚙️ workers={args.workers} llm-batch={args.llm_batch} · latencias (ms): Gmail {args.gmail_ms}, "
+          f"Gemini {args.gemini_ms}, Firestore {args.firestore_ms}, FCM {args.fcm_ms}")
+    argv_original = sys.argv
+    try:
+        for n in (int(x) for x in args.sizes.split(',') if x):
+            for res in escenarios(n, args):
+                imprimir(res)
+                if args.json:
+                    with open(args.json, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps({**res, 'workers': args.workers,
+                                            'llm_batch': args.llm_batch}, ensure_ascii=False) + '\n')
+    finally:
+        sys.argv = argv_original
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+"""
+Dobles en memoria de Gmail, Gemini, Firestore y FCM para los benchmarks.
+
+Implementan solo la parte de cada API que usa el pipeline
+(gmail_finanzas_sync.py, gmail_fetch.py, merchant_memory_store.py), con
+latencias configurables y contadores de RPC (`.rpc`), para medir el sync de
+punta a punta sin servicios de Google.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import operator
+import itertools
+import threading
+import types
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tx_templates import match_template  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Texto de la transacción en cada plantilla de `fixtures/` (se reemplaza por
+# montos y comercios variados al generar correos).
+_PLANTILLAS = {
+    'bancolombia_compra.html': "Bancolombia: Compraste $125.900,00 en RAPPI COLOMBIA*DL con tu T.Cred *7761",
+    'davivienda_pago.html': "Pagaste $89.950 a CLARO COLOMBIA desde tu Cuenta de Ahorros *5530",
+    'bancolombia_transferencia.html': "Bancolombia: Transferiste $444,000.00 desde tu cuenta 2823 a la cuenta *3114096566",
+}
+
+COMERCIOS = ['RAPPI COLOMBIA', 'UBER RIDES', 'EXITO CALLE 80', 'NETFLIX.COM', 'TERPEL LA 33',
+             'CLARO COLOMBIA', 'FARMATODO', 'CARULLA OVIEDO', 'CINE COLOMBIA', 'SPOTIFY']
+
+SETTINGS = {
+    'categories': [
+        {'name': 'Comida', 'subcategories': ['Domicilios/Rappi', 'Mercado', 'Restaurantes']},
+        {'name': 'Transporte', 'subcategories': ['Uber/Taxi', 'Gasolina']},
+        {'name': 'Servicios', 'subcategories': ['Celular', 'Streaming']},
+        {'name': 'Salud', 'subcategories': []},
+        {'name': 'Ocio', 'subcategories': []},
+        {'name': 'Otros', 'subcategories': []},
+    ],
+    'accounts': ['Visa', 'Ahorros', 'Davivienda'],
+    'currencies': ['COP', 'USD'],
+    'cardDigits': {'7761': 'Visa', '2823': 'Ahorros', '5530': 'Davivienda'},
+}
+
+_CATEGORIA = {
+    'RAPPI COLOMBIA': ('Comida', 'Domicilios/Rappi'), 'UBER RIDES': ('Transporte', 'Uber/Taxi'),
+    'EXITO CALLE 80': ('Comida', 'Mercado'), 'NETFLIX.COM': ('Servicios', 'Streaming'),
+    'TERPEL LA 33': ('Transporte', 'Gasolina'), 'CLARO COLOMBIA': ('Servicios', 'Celular'),
+    'FARMATODO': ('Salud', ''), 'CARULLA OVIEDO': ('Comida', 'Mercado'),
+    'CINE COLOMBIA': ('Ocio', ''), 'SPOTIFY': ('Servicios', 'Streaming'),
+}
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def make_emails(n, seed=7, statement_every=25):
+    """`n` correos de Gmail (format='full') generados desde las plantillas
+    HTML de `fixtures/`, con montos y comercios variados. Uno de cada
+    `statement_every` es un extracto (el sync lo descarta por asunto)."""
+    rnd = random.Random(seed)
+    htmls = {}
+    for name in _PLANTILLAS:
+        with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+            htmls[name] = f.read()
+
+    emails = {}
+    for i in range(n):
+        name = rnd.choice(list(_PLANTILLAS))
+        comercio = rnd.choice(COMERCIOS)
+        monto = f"${rnd.randint(5, 900)}.{rnd.randint(0, 999):03d},00"
+        original = _PLANTILLAS[name]
+        nuevo = re.sub(r"\$[\d.,]+", monto, original, count=1)
+        nuevo = nuevo.replace('RAPPI COLOMBIA*DL', comercio).replace('CLARO COLOMBIA', comercio)
+        html = htmls[name].replace(original, nuevo)
+        subject = 'Tu extracto mensual' if statement_every and i % statement_every == statement_every - 1 \
+            else 'Alertas y Notificaciones'
+        msg_id = f"msg{i:05d}"
+        emails[msg_id] = {
+            'id': msg_id,
+            'internalDate': str(1760000000000 + i * 60000),
+            'payload': {'mimeType': 'text/html',
+                        'headers': [{'name': 'Subject', 'value': subject}],
+                        'body': {'data': _b64(html)}},
+        }
+    return emails
+
+
+# --- Firestore ---
+
+class _Snapshot:
+    def __init__(self, doc_id, data, reference):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.reference = reference
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+def _merge(dst, src):
+    for key, value in src.items():
+        if isinstance(value, dict):
+            _merge(dst.setdefault(key, {}), value)
+        elif type(value).__name__ == 'Increment':
+            dst[key] = dst.get(key, 0) + value.value
+        elif type(value).__name__ == 'Sentinel' and 'delete' in repr(value).lower():
+            dst.pop(key, None)
+        else:
+            dst[key] = value
+
+
+class _DocRef:
+    def __init__(self, db, path, doc_id):
+        self._db, self._path, self.id = db, path, doc_id
+
+    def _store(self):
+        return self._db.data.setdefault(self._path, {})
+
+    def get(self):
+        self._db._rpc('get', reads=1)
+        return _Snapshot(self.id, self._store().get(self.id), self)
+
+    def set(self, data, merge=False):
+        self._db._rpc('set')
+        self._db._apply('set', self, data, merge)
+
+    def update(self, data):
+        self._db._rpc('update')
+        self._store()[self.id].update(data)
+
+    def delete(self):
+        self._db._rpc('delete')
+        self._store().pop(self.id, None)
+
+    def collection(self, name):
+        return _Query(self._db, f"{self._path}/{self.id}/{name}")
+
+
+_OPS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+        '>': operator.gt, '>=': operator.ge}
+
+
+class _Query:
+    def __init__(self, db, path, order=None, limit=None, filters=(), after=None, fields=None):
+        self._db, self._path, self._order, self._limit = db, path, order, limit
+        self._filters, self._after, self._fields = filters, after, fields
+
+    def _with(self, **kwargs):
+        args = dict(order=self._order, limit=self._limit, filters=self._filters,
+                    after=self._after, fields=self._fields)
+        args.update(kwargs)
+        return _Query(self._db, self._path, **args)
+
+    def document(self, doc_id=None):
+        return _DocRef(self._db, self._path, doc_id or f"auto{next(self._db._ids):06d}")
+
+    def add(self, data):
+        ref = self.document()
+        self._db._rpc('add')
+        self._db._apply('set', ref, data, False)
+        return None, ref
+
+    def where(self, field, op, value):
+        return self._with(filters=self._filters + ((field, _OPS[op], value),))
+
+    def order_by(self, field, direction=None):
+        return self._with(order=(field, direction))
+
+    def limit(self, n):
+        return self._with(limit=n)
+
+    def start_after(self, cursor):
+        """Solo cursores por ID (`{'__name__': ref}`), como los de bulk_ops."""
+        return self._with(after=cursor['__name__'].id)
+
+    def select(self, fields):
+        # Como Firestore: una proyección vacía trae todos los campos.
+        return self._with(fields=list(fields) or None)
+
+    def stream(self):
+        items = [(k, v) for k, v in self._db.data.get(self._path, {}).items()
+                 if all(f in v and op(v[f], value) for f, op, value in self._filters)]
+        if self._order:
+            field, direction = self._order
+            key = (lambda kv: kv[0]) if field == '__name__' else (lambda kv: str(kv[1].get(field)))
+            items.sort(key=key, reverse=direction == 'DESCENDING')
+        if self._after is not None:
+            items = [(k, v) for k, v in items if k > self._after]
+        if self._limit:
+            items = items[:self._limit]
+        if self._fields is not None:
+            items = [(k, {f: v[f] for f in self._fields if f in v}) for k, v in items]
+        self._db._rpc('query', reads=len(items))
+        return [_Snapshot(k, v, self.document(k)) for k, v in items]
+
+    get = stream
+
+
+class _Batch:
+    def __init__(self, db):
+        self._db, self._ops = db, []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(('set', ref, data, merge))
+
+    def update(self, ref, data):
+        self._ops.append(('update', ref, data, False))
+
+    def delete(self, ref):
+        self._ops.append(('delete', ref, None, False))
+
+    def commit(self):
+        self._db._rpc('commit', latency=True)
+        for op in self._ops:
+            self._db._apply(*op)
+
+
+class FakeFirestore:
+    """Cliente de Firestore en memoria (`data[colección][doc] = dict`)."""
+
+    def __init__(self, latency=0.0, settings=SETTINGS):
+        self.data = {'finance_settings': {'default': dict(settings)}}
+        self.latency = latency
+        self.rpc = Counter()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _rpc(self, name, reads=0, latency=True):
+        with self._lock:
+            self.rpc[name] += 1
+            self.rpc['docs_read'] += reads
+        if latency and self.latency:
+            time.sleep(self.latency)
+
+    def _apply(self, op, ref, data, merge):
+        store = ref._store()
+        if op == 'set':
+            if merge:
+                _merge(store.setdefault(ref.id, {}), data)
+            else:
+                store[ref.id] = dict(data)
+        elif op == 'update':
+            store[ref.id].update(data)
+        else:
+            store.pop(ref.id, None)
+
+    def collection(self, name):
+        return _Query(self, name)
+
+    def get_all(self, refs):
+        refs = list(refs)
+        self._rpc('get_all', reads=len(refs))
+        return [_Snapshot(r.id, r._store().get(r.id), r) for r in refs]
+
+    def batch(self):
+        return _Batch(self)
+
+
+# --- Gmail ---
+
+class _Request:
+    def __init__(self, fn, latency=0.0):
+        self._fn, self._latency = fn, latency
+
+    def execute(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._fn()
+
+
+class FakeGmail:
+    """`service` de Gmail en memoria: etiquetas, list/get/batchModify,
+    requests batch e historial."""
+
+    LABEL_ID = 'Label_1'
+
+    def __init__(self, emails, label='Bancos/PendingBot', latency=0.0):
+        self.emails = emails
+        self.label = label
+        self.labelled = set(emails)
+        self.latency = latency
+        self.history_id = 1000
+        self.rpc = Counter()
+        self._lock = threading.Lock()
+
+    def _rpc(self, name):
+        with self._lock:
+            self.rpc[name] += 1
+
+    def users(self):
+        return self
+
+    def labels(self):
+        gmail = self
+
+        class _Labels:
+            def list(self, userId):
+                gmail._rpc('labels.list')
+                return _Request(lambda: {'labels': [{'id': gmail.LABEL_ID, 'name': gmail.label}]})
+        return _Labels()
+
+    def getProfile(self, userId):
+        self._rpc('getProfile')
+        return _Request(lambda: {'historyId': str(self.history_id)})
+
+    def history(self):
+        gmail = self
+
+        class _History:
+            def list(self, userId, startHistoryId, **kwargs):
+                gmail._rpc('history.list')
+                return _Request(lambda: {'historyId': str(gmail.history_id)})
+        return _History()
+
+    def messages(self):
+        gmail = self
+
+        class _Messages:
+            def list(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+                gmail._rpc('messages.list')
+                ids = sorted(gmail.labelled, reverse=True)
+                start = int(pageToken or 0)
+                page = ids[start:start + maxResults]
+                out = {'messages': [{'id': i} for i in page]} if page else {}
+                if start + len(page) < len(ids):
+                    out['nextPageToken'] = str(start + len(page))
+                return _Request(lambda: out)
+
+            def get(self, userId, id, format='full', **kwargs):
+                gmail._rpc('messages.get')
+
+                def _get():
+                    msg = gmail.emails[id]
+                    labels = [gmail.LABEL_ID] if id in gmail.labelled else []
+                    if format == 'metadata':
+                        return {'id': id, 'labelIds': labels,
+                                'payload': {'headers': msg['payload'].get('headers', [])}}
+                    return {**msg, 'labelIds': labels}
+                return _Request(_get, gmail.latency)
+
+            def batchModify(self, userId, body):
+                gmail._rpc('messages.batchModify')
+
+                def _modify():
+                    for msg_id in body.get('ids', []):
+                        gmail.labelled.discard(msg_id)
+                    return {}
+                return _Request(_modify)
+        return _Messages()
+
+    def new_batch_http_request(self, callback):
+        gmail = self
+
+        class _Batch:
+            def __init__(self):
+                self._reqs = []
+
+            def add(self, request, request_id):
+                self._reqs.append((request_id, request))
+
+            def execute(self):
+                gmail._rpc('batch')
+                if gmail.latency:
+                    time.sleep(gmail.latency)
+                for request_id, request in self._reqs:
+                    try:
+                        callback(request_id, request._fn(), None)
+                    except Exception as e:
+                        callback(request_id, None, e)
+        return _Batch()
+
+
+# --- Gemini ---
+
+def _respuesta(texto):
+    """JSON "enlatado" para el texto de un correo (a partir de las plantillas)."""
+    name, fields = match_template(texto)
+    if not name:
+        return {'type': 'ignore'}
+    comercio = fields['merchant'].strip()
+    categoria, sub = _CATEGORIA.get(comercio, ('Otros', ''))
+    return {'type': fields['type'], 'amount': fields['amount'], 'title': comercio,
+            'currency': 'COP', 'category': categoria, 'subcategory': sub,
+            'card': SETTINGS['cardDigits'].get(fields['card'], 'Visa'),
+            'context': 'personal', 'comments': fields.get('comments', '')}
+
+
+class QuotaExceeded(Exception):
+    """Error 429 simulado (como `google.genai.errors.ClientError`)."""
+    code = 429
+
+
+class FakeGenai:
+    """`genai.Client` con `models.generate_content` (y su versión `aio`) de
+    latencia fija y respuestas deterministas, también para prompts de varios
+    correos. Con `error_rate` una fracción de las llamadas falla con 429."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=7):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self.prompt_chars = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.models = types.SimpleNamespace(generate_content=self._generate_content)
+        self.aio = types.SimpleNamespace(models=types.SimpleNamespace(generate_content=self._agenerate_content))
+
+    def _registrar(self, contents):
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(contents)
+            if self.error_rate and self._rnd.random() < self.error_rate:
+                self.errors += 1
+                raise QuotaExceeded('429 RESOURCE_EXHAUSTED (simulado)')
+
+    def _generate_content(self, model, contents, config=None):
+        self._registrar(contents)
+        if self.latency:
+            time.sleep(self.latency)
+        return self._responder(contents)
+
+    async def _agenerate_content(self, model, contents, config=None):
+        self._registrar(contents)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._responder(contents)
+
+    def _responder(self, contents):
+        correos = re.findall(r'<correo id="([^"]+)">\n(.*?)\n</correo>', contents, re.S)
+        if correos:
+            data = [{'id': msg_id, **_respuesta(texto)} for msg_id, texto in correos]
+        else:
+            m = re.search(r'Texto del correo:\n"(.*)"\n', contents, re.S)
+            data = _respuesta(m.group(1) if m else contents)
+        usage = types.SimpleNamespace(prompt_token_count=(len(contents) + 3) // 4)
+        return types.SimpleNamespace(text=json.dumps(data, ensure_ascii=False), usage_metadata=usage)
+
+
+# --- FCM ---
+
+class FakeMessaging:
+    """Sustituto de `firebase_admin.messaging` (lo que usa push_notify). Los
+    tokens de `invalid` fallan como no registrados; `sent` guarda los
+    mensajes enviados."""
+
+    class UnregisteredError(Exception):
+        pass
+
+    def __init__(self, latency=0.0, invalid=()):
+        self.latency = latency
+        self.invalid = set(invalid)
+        self.calls = 0
+        self.sent = []
+
+    @staticmethod
+    def MulticastMessage(tokens, data, webpush=None):
+        return types.SimpleNamespace(tokens=tokens, data=data, webpush=webpush)
+
+    @staticmethod
+    def WebpushConfig(headers=None):
+        return types.SimpleNamespace(headers=headers)
+
+    def send_each_for_multicast(self, message):
+        self.calls += 1
+        self.sent.append(message)
+        if self.latency:
+            time.sleep(self.latency)
+        responses = [types.SimpleNamespace(success=True, exception=None) if t not in self.invalid
+                     else types.SimpleNamespace(success=False, exception=self.UnregisteredError(t))
+                     for t in message.tokens]
+        ok = sum(r.success for r in responses)
+        return types.SimpleNamespace(success_count=ok, failure_count=len(responses) - ok,
+                                     responses=responses)
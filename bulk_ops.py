@@ -0,0 +1,267 @@
+"""
+Operaciones masivas sobre Firestore: borrar, actualizar o copiar los
+documentos de una colección (opcionalmente filtrados), sin un round trip
+por documento.
+
+- Lee con cursores (`order_by(__name__)` + `start_after`) en páginas de
+  `page_size`, sin abrir un stream de minutos sobre toda la colección. Un
+  filtro de desigualdad (!=, <, <=, >, >=) junto con ese orden necesita un
+  índice compuesto (campo, __name__); si no existe, Firestore rechaza la
+  consulta y la operación se corta con un ValueError que lo explica (el
+  error de Firestore trae el enlace para crearlo). Los filtros == no lo
+  necesitan.
+- Escribe con `BulkWriter` (paralelo, con rampa de tráfico y reintentos de
+  los errores transitorios);
+  si el cliente no lo tiene, cae a WriteBatch de 500 operaciones.
+- `dry_run` solo cuenta lo que haría.
+- Con `checkpoint` (un archivo JSON) guarda el último documento terminado
+  tras cada página; si la operación se corta, la siguiente corrida con el
+  mismo archivo sigue desde ahí (solo si es la misma operación: colección,
+  filtros, campos y destino). Al terminar, el archivo se borra.
+
+Uso como módulo (ver clear_firebase_test_data.py, run_updates.py y
+send_test_push.py) o como CLI:
+    python3 bulk_ops.py delete finance_transactions --where 'title==🧪 PRUEBA PUSH' --dry-run
+    python3 bulk_ops.py update finance_transactions --where 'category==Compras' --set '{"category": "Hogar"}'
+    python3 bulk_ops.py copy finance_transactions finance_transactions_backup --resume copia.json
+"""
+
+import os
+import json
+import argparse
+
+from google.api_core.exceptions import FailedPrecondition, InvalidArgument
+from google.rpc import code_pb2
+
+from utils import conectar_db
+
+PAGE_SIZE = 500
+FIRESTORE_BATCH_LIMIT = 500
+# Intentos por escritura antes de darla por fallida (BulkWriter).
+MAX_ATTEMPTS = 5
+# Errores transitorios: solo esos se reintentan (un INVALID_ARGUMENT o
+# PERMISSION_DENIED falla igual en el siguiente intento).
+RETRYABLE_CODES = frozenset({code_pb2.ABORTED, code_pb2.UNAVAILABLE,
+                             code_pb2.RESOURCE_EXHAUSTED, code_pb2.DEADLINE_EXCEEDED})
+
+# Operadores aceptados en --where, del más largo al más corto.
+_OPERATORS = ('==', '!=', '<=', '>=', '<', '>')
+
+
+class _Writer:
+    """BulkWriter del cliente o, si no existe, WriteBatch por tandas."""
+
+    def __init__(self, db):
+        self.db = db
+        self.fallidos = 0
+        self._bulk = db.bulk_writer() if hasattr(db, 'bulk_writer') else None
+        if self._bulk is not None:
+            self._bulk.on_write_error(self._on_error)
+        self._ops = []
+
+    def _on_error(self, error, writer):
+        if error.code in RETRYABLE_CODES and error.attempts < MAX_ATTEMPTS:
+            return True
+        self.fallidos += 1
+        print(f"⚠️ No se pudo escribir {error.operation.reference.id}: {error.message}")
+        return False
+
+    def _add(self, op, ref, data=None):
+        if self._bulk is not None:
+            if op == 'delete':
+                self._bulk.delete(ref)
+            else:
+                getattr(self._bulk, op)(ref, data)
+            return
+        self._ops.append((op, ref, data))
+        if len(self._ops) >= FIRESTORE_BATCH_LIMIT:
+            self.flush()
+
+    def delete(self, ref):
+        self._add('delete', ref)
+
+    def update(self, ref, data):
+        self._add('update', ref, data)
+
+    def set(self, ref, data):
+        self._add('set', ref, data)
+
+    def flush(self):
+        """Espera a que todo lo encolado quede escrito."""
+        if self._bulk is not None:
+            self._bulk.flush()
+            return
+        if not self._ops:
+            return
+        batch = self.db.batch()
+        for op, ref, data in self._ops:
+            if op == 'delete':
+                batch.delete(ref)
+            else:
+                getattr(batch, op)(ref, data)
+        self._ops = []
+        batch.commit()
+
+    def close(self):
+        self.flush()
+        if self._bulk is not None:
+            self._bulk.close()
+
+
+def parse_where(expr):
+    """'campo==valor' → ('campo', '==', valor). El valor se lee como JSON si
+    se puede (números, true/false, null, listas) y si no como texto."""
+    for op in _OPERATORS:
+        if op in expr:
+            field, raw = expr.split(op, 1)
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                value = raw
+            return field.strip(), op, value
+    raise ValueError(f"Filtro inválido (use campo==valor, !=, <, <=, >, >=): {expr!r}")
+
+
+def _load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def iter_pages(db, collection, where=(), page_size=PAGE_SIZE, start_after=None, fields=None):
+    """Páginas de snapshots de `collection` en orden de ID, con cursor.
+
+    `where` es una lista de `(campo, op, valor)`; `start_after`, el ID del
+    último documento ya visto; `fields` limita los campos leídos. Lanza
+    ValueError si Firestore rechaza el orden por ID con un filtro de
+    desigualdad (falta el índice compuesto)."""
+    col = db.collection(collection)
+    query = col
+    for field, op, value in where:
+        query = query.where(field, op, value)
+    if fields is not None:
+        query = query.select(fields)
+    query = query.order_by('__name__').limit(page_size)
+    cursor = col.document(start_after) if start_after else None
+    while True:
+        try:
+            page = list((query.start_after({'__name__': cursor}) if cursor else query).stream())
+        except (FailedPrecondition, InvalidArgument) as e:
+            campos = sorted({field for field, op, _ in where if op != '=='})
+            if not campos:
+                raise
+            raise ValueError(f"Firestore rechazó el filtro sobre {', '.join(campos)} ordenado por ID: "
+                             f"hace falta un índice compuesto ({', '.join(campos)}, __name__) "
+                             f"en '{collection}'. {e.message}") from e
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1].reference
+
+
+def run(db, op, collection, where=(), data=None, dest=None, dry_run=False, checkpoint=None,
+        page_size=PAGE_SIZE):
+    """Aplica `op` ('delete', 'update' o 'copy') a los documentos de
+    `collection` que cumplen `where`. `data` son los campos de 'update';
+    `dest` la colección destino de 'copy'. Devuelve cuántos documentos tocó
+    (o tocaría, con `dry_run`)."""
+    if op not in ('delete', 'update', 'copy'):
+        raise ValueError(f"Operación desconocida: {op}")
+    if op == 'update' and not data:
+        raise ValueError("'update' necesita los campos a escribir")
+    if op == 'copy' and not dest:
+        raise ValueError("'copy' necesita la colección destino")
+
+    # Lo que define la operación: un checkpoint de otra no sirve (con otro
+    # filtro o destino, retomar desde su último ID saltaría documentos).
+    params = {'op': op, 'collection': collection, 'where': [list(w) for w in where],
+              'data': data, 'dest': dest}
+    state = _load_checkpoint(checkpoint)
+    if state and {k: state.get(k) for k in params} != params:
+        raise ValueError(f"El checkpoint {checkpoint} es de otra operación: {state}")
+    done = state.get('done', 0)
+    if state:
+        print(f"↪️ Retomando desde {state['last_id']} ({done} documento(s) ya procesados).")
+
+    verbo = {'delete': 'borrarían', 'update': 'actualizarían', 'copy': 'copiarían'}[op] if dry_run \
+        else {'delete': 'borrados', 'update': 'actualizados', 'copy': 'copiados'}[op]
+    writer = None if dry_run else _Writer(db)
+    # Para borrar o actualizar basta el ID: no se bajan los campos (una
+    # proyección vacía trae el documento completo; `__name__` solo el ID).
+    fields = ['__name__'] if op != 'copy' else None
+    try:
+        for page in iter_pages(db, collection, where, page_size, state.get('last_id'), fields):
+            if writer is not None:
+                for snap in page:
+                    if op == 'delete':
+                        writer.delete(snap.reference)
+                    elif op == 'update':
+                        writer.update(snap.reference, data)
+                    else:
+                        writer.set(db.collection(dest).document(snap.id), snap.to_dict())
+                writer.flush()
+            done += len(page)
+            print(f"   … {done} documento(s) {verbo}")
+            if checkpoint and not dry_run:
+                _save_checkpoint(checkpoint, {**params, 'last_id': page[-1].id, 'done': done})
+    finally:
+        if writer is not None:
+            writer.close()
+    if checkpoint and not dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    if writer is not None and writer.fallidos:
+        print(f"⚠️ {writer.fallidos} escritura(s) fallaron.")
+    return done
+
+
+def update_ids(db, collection, updates, dry_run=False):
+    """Actualiza documentos por ID: `updates` es `{id: campos}`."""
+    if dry_run:
+        for doc_id, data in updates.items():
+            print(f"🧪 {collection}/{doc_id} → {data}")
+        return len(updates)
+    writer = _Writer(db)
+    try:
+        for doc_id, data in updates.items():
+            writer.update(db.collection(collection).document(doc_id), data)
+    finally:
+        writer.close()
+    return len(updates) - writer.fallidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Operaciones masivas sobre Firestore")
+    parser.add_argument('op', choices=['delete', 'update', 'copy'])
+    parser.add_argument('collection')
+    parser.add_argument('dest', nargs='?', help="Colección destino (solo para copy).")
+    parser.add_argument('--where', action='append', default=[], metavar='CAMPO==VALOR',
+                        help="Filtro (repetible): ==, !=, <, <=, >, >=. El valor se lee como JSON si se puede.")
+    parser.add_argument('--set', dest='data', metavar='JSON',
+                        help="Campos a escribir con update, como objeto JSON.")
+    parser.add_argument('--dry-run', action='store_true', help="Solo cuenta los documentos afectados.")
+    parser.add_argument('--resume', metavar='ARCHIVO',
+                        help="Checkpoint para retomar la operación si se corta.")
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    args = parser.parse_args()
+
+    where = [parse_where(w) for w in args.where]
+    data = json.loads(args.data) if args.data else None
+    db = conectar_db()
+    n = run(db, args.op, args.collection, where, data=data, dest=args.dest,
+            dry_run=args.dry_run, checkpoint=args.resume, page_size=args.page_size)
+    prefijo = "🧪 DRY-RUN: " if args.dry_run else "✅ "
+    print(f"{prefijo}{n} documento(s) de '{args.collection}' ({args.op}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,19 @@
+import sys
+
 from utils import conectar_db
+from bulk_ops import run
 
 def clean_db():
     print("Conectando a Firebase...")
     db = conectar_db()
 
-    print("Borrando todas las transacciones...")
-    docs = db.collection('finance_transactions').stream()
-    deleted = 0
-    for doc in docs:
-        doc.reference.delete()
-        deleted += 1
-    print(f"✅ Se borraron {deleted} transacciones de prueba.")
+    dry_run = '--dry-run' in sys.argv
+    print("Borrando todas las transacciones..." + (" (DRY-RUN)" if dry_run else ""))
+    deleted = run(db, 'delete', 'finance_transactions', dry_run=dry_run)
+    if dry_run:
+        print(f"🧪 Se borrarían {deleted} transacciones de prueba.")
+    else:
+        print(f"✅ Se borraron {deleted} transacciones de prueba.")
 
 if __name__ == '__main__':
     clean_db()
@@ -0,0 +1,156 @@
+"""
+Texto legible de un correo de Gmail (payload de `messages().get(format='full')`).
+
+Lo usan el sync (gmail_finanzas_sync.py) y los scripts de reportes. Solo
+stdlib:
+
+- Recorre el árbol MIME una vez y decodifica cada parte como mucho una vez,
+  con el charset que declara su cabecera.
+- Si el correo trae `text/plain`, usa solo eso y no toca el HTML.
+- Si solo hay HTML, lo convierte con un `HTMLParser` que descarta
+  <head>/<style>/<script> y corta en saltos de línea los bloques (p, div, tr,
+  br...). No arma un árbol como BeautifulSoup.
+- Con `max_chars` deja de leer en cuanto tiene texto suficiente.
+"""
+
+import re
+import base64
+import binascii
+from html.parser import HTMLParser
+
+# Etiquetas cuyo contenido no es texto del correo.
+_SKIP_TAGS = frozenset({'head', 'style', 'script', 'title', 'noscript', 'template'})
+
+# Etiquetas que separan bloques de texto (se traducen a salto de línea).
+_BLOCK_TAGS = frozenset({
+    'br', 'p', 'div', 'tr', 'td', 'th', 'li', 'table', 'tbody', 'thead', 'tfoot',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'section', 'article', 'header',
+    'footer', 'center', 'blockquote', 'ul', 'ol',
+})
+
+# Tamaño de los trozos de HTML que se le pasan al parser entre chequeos de
+# `max_chars`.
+_FEED_CHUNK = 8192
+
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)', re.IGNORECASE)
+_SPACES_RE = re.compile(r'[^\S\n]+')
+_BLANKS_RE = re.compile(r'\n\s*\n+')
+
+
+class _TextExtractor(HTMLParser):
+    """Conversor HTML → texto en streaming."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.size = 0
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.chunks.append(data)
+            self.size += len(data)
+
+
+def html_to_text(html, max_chars=None):
+    """Texto de un documento HTML (líneas sin espacios sobrantes)."""
+    parser = _TextExtractor()
+    for i in range(0, len(html), _FEED_CHUNK):
+        parser.feed(html[i:i + _FEED_CHUNK])
+        if max_chars and parser.size >= max_chars * 2:
+            break
+    else:
+        parser.close()
+    return _clean(''.join(parser.chunks))
+
+
+def _clean(text):
+    """Colapsa espacios dentro de cada línea y las líneas vacías seguidas."""
+    text = _SPACES_RE.sub(' ', text)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    return _BLANKS_RE.sub('\n', text).strip()
+
+
+def _charset(part):
+    for header in part.get('headers', []):
+        if header.get('name', '').lower() == 'content-type':
+            m = _CHARSET_RE.search(header.get('value', ''))
+            if m:
+                return m.group(1)
+    return 'utf-8'
+
+
+def decode_part(part):
+    """Cuerpo decodificado de una parte MIME ('' si no trae datos)."""
+    data = part.get('body', {}).get('data')
+    if not data:
+        return ''
+    try:
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        return ''
+    try:
+        return raw.decode(_charset(part), 'replace')
+    except LookupError:
+        return raw.decode('utf-8', 'replace')
+
+
+def _leaf_parts(payload):
+    """Partes hoja del árbol MIME, en orden (sin recursión)."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def email_text(payload, max_chars=None):
+    """Texto del cuerpo del correo.
+
+    Prefiere las partes `text/plain`; si no hay, convierte las `text/html`.
+    Con `max_chars` se detiene en cuanto junta esa cantidad de caracteres (el
+    resultado puede pasarse un poco: el llamador trunca).
+    """
+    plain, html = [], []
+    for part in _leaf_parts(payload):
+        mime = part.get('mimeType', '')
+        if 'html' in mime:
+            html.append(part)
+        elif mime.startswith('text/') or not mime:
+            plain.append(part)
+
+    text = _join((_clean(decode_part(p)) for p in plain), max_chars)
+    if not text:
+        text = _join((html_to_text(decode_part(p), max_chars) for p in html), max_chars)
+    return text
+
+
+def _join(textos, max_chars):
+    """Une los textos no vacíos, dejando de consumir al llegar a `max_chars`."""
+    out, total = [], 0
+    for text in textos:
+        if text:
+            out.append(text)
+            total += len(text)
+            if max_chars and total >= max_chars:
+                break
+    return '\n'.join(out)
@@ -0,0 +1,236 @@
+"""
+Copia local en Parquet de `finance_transactions`, particionada por mes, para
+analizar el historial sin leer Firestore documento por documento.
+
+    .cache/finance_transactions/
+        month=2026-09/part.parquet
+        month=2026-10/part.parquet
+        _state.json      ← marca de agua + índice {id: mes}
+
+- Incremental: cada corrida pide solo los documentos con `timestamp` mayor
+  que la marca de la corrida anterior (menos `OVERLAP`, por transacciones que
+  llegan tarde), y reescribe solo los meses tocados. Si un documento cambió
+  de mes, se saca de la partición vieja (para eso está el índice).
+- `timestamp` es el momento de la transacción, no de la última edición: las
+  ediciones y los borrados hechos desde la app solo se recogen con `--full`,
+  que reescribe todo (y es lo que hace la primera corrida).
+- Cada fila sale normalizada (`normalize_tx`): esquema fijo, `category`
+  siempre texto (a veces viene como objeto `{name: ...}`, lo mismo que
+  resuelve `normalizeCategory` en el frontend) y `amount` numérico.
+
+Requiere pyarrow (solo este módulo; se importa al escribir o leer). Correr con:
+    python3 finance_export.py            # incremental
+    python3 finance_export.py --full     # todo de nuevo
+
+Para leerlo: `load()` devuelve una tabla de Arrow (`.to_pandas()`,
+`.to_pylist()`, o directo con DuckDB/Polars sobre la carpeta).
+"""
+
+import os
+import json
+import argparse
+import datetime
+from collections import defaultdict
+
+from utils import conectar_db
+from finance_rollups import month_of
+from bulk_ops import iter_pages
+from tx_enrich import normalize_category
+
+DEFAULT_DIR = os.path.join('.cache', 'finance_transactions')
+STATE_FILE = '_state.json'
+PART_FILE = 'part.parquet'
+NO_MONTH = 'sin-fecha'
+# Cambia si cambia el esquema o la normalización: obliga a una corrida completa.
+SCHEMA_VERSION = 1
+# Margen hacia atrás sobre la marca de agua.
+OVERLAP = datetime.timedelta(days=3)
+
+# Columnas de texto, en orden, con su valor por defecto.
+TEXT_FIELDS = {
+    'date': '', 'type': 'debit', 'currency': 'COP', 'title': '', 'category': 'general',
+    'subcategory': '', 'card': '', 'context': 'personal', 'status': '', 'comments': '',
+    'destinationContext': '', 'destinationCard': '',
+}
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("❌ Error: La librería 'pyarrow' no está instalada. Ejecuta: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa):
+    return pa.schema(
+        [('id', pa.string()), ('month', pa.string())]
+        + [(name, pa.string()) for name in TEXT_FIELDS]
+        + [('amount', pa.float64()), ('timestamp', pa.timestamp('us', tz='UTC'))]
+    )
+
+
+def _to_utc(value):
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def normalize_tx(doc_id, tx):
+    """Fila con el esquema fijo de la exportación."""
+    row = {'id': doc_id, 'month': month_of(tx) or NO_MONTH}
+    for name, default in TEXT_FIELDS.items():
+        value = tx.get(name)
+        row[name] = default if value is None or value == '' else str(value)
+    row['category'] = normalize_category(tx.get('category'))
+    try:
+        row['amount'] = float(tx.get('amount') or 0)
+    except (TypeError, ValueError):
+        row['amount'] = None
+    row['timestamp'] = _to_utc(tx.get('timestamp'))
+    return row
+
+
+def plan_changes(index, rows):
+    """Agrupa `rows` por mes y detecta las que cambiaron de mes.
+
+    `index` es `{id: mes}` de la copia actual (se actualiza). Devuelve
+    `(upserts {mes: {id: fila}}, removals {mes: {ids}})`."""
+    upserts, removals = defaultdict(dict), defaultdict(set)
+    for row in rows:
+        previous = index.get(row['id'])
+        if previous is not None and previous != row['month']:
+            removals[previous].add(row['id'])
+        upserts[row['month']][row['id']] = row
+        index[row['id']] = row['month']
+    return dict(upserts), dict(removals)
+
+
+def _sort_key(row):
+    ts = row['timestamp']
+    return (row['date'], ts.isoformat() if ts else '', row['id'])
+
+
+class Snapshot:
+    """La carpeta de la exportación: partición por mes + `_state.json`."""
+
+    def __init__(self, path=DEFAULT_DIR):
+        self.path = path
+        self.state = {'version': SCHEMA_VERSION, 'high_water': None, 'index': {}}
+        state_path = os.path.join(path, STATE_FILE)
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == SCHEMA_VERSION:
+                self.state = state
+
+    @property
+    def high_water(self):
+        hw = self.state['high_water']
+        return datetime.datetime.fromisoformat(hw) if hw else None
+
+    def _part(self, month):
+        return os.path.join(self.path, f"month={month}", PART_FILE)
+
+    def months(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(d[len('month='):] for d in os.listdir(self.path)
+                      if d.startswith('month=') and os.path.exists(os.path.join(self.path, d, PART_FILE)))
+
+    def read_month(self, month):
+        path = self._part(month)
+        if not os.path.exists(path):
+            return {}
+        _, pq = _arrow()
+        return {row['id']: row for row in pq.read_table(path).to_pylist()}
+
+    def write_month(self, month, rows):
+        """Reescribe la partición (o la borra si queda vacía), de forma atómica."""
+        path = self._part(month)
+        if not rows:
+            if os.path.exists(path):
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            return
+        pa, pq = _arrow()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pylist(sorted(rows.values(), key=_sort_key), schema=_schema(pa))
+        tmp = f"{path}.tmp"
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, path)
+
+    def save_state(self, high_water):
+        self.state['high_water'] = high_water.isoformat() if high_water else None
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, STATE_FILE)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(f"{path}.tmp", path)
+
+
+def _max_ts(rows, start=None):
+    stamps = [r['timestamp'] for r in rows if r['timestamp']] + ([start] if start else [])
+    return max(stamps, default=None)
+
+
+def export(db, path=DEFAULT_DIR, full=False):
+    """Trae a la copia local los documentos nuevos (o todos, con `full`).
+    Devuelve `(documentos leídos, meses reescritos)`."""
+    snap = Snapshot(path)
+    high_water = snap.high_water
+    full = full or high_water is None
+
+    if full:
+        rows = [normalize_tx(d.id, d.to_dict())
+                for page in iter_pages(db, 'finance_transactions') for d in page]
+        by_month = defaultdict(dict)
+        for row in rows:
+            by_month[row['month']][row['id']] = row
+        for month in set(snap.months()) - set(by_month):
+            snap.write_month(month, {})
+        for month, month_rows in by_month.items():
+            snap.write_month(month, month_rows)
+        snap.state['index'] = {row['id']: row['month'] for row in rows}
+        snap.save_state(_max_ts(rows))
+        return len(rows), len(by_month)
+
+    query = db.collection('finance_transactions').where('timestamp', '>', high_water - OVERLAP)
+    rows = [normalize_tx(d.id, d.to_dict()) for d in query.stream()]
+    upserts, removals = plan_changes(snap.state['index'], rows)
+    for month in sorted(set(upserts) | set(removals)):
+        month_rows = snap.read_month(month)
+        for doc_id in removals.get(month, ()):
+            month_rows.pop(doc_id, None)
+        month_rows.update(upserts.get(month, {}))
+        snap.write_month(month, month_rows)
+    snap.save_state(_max_ts(rows, high_water))
+    return len(rows), len(set(upserts) | set(removals))
+
+
+def load(path=DEFAULT_DIR, months=None):
+    """Tabla de Arrow con las transacciones de `months` (o de todos los meses)."""
+    pa, pq = _arrow()
+    snap = Snapshot(path)
+    wanted = snap.months() if months is None else [m for m in months if m in snap.months()]
+    tables = [pq.read_table(snap._part(m)) for m in wanted]
+    return pa.concat_tables(tables) if tables else _schema(pa).empty_table()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta finance_transactions a Parquet (por mes)")
+    parser.add_argument('--full', action='store_true',
+                        help="Reescribe todo (recoge ediciones y borrados hechos desde la app).")
+    parser.add_argument('--out', default=DEFAULT_DIR, help=f"Carpeta de salida (por defecto {DEFAULT_DIR}).")
+    args = parser.parse_args()
+
+    db = conectar_db()
+    n_docs, n_months = export(db, args.out, full=args.full)
+    print(f"✅ Exportación lista: {n_docs} documentos leídos, {n_months} meses reescritos en {args.out}.")
+
+
+if __name__ == '__main__':
+    main()
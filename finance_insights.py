@@ -0,0 +1,306 @@
+"""
+Métricas de la pantalla de Insights precalculadas en Firestore
+(`finance_insights/latest`), para que la app no recorra todas las
+transacciones en cada render.
+
+Las transacciones de la ventana (mes actual + `WINDOW_MONTHS - 1` anteriores)
+se cargan en columnas de NumPy (monto en COP, día, mes, tipo, contexto,
+categoría, moneda) y cada métrica sale de una suma agrupada (`np.bincount`
+sobre una clave grupo × índice) en vez de un bucle por transacción. Los
+grupos son los contextos de la app: 'personal', 'business' y 'unified'
+(todo); una transferencia cuenta en su contexto y en el de destino, como
+en Insights.jsx.
+
+    {
+      "today": "2026-10-17", "exchangeRate": 4100, "windowStart": "2026-04-01",
+      "contexts": {
+        "unified": {
+          "month": {"spent", "income", "savings", "prevSavings", "spentDelta", "incomeDelta"},
+          "burnRate": gasto mensual promedio de los `BURN_MONTHS` meses cerrados,
+          "cashflow": [{"month": "2026-05", "income", "expenses"}, ...],
+          "currencyExposure": {"COP": %, "USD": %},   ← del volumen movido en la ventana
+          "daily": [30 montos, el último es hoy], "todayTotal", "todayCount", "dailyAvg",
+          "categories": [{"name", "amount", "pct"}, ...],   ← gasto del mes
+          "topFugas": [{"name", "amount", "prevAmount", "trend"}, ...],
+          "biggest": {"title", "amount", "date"} | None,    ← últimos 30 días
+          "streak": días seguidos con al menos un movimiento
+        },
+        "personal": {...}, "business": {...}
+      }
+    }
+
+Los montos van en COP (USD × `EXCHANGE_RATE`, la misma tasa fija de la
+app). Lo recalcula solo el workflow diario (merchant_memory.yml): el sync
+no, porque releería la ventana completa cada 10 minutos. A mano:
+    python3 finance_insights.py            # recalcula y escribe
+    python3 finance_insights.py --dry-run  # solo imprime el JSON
+"""
+
+import json
+import argparse
+import datetime
+
+import numpy as np
+from firebase_admin import firestore
+
+from utils import conectar_db
+from tx_enrich import normalize_category
+
+INSIGHTS_COLLECTION = 'finance_insights'
+INSIGHTS_DOC = 'latest'
+
+# Igual que EXCHANGE_RATE en Insights.jsx.
+EXCHANGE_RATE = 4100
+WINDOW_MONTHS = 7
+CASHFLOW_MONTHS = 6
+BURN_MONTHS = 3
+DAILY_DAYS = 30
+TOP_FUGAS = 5
+
+BOGOTA = datetime.timezone(datetime.timedelta(hours=-5))
+
+CONTEXTS = ('personal', 'business')
+GROUPS = CONTEXTS + ('unified',)
+UNIFIED = len(CONTEXTS)
+# Códigos de contexto: los de CONTEXTS, o este si no es ninguno.
+OTHER_CONTEXT = len(CONTEXTS)
+
+DEBIT, CREDIT, TRANSFER = 0, 1, 2
+
+FIELDS = ['date', 'amount', 'type', 'isTransfer', 'currency', 'category', 'context',
+          'destinationContext', 'title']
+
+
+KINDS = {'debit': DEBIT, 'credit': CREDIT, 'transfer': TRANSFER}
+CONTEXT_CODES = {name: i for i, name in enumerate(CONTEXTS)}
+
+
+class _Codes(dict):
+    """Valor → código entero, en orden de aparición (factorización)."""
+
+    def __missing__(self, key):
+        self[key] = code = len(self)
+        return code
+
+    def names(self):
+        return list(self)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _category(value):
+    return value if isinstance(value, str) and value else normalize_category(value)
+
+
+class Columns:
+    """Transacciones en columnas de NumPy (una fila por transacción).
+
+    Los dicts se recorren una sola vez; el resto del trabajo es vectorial."""
+
+    def __init__(self, txs):
+        fechas, montos, tipos, contextos, destinos, categorias, monedas, self.titles = [], [], [], [], [], [], [], []
+        cat_codes, cur_codes = _Codes(), _Codes()
+        for t in txs:
+            get = t.get
+            fecha = get('date')
+            fechas.append(fecha[:10] if isinstance(fecha, str) and len(fecha) >= 10 and fecha[4] == '-'
+                          else 'NaT')
+            montos.append(get('amount', 0))
+            tipo = KINDS.get(get('type'), DEBIT)
+            tipos.append(TRANSFER if get('isTransfer') is True else tipo)
+            contextos.append(CONTEXT_CODES.get(get('context', 'personal'), OTHER_CONTEXT))
+            destinos.append(CONTEXT_CODES.get(get('destinationContext'), OTHER_CONTEXT))
+            categorias.append(cat_codes[_category(get('category'))])
+            monedas.append(cur_codes[get('currency') or 'COP'])
+            self.titles.append(get('title') or 'Movimiento')
+
+        self.n = len(fechas)
+        days = np.array(fechas, dtype='datetime64[D]')
+        self.day = days.astype(np.int64)
+        self.month = days.astype('datetime64[M]').astype(np.int64)
+        self.kind = np.array(tipos, dtype=np.int64)
+        self.ctx = np.array(contextos, dtype=np.int64)
+        self.dest = np.array(destinos, dtype=np.int64)
+        self.cat, self.categories = np.array(categorias, dtype=np.int64), [str(c) for c in cat_codes.names()]
+        self.cur, self.currencies = np.array(monedas, dtype=np.int64), [str(c) for c in cur_codes.names()]
+        try:
+            amount = np.array(montos, dtype=np.float64)
+        except (TypeError, ValueError):
+            amount = np.array([_float(m) for m in montos], dtype=np.float64)
+        usd = np.array([c == 'USD' for c in self.currencies] or [False])[self.cur]
+        self.amount = np.where(usd, amount * EXCHANGE_RATE, amount)
+        self.valid = ~np.isnan(self.amount) & ~np.isnat(days)
+
+
+def _membership(cols):
+    """Filas expandidas por grupo: `(rows, groups)`. Cada fila va a su
+    contexto y a 'unified'; las transferencias también al de destino."""
+    todas = np.flatnonzero(cols.valid)
+    propias = todas[cols.ctx[todas] != OTHER_CONTEXT]
+    destino = todas[(cols.kind[todas] == TRANSFER) & (cols.dest[todas] != OTHER_CONTEXT)
+                    & (cols.dest[todas] != cols.ctx[todas])]
+    rows = np.concatenate([propias, destino, todas])
+    groups = np.concatenate([cols.ctx[propias], cols.dest[destino], np.full(len(todas), UNIFIED)])
+    return rows, groups
+
+
+def _grouped(groups, idx, mask, size, weights=None):
+    """Suma de `weights` (o conteo) por (grupo, idx) → matriz grupos × size."""
+    key = groups[mask] * size + idx[mask]
+    if weights is None:
+        return np.bincount(key, minlength=len(GROUPS) * size).reshape(len(GROUPS), size)
+    return np.bincount(key, weights=weights[mask], minlength=len(GROUPS) * size) \
+        .astype(np.float64).reshape(len(GROUPS), size)
+
+
+def _pct_delta(now, prev):
+    return np.divide((now - prev) * 100, prev, out=np.zeros_like(now), where=prev > 0)
+
+
+def _savings(income, spent):
+    return np.divide((income - spent) * 100, income, out=np.zeros_like(income), where=income > 0)
+
+
+def _month_label(month_index):
+    return str(np.datetime64(int(month_index), 'M'))
+
+
+def _streaks(active):
+    """Días seguidos con movimiento hasta hoy (o hasta ayer, si hoy no hay),
+    por grupo. `active[g, d]` es el día d hacia atrás (0 = hoy)."""
+    out = []
+    for fila in active:
+        desde = 0 if fila[0] else 1
+        resto = fila[desde:]
+        out.append(int(len(resto) if resto.all() else np.argmin(resto)))
+    return out
+
+
+def window_start(today):
+    """Primer día de la ventana ('YYYY-MM-DD')."""
+    return str(np.datetime64(np.datetime64(today, 'M') - (WINDOW_MONTHS - 1), 'D'))
+
+
+def compute_insights(txs, today):
+    """Métricas de todos los grupos a partir de las transacciones (`today`
+    es un `datetime.date`)."""
+    cols = txs if isinstance(txs, Columns) else Columns(txs)
+    rows, g = _membership(cols)
+    amount, kind, cat, cur = cols.amount[rows], cols.kind[rows], cols.cat[rows], cols.cur[rows]
+    today_day = np.datetime64(today, 'D').astype(np.int64)
+    today_month = np.datetime64(today, 'M').astype(np.int64)
+    ago_m = today_month - cols.month[rows]      # 0 = mes actual
+    ago_d = today_day - cols.day[rows]          # 0 = hoy
+    debit, credit = kind == DEBIT, kind == CREDIT
+    in_window = (ago_m >= 0) & (ago_m < WINDOW_MONTHS)
+
+    # Una suma agrupada por métrica: grupos × (mes, día, categoría o moneda).
+    spent = _grouped(g, ago_m, in_window & debit, WINDOW_MONTHS, amount)
+    income = _grouped(g, ago_m, in_window & credit, WINDOW_MONTHS, amount)
+    in_days = (ago_d >= 0) & (ago_d < DAILY_DAYS)
+    daily = _grouped(g, DAILY_DAYS - 1 - ago_d, in_days & debit, DAILY_DAYS, amount)
+    daily_n = _grouped(g, DAILY_DAYS - 1 - ago_d, in_days & debit, DAILY_DAYS)
+    n_cat, n_cur = max(len(cols.categories), 1), max(len(cols.currencies), 1)
+    cat_now = _grouped(g, cat, (ago_m == 0) & debit, n_cat, amount)
+    cat_prev = _grouped(g, cat, (ago_m == 1) & debit, n_cat, amount)
+    volume = _grouped(g, cur, in_window & (debit | credit), n_cur, np.abs(amount))
+
+    window_days = int(today_day - np.datetime64(window_start(today), 'D').astype(np.int64)) + 1
+    active = np.zeros((len(GROUPS), window_days), dtype=bool)
+    in_streak = (ago_d >= 0) & (ago_d < window_days)
+    active[g[in_streak], ago_d[in_streak]] = True
+
+    # Mayor gasto de los últimos 30 días por grupo: el último de cada grupo
+    # al ordenar por (grupo, monto).
+    idx = np.flatnonzero(in_days & debit)
+    order = idx[np.lexsort((amount[idx], g[idx]))]
+    ultimos = order[np.r_[g[order][1:] != g[order][:-1], True]] if len(order) else order
+    biggest = {int(g[i]): int(rows[i]) for i in ultimos}
+
+    savings = _savings(income[:, 0], spent[:, 0])
+    prev_savings = _savings(income[:, 1], spent[:, 1])
+    spent_delta = _pct_delta(spent[:, 0], spent[:, 1])
+    income_delta = _pct_delta(income[:, 0], income[:, 1])
+    burn = spent[:, 1:1 + BURN_MONTHS].mean(axis=1)
+    streaks = _streaks(active)
+    meses = [_month_label(today_month - k) for k in range(CASHFLOW_MONTHS - 1, -1, -1)]
+
+    contexts = {}
+    for gi, name in enumerate(GROUPS):
+        total_cat = cat_now[gi].sum()
+        top = [k for k in np.argsort(-cat_now[gi], kind='stable') if cat_now[gi, k] > 0]
+        por_categoria = [{'name': cols.categories[k], 'amount': float(cat_now[gi, k]),
+                          'pct': float(cat_now[gi, k] * 100 / total_cat)} for k in top]
+        fugas = [{'name': cols.categories[k], 'amount': float(cat_now[gi, k]),
+                  'prevAmount': float(cat_prev[gi, k]),
+                  'trend': float((cat_now[gi, k] - cat_prev[gi, k]) * 100 / cat_prev[gi, k])
+                  if cat_prev[gi, k] > 0 else None}
+                 for k in top[:TOP_FUGAS]]
+        total_vol = volume[gi].sum()
+        big = biggest.get(gi)
+        contexts[name] = {
+            'month': {
+                'spent': float(spent[gi, 0]), 'income': float(income[gi, 0]),
+                'savings': float(savings[gi]), 'prevSavings': float(prev_savings[gi]),
+                'spentDelta': float(spent_delta[gi]), 'incomeDelta': float(income_delta[gi]),
+            },
+            'burnRate': float(burn[gi]),
+            'cashflow': [{'month': m, 'income': float(income[gi, k]), 'expenses': float(spent[gi, k])}
+                         for m, k in zip(meses, range(CASHFLOW_MONTHS - 1, -1, -1))],
+            'currencyExposure': {cols.currencies[k]: float(volume[gi, k] * 100 / total_vol)
+                                 for k in range(len(cols.currencies)) if volume[gi, k] > 0},
+            'daily': [float(x) for x in daily[gi]],
+            'todayTotal': float(daily[gi, -1]),
+            'todayCount': int(daily_n[gi, -1]),
+            'dailyAvg': float(daily[gi].mean()),
+            'categories': por_categoria,
+            'topFugas': fugas,
+            'biggest': None if big is None else {
+                'title': cols.titles[big], 'amount': float(cols.amount[big]),
+                'date': str(np.datetime64(int(cols.day[big]), 'D')),
+            },
+            'streak': streaks[gi],
+        }
+    return {'today': today.isoformat(), 'exchangeRate': EXCHANGE_RATE,
+            'windowStart': window_start(today), 'contexts': contexts}
+
+
+def load_window(db, today):
+    """Transacciones de la ventana (solo los campos que se usan)."""
+    docs = db.collection('finance_transactions') \
+        .where('date', '>=', window_start(today)).select(FIELDS).stream()
+    return [d.to_dict() for d in docs]
+
+
+def refresh(db, today=None):
+    """Recalcula `finance_insights/latest` y devuelve el documento escrito."""
+    today = today or datetime.datetime.now(BOGOTA).date()
+    doc = compute_insights(load_window(db, today), today)
+    db.collection(INSIGHTS_COLLECTION).document(INSIGHTS_DOC) \
+        .set({**doc, 'generatedAt': firestore.SERVER_TIMESTAMP})
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula finance_insights/latest")
+    parser.add_argument('--dry-run', action='store_true', help="Solo imprime el resultado, no escribe.")
+    args = parser.parse_args()
+
+    db = conectar_db()
+    if args.dry_run:
+        today = datetime.datetime.now(BOGOTA).date()
+        print(json.dumps(compute_insights(load_window(db, today), today), ensure_ascii=False, indent=2))
+        return
+    doc = refresh(db)
+    unified = doc['contexts']['unified']
+    print(f"✅ Insights actualizados ({doc['today']}): gasto del mes {unified['month']['spent']:,.0f} COP, "
+          f"ahorro {unified['month']['savings']:.1f}%.")
+
+
+if __name__ == '__main__':
+    main()
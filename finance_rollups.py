@@ -0,0 +1,203 @@
+"""
+Totales mensuales precalculados en Firestore (`finance_rollups/{YYYY-MM}`).
+
+Cada documento resume un mes de `finance_transactions` para que los
+dashboards lean una docena de documentos chicos en vez de todo el
+historial. Los montos nunca se mezclan entre monedas: cada dimensión se
+desglosa por moneda y tipo (debit/credit), con su conteo. Las transferencias
+entre cuentas propias (`type == 'transfer'` o `isTransfer`) no suman, igual
+que en `calculateBalances` del frontend, y una categoría guardada como
+objeto cuenta por su nombre.
+
+    {
+      "month": "2026-10",
+      "count": 42,
+      "currencies": {"COP": {"debit": 1250000.0, "credit": 0.0, "count": 40}, ...},
+      "contexts":   {"personal": {"COP": {"debit": ..., "credit": ..., "count": ...}}},
+      "categories": {"Comida": {"COP": {...}}},
+      "cards":      {"Visa": {"COP": {...}}}
+    }
+
+- El pipeline los actualiza al guardar cada transacción (`increment_rollup`,
+  dentro del mismo WriteBatch que la transacción, igual que la memoria de
+  comercios).
+- Las ediciones hechas desde Python usan `move_rollup`.
+- `rebuild` los recalcula desde cero con todo `finance_transactions`; cubre
+  también los cambios hechos desde la app. Correr con:
+      python3 finance_rollups.py --rebuild
+
+Como en merchant_memory_store.py, el valor '' (p. ej. sin tarjeta) se guarda
+como `EMPTY_KEY`.
+"""
+
+import argparse
+from collections import defaultdict
+
+from firebase_admin import firestore
+
+from utils import conectar_db
+from tx_enrich import normalize_category
+
+ROLLUP_COLLECTION = 'finance_rollups'
+
+# Dimensiones desglosadas en cada mes: nombre del mapa → campo de la transacción.
+DIMENSIONS = {'contexts': 'context', 'categories': 'category', 'cards': 'card'}
+
+FIRESTORE_BATCH_LIMIT = 500
+
+EMPTY_KEY = '(vacío)'
+
+
+def _encode(value):
+    return str(value) if value else EMPTY_KEY
+
+
+def month_of(tx):
+    """Mes de la transacción ('YYYY-MM', de su campo `date`) o None."""
+    date = str(tx.get('date') or '')
+    return date[:7] if len(date) >= 7 and date[4] == '-' else None
+
+
+def _cells(tx):
+    """`(amount, tipo, moneda)` de la transacción, o None si no suma (sin
+    monto o transferencia)."""
+    if tx.get('type') == 'transfer' or tx.get('isTransfer'):
+        return None
+    try:
+        amount = float(tx.get('amount', 0))
+    except (TypeError, ValueError):
+        return None
+    tipo = 'credit' if tx.get('type') == 'credit' else 'debit'
+    return amount, tipo, _encode(tx.get('currency', 'COP'))
+
+
+def _key(tx, field):
+    """Clave de la transacción en la dimensión `field`."""
+    value = tx.get(field)
+    if field == 'category' and isinstance(value, dict):
+        value = normalize_category(value)
+    return _encode(value)
+
+
+def _bucket(amount, tipo, sign, inc):
+    return {tipo: inc(sign * amount), 'count': inc(sign)}
+
+
+def _delta(tx, sign):
+    """Actualización del mes de la transacción (con Increment), o None."""
+    month, cells = month_of(tx), _cells(tx)
+    if month is None or cells is None:
+        return None, None
+    amount, tipo, moneda = cells
+    inc = firestore.Increment
+    delta = {
+        'month': month,
+        'count': inc(sign),
+        'currencies': {moneda: _bucket(amount, tipo, sign, inc)},
+    }
+    for name, field in DIMENSIONS.items():
+        delta[name] = {_key(tx, field): {moneda: _bucket(amount, tipo, sign, inc)}}
+    return month, delta
+
+
+def _ref(db, month):
+    return db.collection(ROLLUP_COLLECTION).document(month)
+
+
+def increment_rollup(db, tx, batch=None, sign=1):
+    """Suma (o resta, con `sign=-1`) una transacción a su mes.
+
+    Si se pasa `batch`, la escritura va en ese WriteBatch (atómica con la
+    transacción); si no, se escribe al instante.
+    """
+    month, delta = _delta(tx, sign)
+    if delta is None:
+        return
+    if batch is not None:
+        batch.set(_ref(db, month), delta, merge=True)
+    else:
+        _ref(db, month).set(delta, merge=True)
+
+
+def move_rollup(db, before, after, batch=None):
+    """Mueve una transacción editada: resta su versión anterior (`before`) y
+    suma la nueva (`after`); sirve también si cambió de mes."""
+    own_batch = batch is None
+    batch = db.batch() if own_batch else batch
+    increment_rollup(db, before, batch, sign=-1)
+    increment_rollup(db, after, batch, sign=1)
+    if own_batch:
+        batch.commit()
+
+
+def _empty_bucket():
+    return {'debit': 0.0, 'credit': 0.0, 'count': 0}
+
+
+def compute_rollups(txs):
+    """Documentos de todos los meses a partir de las transacciones."""
+    months = {}
+    for tx in txs:
+        month, cells = month_of(tx), _cells(tx)
+        if month is None or cells is None:
+            continue
+        amount, tipo, moneda = cells
+        doc = months.get(month)
+        if doc is None:
+            doc = months[month] = {
+                'month': month, 'count': 0,
+                'currencies': defaultdict(_empty_bucket),
+                **{name: defaultdict(lambda: defaultdict(_empty_bucket)) for name in DIMENSIONS},
+            }
+        doc['count'] += 1
+        buckets = [doc['currencies'][moneda]] + \
+            [doc[name][_key(tx, field)][moneda] for name, field in DIMENSIONS.items()]
+        for bucket in buckets:
+            bucket[tipo] += amount
+            bucket['count'] += 1
+    return {month: _plain(doc) for month, doc in months.items()}
+
+
+def _plain(value):
+    """defaultdict anidados → dict (para escribir en Firestore)."""
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+def rebuild(db):
+    """Recalcula todos los meses desde `finance_transactions` y borra los
+    meses que ya no tienen transacciones."""
+    docs = db.collection('finance_transactions') \
+        .select(['date', 'amount', 'type', 'isTransfer', 'currency', *DIMENSIONS.values()]).stream()
+    rollups = compute_rollups(d.to_dict() for d in docs)
+    stale = [d.id for d in db.collection(ROLLUP_COLLECTION).stream() if d.id not in rollups]
+
+    ops = [(month, doc) for month, doc in sorted(rollups.items())] + [(month, None) for month in stale]
+    for i in range(0, len(ops), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for month, doc in ops[i:i + FIRESTORE_BATCH_LIMIT]:
+            if doc is None:
+                batch.delete(_ref(db, month))
+            else:
+                batch.set(_ref(db, month), {**doc, 'rebuiltAt': firestore.SERVER_TIMESTAMP})
+        batch.commit()
+    return len(rollups), sum(doc['count'] for doc in rollups.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Totales mensuales precalculados en Firestore")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Recalcula finance_rollups/{YYYY-MM} desde todas las transacciones.")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    db = conectar_db()
+    n_months, n_txs = rebuild(db)
+    print(f"✅ Totales mensuales reconstruidos: {n_months} meses a partir de {n_txs} transacciones.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Cliente de extracción con Gemini para el sync: asíncrono, con límite de
+tasa, reintentos y salida con esquema.
+
+- Las llamadas corren en un event loop propio (un hilo) sobre `client.aio`;
+  desde el código síncrono del sync (hilo principal o hilos del pool) se
+  usa `generate_json`, que espera el resultado.
+- Un token bucket compartido (`RateLimiter`) reparte las llamadas según la
+  cuota de Gemini (RPM) y un semáforo acota cuántas hay en vuelo a la vez.
+- Los errores transitorios (429, 5xx, timeouts) se reintentan con backoff
+  exponencial con jitter ("full jitter"). El JSON mal formado se reintenta
+  una sola vez y sin espera: con temperatura 0 el mismo prompt suele
+  devolver lo mismo, y si vuelve a fallar el correo queda en `ia_error`.
+- `response_schema` restringe la salida a la forma de la transacción
+  (`TRANSACTION_SCHEMA`) o a un arreglo de ellas (`BATCH_SCHEMA`).
+"""
+
+import json
+import time
+import random
+import asyncio
+import threading
+
+from run_metrics import span, count
+
+DEFAULT_RPM = 240
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = 4
+# Reintentos por respuesta que no es JSON válido (ver arriba).
+MAX_PARSE_RETRIES = 1
+BACKOFF_BASE = 1.0     # segundos
+BACKOFF_CAP = 30.0
+
+# Códigos HTTP que vale la pena reintentar.
+RETRYABLE_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+SYSTEM_INSTRUCTION = "Eres un asistente financiero. Respondes únicamente con JSON válido."
+
+_TX_PROPERTIES = {
+    'type': {'type': 'STRING', 'enum': ['debit', 'credit', 'ignore']},
+    'amount': {'type': 'NUMBER'},
+    'title': {'type': 'STRING'},
+    'currency': {'type': 'STRING'},
+    'category': {'type': 'STRING'},
+    'subcategory': {'type': 'STRING'},
+    'card': {'type': 'STRING'},
+    'context': {'type': 'STRING', 'enum': ['personal', 'business']},
+    'comments': {'type': 'STRING'},
+}
+
+# Un correo: el JSON que pide `tx_prompt.build_prompt` ({"type": "ignore"}
+# basta para lo que no es una transacción).
+TRANSACTION_SCHEMA = {'type': 'OBJECT', 'properties': _TX_PROPERTIES, 'required': ['type']}
+
+# Varios correos (`tx_prompt.build_batch_prompt`): un objeto por correo, con su id.
+BATCH_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {'type': 'OBJECT', 'properties': {'id': {'type': 'STRING'}, **_TX_PROPERTIES},
+              'required': ['id', 'type']},
+}
+
+
+class RateLimiter:
+    """Token bucket: `rpm` llamadas por minuto con ráfagas de hasta `burst`.
+
+    Se usa desde un solo event loop (no necesita lock)."""
+
+    def __init__(self, rpm, burst=None, clock=time.monotonic):
+        self.rate = rpm / 60.0
+        self.capacity = float(burst or max(1, min(rpm, 10)))
+        self.tokens = self.capacity
+        self._clock = clock
+        self._last = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self):
+        """Segundos hasta que haya una ficha (0 si ya hay una; la consume)."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            espera = self.wait_time()
+            if not espera:
+                return
+            count('gemini.throttled')
+            await asyncio.sleep(espera)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP, rnd=random):
+    """Espera antes del reintento `attempt` (0, 1, ...): uniforme entre 0 y
+    min(cap, base·2^attempt)."""
+    return rnd.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(exc):
+    """¿El error es transitorio (cuota, servidor, red o JSON mal formado)?
+
+    El JSON mal formado tiene su propio tope (`MAX_PARSE_RETRIES`)."""
+    if isinstance(exc, (json.JSONDecodeError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    return type(exc).__name__ in ('ConnectError', 'ReadTimeout', 'ConnectTimeout', 'RemoteProtocolError')
+
+
+class GeminiExtractor:
+    """Extracciones JSON con Gemini compartidas por todos los hilos de la corrida."""
+
+    def __init__(self, client, model, rpm=DEFAULT_RPM, concurrency=DEFAULT_CONCURRENCY,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, client_factory=None):
+        # Sin `client`, `client_factory()` lo construye en la primera llamada.
+        self.client = client
+        self._client_factory = client_factory
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.limiter = RateLimiter(rpm)
+        self.reintentos = 0
+        self._loop = None
+        self._thread = None
+        self._semaforo = None
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        """Arranca (una vez) el event loop en su hilo y, si hace falta, el cliente."""
+        with self._lock:
+            if self.client is None:
+                self.client = self._client_factory()
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name='gemini-loop', daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def _config(self, schema):
+        from google.genai import types
+        return types.GenerateContentConfig(
+            system_instruction=SYSTEM_INSTRUCTION,
+            response_mime_type="application/json",
+            response_schema=schema,
+            temperature=0,
+        )
+
+    async def agenerate_json(self, prompt, schema=TRANSACTION_SCHEMA):
+        """Llama a Gemini y devuelve `(json, usage_metadata)`; reintenta los
+        errores transitorios. Lanza el último error si se agotan los intentos."""
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrency)
+        malformados = 0
+        for intento in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self._semaforo:
+                    count('gemini.generate_content')
+                    with span('generate_content'):
+                        response = await self.client.aio.models.generate_content(
+                            model=self.model, contents=prompt, config=self._config(schema))
+                return json.loads(response.text), getattr(response, 'usage_metadata', None)
+            except Exception as e:
+                if intento == self.max_retries or not is_retryable(e):
+                    raise
+                if isinstance(e, json.JSONDecodeError):
+                    malformados += 1
+                    if malformados > MAX_PARSE_RETRIES:
+                        raise
+                    espera = 0.0
+                else:
+                    espera = backoff_delay(intento, self.backoff_base)
+                self.reintentos += 1
+                count('gemini.retries')
+                print(f"🔁 Gemini falló ({type(e).__name__}: {str(e)[:80]}); "
+                      f"reintento {intento + 1}/{self.max_retries} en {espera:.1f}s.")
+                await asyncio.sleep(espera)
+
+    def generate_json(self, prompt, schema=TRANSACTION_SCHEMA):
+        """Versión síncrona de `agenerate_json` (segura desde cualquier hilo)."""
+        futuro = asyncio.run_coroutine_threadsafe(self.agenerate_json(prompt, schema), self._iniciar())
+        return futuro.result()
+
+    def close(self):
+        """Detiene el event loop (las llamadas en curso se cancelan)."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            loop.close()
@@ -0,0 +1,156 @@
+"""
+Capa compartida de lectura de Gmail (listado paginado + descarga por lotes).
+
+La usan el sync (gmail_finanzas_sync.py) y los scripts de reportes. Recibe un
+`service` ya autenticado de googleapiclient y no depende de Firestore ni de
+Gemini.
+
+- `list_message_ids` recorre TODAS las páginas de `messages().list`
+  (sigue `nextPageToken`), en vez de quedarse con la primera.
+- `get_messages` descarga mensajes con el endpoint batch de la API
+  (`service.new_batch_http_request()`), en bloques de `BATCH_SIZE`: un round
+  trip HTTP por bloque en vez de uno por correo.
+- Con `fmt='metadata'` solo baja cabeceras (p. ej. el asunto), para descartar
+  correos antes de descargar su cuerpo.
+- `list_history_message_ids` lista solo lo que cambió desde un `historyId`
+  (sync incremental), en vez de re-escanear toda la etiqueta.
+"""
+
+import time
+
+from run_metrics import count
+
+# Gmail recomienda no pasar de 50 llamadas por batch (más dispara 429).
+BATCH_SIZE = 50
+
+# Tamaño de página de messages().list (máximo permitido por la API).
+LIST_PAGE_SIZE = 500
+
+# Errores por mensaje dentro de un batch que vale la pena reintentar.
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def list_message_ids(service, query=None, label_ids=None, page_size=LIST_PAGE_SIZE):
+    """Devuelve los IDs de todos los mensajes que cumplen la búsqueda, en el
+    orden de Gmail (más recientes primero), recorriendo todas las páginas."""
+    ids, page_token = [], None
+    while True:
+        kwargs = {'userId': 'me', 'maxResults': page_size}
+        if query:
+            kwargs['q'] = query
+        if label_ids:
+            kwargs['labelIds'] = list(label_ids)
+        if page_token:
+            kwargs['pageToken'] = page_token
+        res = service.users().messages().list(**kwargs).execute()
+        count('gmail.messages.list')
+        ids.extend(m['id'] for m in res.get('messages', []))
+        page_token = res.get('nextPageToken')
+        if not page_token:
+            return ids
+
+
+class HistoryExpired(Exception):
+    """El `startHistoryId` ya no está disponible en Gmail (404): hay que
+    volver a un escaneo completo."""
+
+
+def current_history_id(service):
+    """historyId actual del buzón (punto de partida del sync incremental)."""
+    count('gmail.getProfile')
+    return service.users().getProfile(userId='me').execute()['historyId']
+
+
+def list_history_message_ids(service, start_history_id, label_id):
+    """IDs de los mensajes que recibieron `label_id` (o llegaron ya con ella)
+    desde `start_history_id`, recorriendo todas las páginas de
+    `users().history().list`.
+
+    Devuelve `(ids, history_id)`, donde `history_id` es el historyId actual
+    del buzón para guardar como próximo punto de partida. Lanza
+    `HistoryExpired` si Gmail ya no conserva ese historial.
+    """
+    ids, page_token, history_id = [], None, start_history_id
+    while True:
+        kwargs = {'userId': 'me', 'startHistoryId': start_history_id, 'labelId': label_id,
+                  'historyTypes': ['messageAdded', 'labelAdded']}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        try:
+            count('gmail.history.list')
+            res = service.users().history().list(**kwargs).execute()
+        except Exception as e:
+            if http_status(e) == 404:
+                raise HistoryExpired(str(e)) from e
+            raise
+        history_id = res.get('historyId', history_id)
+        for record in res.get('history', []):
+            for added in record.get('messagesAdded', []):
+                if label_id in added.get('message', {}).get('labelIds', []):
+                    ids.append(added['message']['id'])
+            for added in record.get('labelsAdded', []):
+                if label_id in added.get('labelIds', []):
+                    ids.append(added['message']['id'])
+        page_token = res.get('nextPageToken')
+        if not page_token:
+            return list(dict.fromkeys(ids)), history_id
+
+
+def http_status(exc):
+    """Código HTTP de un error de googleapiclient (None si no aplica)."""
+    resp = getattr(exc, 'resp', None)
+    try:
+        return int(getattr(resp, 'status', None))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_messages(service, ids, fmt='full', metadata_headers=None,
+                 batch_size=BATCH_SIZE, retries=2):
+    """Descarga los mensajes `ids` con requests batch de `batch_size` llamadas.
+
+    Devuelve `(mensajes, errores)`: dos dicts `{id: mensaje}` y
+    `{id: excepción}`. Los errores transitorios (429/5xx) se reintentan hasta
+    `retries` veces con una pausa creciente; el resto se reporta sin abortar
+    los demás mensajes del lote.
+    """
+    mensajes, errores = {}, {}
+    pendientes = list(dict.fromkeys(ids))
+
+    for intento in range(retries + 1):
+        if intento:
+            time.sleep(2 ** (intento - 1))
+        reintentar = []
+
+        def _callback(request_id, response, exception):
+            if exception is None:
+                mensajes[request_id] = response
+                errores.pop(request_id, None)
+            else:
+                errores[request_id] = exception
+                if http_status(exception) in _RETRYABLE_STATUS:
+                    reintentar.append(request_id)
+
+        for i in range(0, len(pendientes), batch_size):
+            batch = service.new_batch_http_request(callback=_callback)
+            for msg_id in pendientes[i:i + batch_size]:
+                kwargs = {'userId': 'me', 'id': msg_id, 'format': fmt}
+                if fmt == 'metadata' and metadata_headers:
+                    kwargs['metadataHeaders'] = list(metadata_headers)
+                batch.add(service.users().messages().get(**kwargs), request_id=msg_id)
+            batch.execute()
+            count('gmail.batch')
+            count('gmail.messages.get', len(pendientes[i:i + batch_size]))
+
+        if not reintentar:
+            break
+        pendientes = reintentar
+
+    return mensajes, errores
+
+
+def message_header(message, name):
+    """Valor de la cabecera `name` del mensaje (o '' si no la tiene)."""
+    name = name.lower()
+    return next((h.get('value', '') for h in message.get('payload', {}).get('headers', [])
+                 if h.get('name', '').lower() == name), '')
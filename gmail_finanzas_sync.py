@@ -1,25 +1,48 @@
 import os
 import json
-import base64
 import argparse
 import datetime
-from bs4 import BeautifulSoup
-
-# Google API
-from google.auth.transport.requests import Request
+import threading
+import cProfile
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+
+# Google API. Lo pesado que no siempre hace falta (google.genai, el
+# transporte de refresco del token y firebase_admin.messaging) se importa
+# recién al usarlo: cada corrida del cron arranca un intérprete nuevo y la
+# mayoría no tiene correos que analizar.
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 
-# Gemini
-from google import genai
-from google.genai import types
-
 # Firebase
-from firebase_admin import firestore, messaging
+from firebase_admin import firestore
 from utils import conectar_db
+from email_text import email_text
+from gmail_fetch import (
+    BATCH_SIZE, HistoryExpired, list_message_ids, list_history_message_ids,
+    current_history_id, get_messages, message_header, http_status,
+)
 from tx_enrich import (
-    build_merchant_memory, memory_for_prompt, apply_merchant_memory,
-    validate_classification, looks_like_statement,
+    merchant_counts, add_to_merchant_counts, memory_from_counts, memory_entry,
+    apply_merchant_memory, MerchantClassifier,
+    validate_classification, looks_like_statement, FuzzyIndex,
+)
+from merchant_memory_store import load_merchant_counts, increment_merchant
+from finance_rollups import increment_rollup
+from tx_dedup import (
+    DedupIndex, DUPLICATE, WINDOW_DAYS as DEDUP_WINDOW_DAYS, dedup_entry, load_dedup_index,
+    prune_dedup, record_dedup,
+)
+from tx_prompt import (
+    PROMPT_VERSION, MerchantSelector, build_prompt, build_batch_prompt, parse_batch_response,
+    estimate_tokens,
+)
+from tx_templates import extract_with_template
+from llm_cache import ExtractionCache, cache_key
+from run_metrics import metrics, span, timed, count
+from push_notify import PushSender
+from gemini_client import (
+    GeminiExtractor, TRANSACTION_SCHEMA, BATCH_SCHEMA, DEFAULT_RPM, DEFAULT_CONCURRENCY,
 )
 
 # --- CONFIGURACIÓN ---
@@ -40,13 +63,25 @@ GEMINI_MODEL = "gemini-3.1-flash-lite"
 TOKEN_COLLECTION = 'gmail_auth'
 TOKEN_DOC = 'token'
 
+# Documento (junto al token) con el estado del sync incremental: último
+# historyId visto y correos que quedaron pendientes de reintento.
+SYNC_STATE_DOC = 'sync_state'
+
 # Colección de Firestore con los IDs de correos ya procesados
 PROCESSED_COLLECTION = 'processed_gmail_ids'
 
+# Máximo de operaciones por WriteBatch de Firestore (límite de la API)
+FIRESTORE_BATCH_LIMIT = 500
+
 # Tamaño máximo de texto del correo enviado al modelo
 MAX_BODY_CHARS = 3500
 
-# Cuántas transacciones recientes traer para construir la memoria de comercios
+# Cuántas transacciones recientes se mantienen en el contexto de la corrida
+# (el prompt muestra solo las `tx_prompt.MAX_RECENT` primeras)
+RECENT_LIMIT = 20
+
+# Si aún no existe la memoria persistida (merchant_memory/index), cuántas
+# transacciones recientes traer para construirla al vuelo
 MEMORY_HISTORY_LIMIT = 400
 
 
@@ -61,8 +96,8 @@ def _save_token(db, token_info):
     db.collection(TOKEN_COLLECTION).document(TOKEN_DOC).set(token_info)
 
 
-def authenticate_gmail(db):
-    """Autentica con la API de Gmail usando el token guardado en Firestore.
+def gmail_credentials(db):
+    """Devuelve las credenciales de Gmail a partir del token guardado en Firestore.
 
     El token (con su refresh_token, client_id y client_secret) se siembra una
     sola vez con bootstrap_token.py. Aquí solo se carga y, si está expirado, se
@@ -80,6 +115,7 @@ def authenticate_gmail(db):
 
     if not creds.valid:
         if creds.expired and creds.refresh_token:
+            from google.auth.transport.requests import Request
             print("🔄 Token expirado. Refrescando...")
             creds.refresh(Request())
             _save_token(db, json.loads(creds.to_json()))
@@ -91,23 +127,85 @@ def authenticate_gmail(db):
                 "bootstrap_token.py."
             )
 
-    return build('gmail', 'v1', credentials=creds)
+    return creds
+
+
+def build_gmail(creds):
+    """Construye el cliente de la API de Gmail con las credenciales dadas.
+
+    Usa el documento de discovery que trae googleapiclient (sin pedirlo por
+    red) y no intenta cachearlo en disco."""
+    return build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
+
+
+def gemini_client(api_key):
+    """Cliente de google.genai (se importa aquí: tarda en cargar)."""
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+
+def authenticate_gmail(db):
+    """Autentica con la API de Gmail usando el token guardado en Firestore."""
+    return build_gmail(gmail_credentials(db))
+
+
+def processed_ids(db, email_ids):
+    """Devuelve el subconjunto de `email_ids` que ya fue procesado.
+
+    Una sola lectura en bloque (`db.get_all`) en vez de un `get` por correo.
+    """
+    col = db.collection(PROCESSED_COLLECTION)
+    refs = [col.document(email_id) for email_id in email_ids]
+    if not refs:
+        return set()
+    count('firestore.get_all')
+    return {snap.id for snap in db.get_all(refs) if snap.exists}
 
 
-def is_processed(db, email_id):
-    """Indica si un correo ya fue procesado anteriormente."""
-    return db.collection(PROCESSED_COLLECTION).document(email_id).get().exists
+def _load_sync_state(db):
+    """Lee el estado del sync incremental ({} si aún no existe)."""
+    doc = db.collection(TOKEN_COLLECTION).document(SYNC_STATE_DOC).get()
+    return doc.to_dict() if doc.exists else {}
 
 
-def save_processed_email(db, email_id):
-    """Registra un correo como procesado en Firestore."""
-    db.collection(PROCESSED_COLLECTION).document(email_id).set({
-        'processedAt': firestore.SERVER_TIMESTAMP
+def _save_sync_state(db, state):
+    """Guarda el estado del sync incremental."""
+    db.collection(TOKEN_COLLECTION).document(SYNC_STATE_DOC).set({
+        **state, 'updatedAt': firestore.SERVER_TIMESTAMP,
     })
 
 
+def listar_candidatos(service, label_name, label_id, state, full_scan=False):
+    """IDs de los correos a revisar en esta corrida y el historyId desde el
+    que debe arrancar la siguiente.
+
+    En modo incremental (hay un historyId guardado) solo pide a Gmail lo que
+    recibió la etiqueta desde entonces —una corrida ociosa es una sola llamada
+    a `history().list`— y le suma los correos que quedaron pendientes de
+    reintento. Si no hay historyId, si Gmail ya lo expiró o si se pide
+    `full_scan`, escanea la etiqueta completa.
+    """
+    start = state.get('historyId')
+    if start and not full_scan:
+        try:
+            nuevos, history_id = list_history_message_ids(service, start, label_id)
+            reintentos = state.get('retryIds', [])
+            print(f"📫 Sync incremental desde historyId {start}: {len(nuevos)} correo(s) nuevo(s), "
+                  f"{len(reintentos)} por reintentar.")
+            return list(dict.fromkeys(reintentos + nuevos)), history_id
+        except HistoryExpired:
+            print(f"⚠️ El historyId {start} expiró en Gmail. Se vuelve al escaneo de la etiqueta.")
+
+    # El historyId se toma ANTES de listar: lo que llegue mientras tanto se
+    # verá en la próxima corrida incremental.
+    history_id = current_history_id(service)
+    print(f"📫 Buscando correos con la etiqueta '{label_name}'...")
+    return list_message_ids(service, query=f"label:{label_name}"), history_id
+
+
 def get_label_id(service, label_name):
     """Busca el ID interno de Gmail correspondiente al nombre de una etiqueta."""
+    count('gmail.labels.list')
     results = service.users().labels().list(userId='me').execute()
     labels = results.get('labels', [])
     for label in labels:
@@ -116,57 +214,127 @@ def get_label_id(service, label_name):
     return None
 
 
-def extract_email_body(payload):
-    """Extrae el texto del cuerpo del correo, limpiando HTML."""
-    text_content = ""
-
-    # Función recursiva para buscar la parte de texto
-    def get_text_from_parts(parts):
-        nonlocal text_content
-        for part in parts:
-            mime_type = part.get("mimeType")
-            body = part.get("body", {})
-            data = body.get("data")
-
-            if mime_type == "text/plain" and data:
-                text_content += base64.urlsafe_b64decode(data).decode("utf-8")
-            elif mime_type == "text/html" and data:
-                html = base64.urlsafe_b64decode(data).decode("utf-8")
-                soup = BeautifulSoup(html, "html.parser")
-                text_content += soup.get_text(separator="\n")
-            elif "parts" in part:
-                get_text_from_parts(part["parts"])
-
-    if "parts" in payload:
-        get_text_from_parts(payload["parts"])
+def resolver_etiqueta(service, label_name, state, refrescar=False):
+    """`(label_id, etiquetas)`: el ID guardado en el estado del sync
+    (`labels`, nombre → ID) o, si no está o se pide `refrescar`, el de
+    `labels().list`. `etiquetas` es el mapa actualizado para guardar."""
+    etiquetas = dict(state.get('labels') or {})
+    if label_name in etiquetas and not refrescar:
+        return etiquetas[label_name], etiquetas
+    print(f"🔍 Buscando el ID interno para la etiqueta '{label_name}'...")
+    with span('get_label_id'):
+        label_id = get_label_id(service, label_name)
+    if label_id:
+        etiquetas[label_name] = label_id
     else:
-        # El correo podría no ser multipart
-        body = payload.get("body", {})
-        data = body.get("data")
-        mime_type = payload.get("mimeType", "")
-        if data:
-            decoded = base64.urlsafe_b64decode(data).decode("utf-8")
-            if "html" in mime_type:
-                soup = BeautifulSoup(decoded, "html.parser")
-                text_content = soup.get_text(separator="\n")
-            else:
-                text_content = decoded
+        etiquetas.pop(label_name, None)
+    return label_id, etiquetas
+
 
-    return text_content.strip()
+class SyncContext:
+    """Contexto de análisis de una corrida del sync.
+
+    Se carga una sola vez por corrida (ver `_prefetch_context`) y se comparte
+    entre todos los correos. Tras cada transacción guardada se actualiza en
+    memoria (`recordar`), de modo que los correos siguientes del mismo lote ya
+    ven los comercios recién registrados sin volver a leer Firestore.
+    """
+
+    def __init__(self, cat_tree, cuentas, monedas, recientes, conteos, tarjetas=None, dedup=None):
+        self.cat_tree = cat_tree
+        self.cuentas = cuentas
+        self.monedas = monedas
+        # Últimos dígitos de tarjeta → cuenta (para las plantillas).
+        self.tarjetas = tarjetas or {}
+        self.historial = recientes[:RECENT_LIMIT]
+        self.conteos = conteos
+        self.memoria = memory_from_counts(conteos)
+        # Índices fuzzy precalculados (una vez por corrida, no por correo).
+        self.indice = FuzzyIndex(self.memoria)
+        self.indice_cuentas = FuzzyIndex(cuentas)
+        self.selector = MerchantSelector(self.memoria)
+        # Clasificador local para los comercios que la memoria no resuelve.
+        self.clasificador = MerchantClassifier.from_counts(conteos)
+        # Huellas de las transacciones recientes (`tx_dedup.DedupIndex`).
+        self.dedup = dedup if dedup is not None else DedupIndex()
+        # Tokens de prompt enviados a Gemini (lo actualizan los hilos del pool).
+        self.tokens_prompt = 0
+        self.llamadas_ia = 0
+        self.plantillas = 0
+        # Caché de extracciones (`llm_cache.ExtractionCache`), si la hay.
+        self.cache = None
+        # Envío de push de la corrida (`push_notify.PushSender`), si lo hay.
+        self.push = None
+        self._lock = threading.Lock()
+
+    @property
+    def nombres_categorias(self):
+        return [c['name'] for c in self.cat_tree]
+
+    @property
+    def recientes(self):
+        """Muestra de transacciones recientes que se incluye en el prompt."""
+        return self.historial[:RECENT_LIMIT]
+
+    def recordar(self, tx):
+        """Añade una transacción recién guardada a las recientes y a la memoria.
+
+        Solo se recalcula la entrada del comercio afectado. La memoria se
+        reemplaza (no se muta) porque los hilos del pool la leen a la vez.
+        """
+        self.historial = [_historial_entry(tx)] + self.historial[:RECENT_LIMIT - 1]
+        key = add_to_merchant_counts(self.conteos, tx)
+        if key:
+            self.memoria = {**self.memoria, key: memory_entry(self.conteos[key])}
+            self.indice.add(key)
+            self.selector.add(key)
+            self.clasificador.add(tx)
+
+    def contar_plantilla(self):
+        """Cuenta un correo resuelto por plantilla (sin llamar a Gemini)."""
+        with self._lock:
+            self.plantillas += 1
+
+    def contar_tokens(self, prompt, usage=None):
+        """Suma los tokens de prompt de una llamada a Gemini y los devuelve.
+
+        Usa `usage_metadata.prompt_token_count` de la respuesta y, si no viene,
+        una estimación local.
+        """
+        tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+        with self._lock:
+            self.tokens_prompt += tokens
+            self.llamadas_ia += 1
+        return tokens
+
+
+def _historial_entry(tx):
+    """Campos de una transacción que usan la memoria y el prompt."""
+    return {
+        'title': tx.get('title'),
+        'category': tx.get('category'),
+        'subcategory': tx.get('subcategory', ''),
+        'context': tx.get('context', 'personal'),
+        'type': tx.get('type'),
+    }
 
 
 def _prefetch_context(db):
     """Trae desde Firestore el contexto necesario para el análisis:
-    árbol de categorías (con subcategorías), cuentas, monedas y las últimas
-    transacciones registradas (para inferir contexto y normalizar subcategoría).
+    árbol de categorías (con subcategorías), cuentas, monedas, la memoria de
+    comercios persistida (un solo documento con todo el historial) y las
+    últimas transacciones registradas (para inferir contexto).
+
+    Devuelve un `SyncContext`; se llama una vez por corrida, no por correo.
     """
     doc = db.collection('finance_settings').document('default').get()
-    categorias_raw, cuentas, monedas = [], [], []
+    categorias_raw, cuentas, monedas, tarjetas = [], [], [], {}
     if doc.exists:
         data = doc.to_dict()
         categorias_raw = data.get('categories', [])
         cuentas = data.get('accounts', [])
         monedas = data.get('currencies', [])
+        tarjetas = data.get('cardDigits', {})
 
     # Normalizar categorías a {name, subcategories}
     cat_tree = []
@@ -179,119 +347,169 @@ def _prefetch_context(db):
         else:
             cat_tree.append({'name': c, 'subcategories': []})
 
-    # Historial para la memoria de comercios (ventana amplia: cubre comercios
-    # antiguos que no entran en "las últimas 20"). De aquí salen también las
-    # recientes que se muestran como muestra en el prompt.
-    historial = []
+    conteos = None
+    try:
+        conteos = load_merchant_counts(db)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer la memoria de comercios: {e}")
+
+    # Sin memoria persistida, se construye al vuelo con una ventana amplia del
+    # historial (cubre comercios que no entran en "las últimas 20").
+    limite = RECENT_LIMIT if conteos is not None else MEMORY_HISTORY_LIMIT
+    historial, docs = [], []
     try:
         docs = db.collection('finance_transactions') \
             .order_by('date', direction=firestore.Query.DESCENDING) \
-            .limit(MEMORY_HISTORY_LIMIT).get()
+            .limit(limite).get()
         for d in docs:
-            tx = d.to_dict()
-            historial.append({
-                'title': tx.get('title'),
-                'category': tx.get('category'),
-                'subcategory': tx.get('subcategory', ''),
-                'context': tx.get('context', 'personal'),
-                'type': tx.get('type'),
-            })
+            historial.append(_historial_entry(d.to_dict()))
     except Exception as e:
         print(f"⚠️ No se pudo traer el historial: {e}")
 
-    memoria = build_merchant_memory(historial)
-    recientes = historial[:20]
-    return cat_tree, cuentas, monedas, recientes, memoria
+    # Índice de duplicados: el persistido (lo importado por el sync) más las
+    # transacciones recientes que no están en él (las registradas en la app).
+    hoy = datetime.datetime.now(BOGOTA).date()
+    try:
+        dedup = load_dedup_index(db, hoy)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer el índice de duplicados: {e}")
+        dedup = DedupIndex()
+    desde = (hoy - datetime.timedelta(days=DEDUP_WINDOW_DAYS)).isoformat()
+    for d in docs:
+        tx = d.to_dict()
+        if d.id not in dedup.entries and str(tx.get('date') or '') >= desde:
+            dedup.add(d.id, tx, timed=False)
+
+    if conteos is None:
+        print("ℹ️ No hay memoria de comercios persistida; se usa el historial reciente. "
+              "Créala con `python3 merchant_memory_store.py --rebuild`.")
+        conteos = merchant_counts(historial)
+
+    return SyncContext(cat_tree, cuentas, monedas, historial, conteos, tarjetas, dedup)
 
 
-def procesar_texto_con_ia(texto, db, client):
+def procesar_texto_con_ia(texto, ctx, client):
     """Analiza el correo con Gemini y devuelve la transacción enriquecida.
 
     En una sola llamada extrae la transacción y la normaliza (categoría,
     subcategoría y contexto), usando como contexto el árbol de categorías y el
-    historial reciente. Devuelve (datos, cat_tree).
+    historial reciente del `SyncContext` de la corrida. Devuelve los datos, o
+    None si el análisis falla.
     """
-    print("🧠 Obteniendo contexto desde Firestore...")
-    cat_tree, cuentas, monedas, recientes, memoria = _prefetch_context(db)
-    nombres_categorias = [c['name'] for c in cat_tree]
-    memoria_prompt = memory_for_prompt(memoria)
-
-    prompt = f"""Eres un experto asistente financiero que lee correos de notificaciones bancarias.
-Extrae los datos de la transacción descrita en el correo y devuelve ÚNICAMENTE un objeto JSON válido.
-Ignora firmas, saludos, publicidad o información legal. Céntrate en la transacción (quién cobró y cuánto).
-Si el correo es una notificación de un pago que TÚ hiciste, type = 'debit'.
-
-¡MUY IMPORTANTE! Devuelve únicamente {{"type": "ignore"}} si el correo:
-- indica que la transacción "no fue exitosa", fue "Rechazada", "Fallida", "Declinada", etc.; o
-- NO es una transacción individual: extractos / estados de cuenta, resúmenes mensuales,
-  alertas de saldo o de cupo disponible, códigos OTP, publicidad o avisos de seguridad.
-
-Categorías disponibles (cada una con sus subcategorías válidas):
-{json.dumps(cat_tree, ensure_ascii=False, indent=2)}
-
-Cuentas/tarjetas disponibles: {cuentas}
-Monedas disponibles: {monedas}
-
-Memoria de comercios (clasificación HABITUAL por comercio — úsala como prior fuerte para
-categoría, subcategoría y contexto, y para imitar cómo se suele titular cada comercio):
-{json.dumps(memoria_prompt, ensure_ascii=False, indent=2)}
-
-Transacciones recientes (muestra adicional para inferir contexto):
-{json.dumps(recientes, ensure_ascii=False, indent=2)}
-
-Reglas para los campos:
-- type: 'debit' (gasto), 'credit' (ingreso) o 'ignore' (fallida/declinada o no-transacción).
-- amount: el monto numérico exacto, positivo y sin símbolos de moneda.
-- title: un resumen muy corto del concepto/comercio. Si el comercio aparece en la memoria, titúlalo igual que ahí.
-- currency: elige una opción de {monedas}, o 'COP' si el texto usa $, pesos, etc.
-- category: elige una opción de {nombres_categorias}. Si no aplica ninguna, usa 'Otros'.
-- subcategory: elige una subcategoría VÁLIDA de la categoría que elegiste (ver lista de arriba). Si ninguna aplica o esa categoría no tiene subcategorías, usa "".
-- card: elige una opción de {cuentas} según la data del correo.
-- context: 'personal' o 'business'. Infiérelo del título, el correo y el historial; por defecto 'personal'.
-- comments: nota con el DETALLE concreto que aparezca en el correo, no un genérico. Si el correo
-  lista productos (p. ej. un domicilio), enuméralos; si es un transporte e incluye origen/destino, ponlos;
-  si es una transferencia, indica la contraparte (quién envía o recibe). Si el correo no trae detalle
-  específico, resume brevemente la transacción.
-
-Texto del correo:
-"{texto}"
-
-Devuelve solo el JSON, sin explicación ni markdown. Formato esperado:
-{{"type": "", "amount": 0, "title": "", "currency": "", "category": "", "subcategory": "", "card": "", "context": "", "comments": ""}}
-
-Si la transacción no fue exitosa o no es una transacción individual, devuelve únicamente:
-{{"type": "ignore"}}
-"""
+    datos = extraer_con_ia(texto, ctx, client)
+    return enriquecer_transaccion(datos, ctx) if datos else None
+
+
+def enriquecer_transaccion(datos, ctx):
+    """Post-procesa la salida del modelo con la memoria y los catálogos actuales.
+
+    Va aparte de la llamada al modelo para que, en el pipeline concurrente, se
+    aplique en orden y con la memoria ya actualizada por los correos previos.
+    """
+    # Post-corrección determinista: si el comercio es conocido y consistente,
+    # fijamos la clasificación desde la memoria (no toca amount/title/comments).
+    datos, info = apply_merchant_memory(datos, ctx.memoria, index=ctx.indice)
+    if info:
+        print(f"🧩 Memoria de comercios ajustó {list(info['changed'])} para '{info['merchant']}' (visto {info['count']}×).")
+
+    # Validación contra catálogos (categoría válida, cuenta válida).
+    return validate_classification(datos, ctx.nombres_categorias, ctx.cuentas,
+                                   account_index=ctx.indice_cuentas)
+
+
+def _desde_cache(texto, ctx):
+    """`(clave, datos)` de la caché de extracciones: `datos` es None si no hay
+    acierto y `clave` es None si la corrida no usa caché."""
+    if ctx.cache is None:
+        return None, None
+    clave = cache_key(texto, PROMPT_VERSION, GEMINI_MODEL)
+    return clave, ctx.cache.get(clave)
+
+
+def _llamar_gemini(prompt, ctx, client, schema=TRANSACTION_SCHEMA):
+    """Una llamada a Gemini con salida JSON restringida a `schema` (ver
+    gemini_client.py: límite de tasa y reintentos de errores transitorios).
+    Devuelve el JSON parseado (lanza excepción si se agotan los intentos) y
+    suma los tokens al contexto."""
+    datos, usage = client.generate_json(prompt, schema)
+    tokens = ctx.contar_tokens(prompt, usage)
+    count('gemini.prompt_tokens', tokens)
+    print(f"✅ Análisis JSON completado con éxito ({tokens} tokens de prompt).")
+    return datos
+
+
+def extraer_con_ia(texto, ctx, client):
+    """Llama a Gemini y devuelve el JSON de la transacción tal cual (sin
+    post-corrección), o None si la llamada o el parseo fallan.
+
+    Solo lee el `SyncContext`, así que es seguro llamarla desde varios hilos.
+    Si el contexto trae una caché de extracciones y el mismo cuerpo ya se
+    analizó con el mismo prompt y modelo, no se llama a Gemini.
+    """
+    clave, datos = _desde_cache(texto, ctx)
+    if datos is not None:
+        print("♻️ Extracción tomada de la caché (sin llamar a Gemini).")
+        return datos
+
+    prompt = build_prompt(texto, ctx.cat_tree, ctx.cuentas, ctx.monedas,
+                          ctx.memoria, ctx.recientes, ctx.selector)
 
     print(f"🧠 Analizando correo con Gemini ({GEMINI_MODEL})...")
     try:
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction="Eres un asistente financiero. Respondes únicamente con un objeto JSON válido.",
-                response_mime_type="application/json",
-                temperature=0,
-            ),
-        )
-        datos_extraidos = json.loads(response.text)
-        print("✅ Análisis JSON completado con éxito.")
-
-        # Post-corrección determinista: si el comercio es conocido y consistente,
-        # fijamos la clasificación desde la memoria (no toca amount/title/comments).
-        datos_extraidos, info = apply_merchant_memory(datos_extraidos, memoria)
-        if info:
-            print(f"🧩 Memoria de comercios ajustó {list(info['changed'])} para '{info['merchant']}' (visto {info['count']}×).")
-
-        # Validación contra catálogos (categoría válida, cuenta válida).
-        datos_extraidos = validate_classification(datos_extraidos, nombres_categorias, cuentas)
-        return datos_extraidos, cat_tree
+        datos_extraidos = _llamar_gemini(prompt, ctx, client)
     except Exception as e:
         print(f"\n❌ Error analizando o interpretando la respuesta de Gemini: {e}")
-        return None, cat_tree
+        return None
+    if clave:
+        ctx.cache.put(clave, datos_extraidos)
+    return datos_extraidos
 
 
-def registrar_transaccion(datos_ia, tx_dt, db, cat_tree, dry_run=False):
+def extraer_lote_con_ia(correos, ctx, client):
+    """Extrae varios correos con UNA llamada a Gemini.
+
+    `correos` es una lista de `(id, texto)`. Devuelve `{id: datos}` con los
+    que se pudieron extraer. Los aciertos de caché no viajan en el lote; los
+    que la respuesta no trae bien formados (arreglo roto o incompleto) se
+    reintentan uno a uno con `extraer_con_ia`.
+    """
+    resultados, claves, faltan = {}, {}, []
+    for msg_id, texto in correos:
+        claves[msg_id], datos = _desde_cache(texto, ctx)
+        if datos is not None:
+            resultados[msg_id] = datos
+        else:
+            faltan.append((msg_id, texto))
+    if len(correos) > len(faltan):
+        print(f"♻️ {len(correos) - len(faltan)} extracción(es) tomadas de la caché.")
+
+    if len(faltan) > 1:
+        prompt = build_batch_prompt(faltan, ctx.cat_tree, ctx.cuentas, ctx.monedas,
+                                    ctx.memoria, ctx.recientes, ctx.selector)
+        print(f"🧠 Analizando {len(faltan)} correos en una sola llamada a Gemini ({GEMINI_MODEL})...")
+        try:
+            respuesta = _llamar_gemini(prompt, ctx, client, BATCH_SCHEMA)
+            lote = parse_batch_response(respuesta, [msg_id for msg_id, _ in faltan])
+        except Exception as e:
+            print(f"\n❌ Error en la extracción por lote: {e}")
+            lote = {}
+        for msg_id, datos in lote.items():
+            resultados[msg_id] = datos
+            if claves[msg_id]:
+                ctx.cache.put(claves[msg_id], datos)
+        faltan = [(msg_id, texto) for msg_id, texto in faltan if msg_id not in lote]
+        if faltan:
+            print(f"↪️ {len(faltan)} correo(s) sin resultado válido en el lote; se extraen uno a uno.")
+
+    for msg_id, texto in faltan:
+        datos = extraer_con_ia(texto, ctx, client)
+        if datos:
+            resultados[msg_id] = datos
+    return resultados
+
+
+@timed('registrar_transaccion')
+def registrar_transaccion(datos_ia, tx_dt, db, ctx, dry_run=False, lote=None):
     """Guarda la transacción extraída por la IA en Firestore.
 
     `tx_dt` es el datetime (tz Colombia) del momento del correo bancario, que
@@ -300,6 +518,11 @@ def registrar_transaccion(datos_ia, tx_dt, db, cat_tree, dry_run=False):
 
     Con `dry_run=True` arma y muestra la transacción pero NO escribe en
     Firestore ni envía push (para pruebas en producción sin tocar la data).
+
+    Si se pasa `lote` (un `SyncBatch`), la escritura y el push quedan
+    encolados hasta que el lote se confirme; si no, se escribe al instante.
+    En ambos casos la transacción se incorpora al `SyncContext` de la corrida
+    para que los siguientes correos ya la tengan en la memoria de comercios.
     """
     # Manejar transacciones declinadas
     if datos_ia.get('type') == 'ignore':
@@ -318,7 +541,7 @@ def registrar_transaccion(datos_ia, tx_dt, db, cat_tree, dry_run=False):
     # Validar subcategory contra las subcategorías válidas de la categoría elegida
     subcategory = datos_ia.get('subcategory', '') or ''
     valid_subs = []
-    for c in cat_tree:
+    for c in ctx.cat_tree:
         if c['name'] == category:
             valid_subs = c.get('subcategories', [])
             break
@@ -355,93 +578,336 @@ def registrar_transaccion(datos_ia, tx_dt, db, cat_tree, dry_run=False):
     for k, v in nueva_transaccion.items():
         print(f"   {k}: {v}")
 
+    # La misma compra notificada dos veces (mismo comercio, minutos de
+    # diferencia) no se guarda; si solo se parece (falta el comercio o
+    # coincide el día, p. ej. ya registrada a mano), se guarda marcada.
+    coincidencia = ctx.dedup.match(nueva_transaccion)
     if dry_run:
+        if coincidencia:
+            print(f"🔁 DRY-RUN: coincide con la transacción {coincidencia[1]} ({coincidencia[0]}).")
         print("🧪 DRY-RUN: no se escribe en Firebase ni se envía push.")
         return True
+    if coincidencia and coincidencia[0] == DUPLICATE:
+        count('dedup.duplicate')
+        print(f"🔁 Duplicado de la transacción {coincidencia[1]} (mismo monto, tarjeta y comercio "
+              "en minutos). No se guarda.")
+        return True
+    if coincidencia:
+        count('dedup.possible')
+        nueva_transaccion["possibleDuplicateOf"] = coincidencia[1]
+        print(f"⚠️ Posible duplicado de la transacción {coincidencia[1]}. Se guarda marcada.")
+
+    if lote is not None:
+        tx_id = lote.agregar_transaccion(nueva_transaccion, ctx.dedup)
+        print(f"📝 Registro encolado para guardar con el bloque (ID: {tx_id})")
+        ctx.recordar(nueva_transaccion)
+        return True
 
     try:
-        _, doc_ref = db.collection('finance_transactions').add(nueva_transaccion)
+        # La transacción, su suma a la memoria de comercios y a los totales
+        # del mes van en un solo WriteBatch (todo o nada).
+        doc_ref = db.collection('finance_transactions').document()
+        batch = db.batch()
+        batch.set(doc_ref, nueva_transaccion)
+        increment_merchant(db, nueva_transaccion, batch)
+        increment_rollup(db, nueva_transaccion, batch)
+        record_dedup(db, doc_ref.id, dedup_entry(nueva_transaccion), batch)
+        podadas = set(ctx.dedup.podadas)
+        prune_dedup(db, podadas, batch)
+        count('firestore.commit')
+        batch.commit()
+        ctx.dedup.podadas -= podadas
+        ctx.dedup.add(doc_ref.id, nueva_transaccion)
         print(f"✅ Éxito: Registro guardado en Firebase (ID: {doc_ref.id})")
-        # El push es best-effort: nunca debe romper el sync.
-        try:
-            enviar_push_pending(db, doc_ref.id, nueva_transaccion)
-        except Exception as e:
-            print(f"⚠️ No se pudo enviar la notificación push (no crítico): {e}")
+        ctx.recordar(nueva_transaccion)
+        if ctx.push:
+            ctx.push.notificar(doc_ref.id, nueva_transaccion)
         return True
     except Exception as e:
         print(f"❌ Error al guardar en Firebase: {e}")
         return False
 
 
-def enviar_push_pending(db, tx_id, tx):
-    """Notifica por push (Web Push/FCM) que entró un movimiento pendiente.
+@timed('mark_as_processed')
+def mark_as_processed(service, msg_ids, label_id_to_remove):
+    """Remueve la etiqueta de los correos en Gmail (un solo `batchModify`,
+    que acepta hasta 1000 IDs por llamada)."""
+    if isinstance(msg_ids, str):
+        msg_ids = [msg_ids]
+    for i in range(0, len(msg_ids), 1000):
+        chunk = msg_ids[i:i + 1000]
+        try:
+            count('gmail.batchModify')
+            service.users().messages().batchModify(
+                userId='me',
+                body={'ids': chunk, 'removeLabelIds': [label_id_to_remove]}
+            ).execute()
+            print(f"✅ Etiqueta removida de {len(chunk)} correo(s)")
+        except Exception as e:
+            print(f"⚠️ Error intentando remover etiqueta: {e}")
+
+
+class SyncBatch:
+    """Escrituras de un bloque de correos, confirmadas juntas al final del bloque.
 
-    Lee todos los tokens registrados por la app web en la colección
-    `fcm_tokens` (doc id == token) y envía un mensaje data-only para que el
-    service worker controle la presentación y el deep link `?editTx=<id>`.
-    Limpia los tokens que FCM reporta como inválidos.
+    Las transacciones nuevas (con su suma a la memoria de comercios y a los
+    totales del mes) y los marcadores de `processed_gmail_ids` van en
+    WriteBatch de Firestore (una RPC por cada `FIRESTORE_BATCH_LIMIT`
+    operaciones); las etiquetas se quitan con un `batchModify` y después los
+    push se encolan en el `PushSender` de la corrida. El orden por correo se
+    mantiene: la etiqueta solo se quita si su transacción y su marcador ya
+    quedaron guardados, así que un fallo deja el correo etiquetado para
+    reintentar en la próxima corrida.
     """
-    tokens = [d.id for d in db.collection('fcm_tokens').stream()]
-    if not tokens:
-        print("ℹ️ No hay dispositivos suscritos a notificaciones. Se omite push.")
-        return
 
-    signo = '-' if tx.get('type') == 'debit' else '+'
-    try:
-        monto = f"{signo}{float(tx.get('amount', 0)):,.0f} {tx.get('currency', 'COP')}"
-    except (TypeError, ValueError):
-        monto = tx.get('currency', 'COP')
-    titulo = tx.get('title', 'Movimiento')
-    categoria = tx.get('category', '')
-    body = f"{monto} · {titulo}" + (f" · {categoria}" if categoria else "")
-    url = f"/?editTx={tx_id}"
-
-    message = messaging.MulticastMessage(
-        tokens=tokens,
-        # Data-only: el SW arma la notificación (evita duplicados en Chrome).
-        data={
-            'txId': str(tx_id),
-            'url': url,
-            'title': '🧾 Pendiente de revisión',
-            'body': body,
-        },
-        # Sin fcm_options.link: FCM exige URL absoluta HTTPS ahí, pero el deep
-        # link lo resuelve nuestro service worker desde data.url (relativo OK).
-        webpush=messaging.WebpushConfig(
-            headers={'Urgency': 'high'},
-        ),
+    def __init__(self, db, service, label_id, push=None):
+        self.db = db
+        self.service = service
+        self.label_id = label_id
+        self.push = push
+        self._ops = []          # fn(batch): una escritura cada una
+        self._marcadores = 0
+        self._labels = []       # IDs de Gmail a los que quitar la etiqueta
+        self._pushes = []       # (tx_id, tx)
+        self._dedup = None      # índice cuyas huellas viejas borra este bloque
+        self._podadas = set()
+        self._huellas = []      # (índice, tx_id) sumadas antes de confirmar
+
+    def agregar_transaccion(self, tx, dedup=None):
+        """Encola una transacción nueva (y su suma a la memoria de comercios,
+        a los totales del mes y al índice de duplicados) y devuelve su ID (ya
+        reservado). Con `dedup`, la huella entra al índice de la corrida en el
+        acto, para que el resto del bloque ya la vea (si el bloque no se
+        guarda, `confirmar` la vuelve a sacar), y el bloque borra del
+        documento las huellas viejas que quedaron al cargarlo."""
+        ref = self.db.collection('finance_transactions').document()
+        entry = dedup.add(ref.id, tx) if dedup is not None else dedup_entry(tx)
+        if dedup is not None and entry is not None:
+            self._huellas.append((dedup, ref.id))
+        if dedup is not None and dedup.podadas and self._dedup is None:
+            self._dedup, self._podadas = dedup, set(dedup.podadas)
+            self._ops.append(lambda batch: prune_dedup(self.db, self._podadas, batch))
+        self._ops.append(lambda batch: batch.set(ref, tx))
+        self._ops.append(lambda batch: increment_merchant(self.db, tx, batch))
+        self._ops.append(lambda batch: increment_rollup(self.db, tx, batch))
+        self._ops.append(lambda batch: record_dedup(self.db, ref.id, entry, batch))
+        self._pushes.append((ref.id, tx))
+        return ref.id
+
+    def marcar_procesado(self, msg_id, guardar=True):
+        """Encola quitar la etiqueta del correo y, si `guardar`, su marcador
+        de procesado (no hace falta si ya estaba procesado)."""
+        if guardar:
+            ref = self.db.collection(PROCESSED_COLLECTION).document(msg_id)
+            self._ops.append(lambda batch: batch.set(ref, {'processedAt': firestore.SERVER_TIMESTAMP}))
+            self._marcadores += 1
+        self._labels.append(msg_id)
+
+    def confirmar(self):
+        """Escribe el bloque en Firestore, quita las etiquetas y envía los push.
+
+        Devuelve False (y no toca etiquetas ni envía push) si falla la
+        escritura en Firestore; las huellas del bloque salen del índice de
+        duplicados, para que los reintentos no se descarten contra
+        transacciones que no se guardaron.
+        """
+        try:
+            for i in range(0, len(self._ops), FIRESTORE_BATCH_LIMIT):
+                batch = self.db.batch()
+                for op in self._ops[i:i + FIRESTORE_BATCH_LIMIT]:
+                    op(batch)
+                count('firestore.commit')
+                with span('firestore_commit'):
+                    batch.commit()
+        except Exception as e:
+            print(f"❌ Error al guardar el bloque en Firebase: {e}")
+            for dedup, tx_id in self._huellas:
+                dedup.remove(tx_id)
+            return False
+        if self._dedup is not None:
+            self._dedup.podadas -= self._podadas
+        if self._ops:
+            print(f"✅ Éxito: {len(self._pushes)} registro(s) y {self._marcadores} "
+                  "marcador(es) guardados en Firebase.")
+
+        if self._labels:
+            mark_as_processed(self.service, self._labels, self.label_id)
+
+        if self.push:
+            for tx_id, tx in self._pushes:
+                self.push.notificar(tx_id, tx)
+        return True
+
+
+def _email_datetime(message_data):
+    """Momento del correo (≈ momento de la transacción) en hora local de Colombia.
+
+    internalDate viene en epoch ms UTC; lo convertimos a UTC-5 (Colombia no
+    tiene horario de verano). De aquí salen la fecha y la hora que guardamos.
+    """
+    internal_date_ms = int(message_data.get('internalDate', 0))
+    return (
+        datetime.datetime.fromtimestamp(internal_date_ms / 1000.0, tz=BOGOTA)
+        if internal_date_ms else datetime.datetime.now(BOGOTA)
     )
 
-    response = messaging.send_each_for_multicast(message)
-    print(f"🔔 Push enviado: {response.success_count} ok, {response.failure_count} fallidos.")
 
-    for token, resp in zip(tokens, response.responses):
-        if resp.success:
+def separar_extractos(service, ids, label_id=None):
+    """Gate barato pre-descarga: baja solo el asunto (format='metadata') de los
+    correos `ids` y separa los que parecen extractos / estados de cuenta, que
+    no son transacciones individuales y se descartan sin bajar el cuerpo ni
+    llamar al modelo.
+
+    Con `label_id`, descarta además los correos que ya no tienen la etiqueta
+    (p. ej. reintentos o eventos del historial que otro proceso ya resolvió).
+    Los correos borrados (404) se descartan en silencio.
+
+    Devuelve `(a_procesar, extractos, errores)`: listas de IDs (en el orden de
+    `ids`), la de extractos como tuplas (id, asunto).
+    """
+    metadatos, fallidos = get_messages(service, ids, fmt='metadata', metadata_headers=['Subject'])
+    a_procesar, extractos, errores = [], [], []
+    for msg_id in ids:
+        if msg_id in fallidos or msg_id not in metadatos:
+            if http_status(fallidos.get(msg_id)) == 404:
+                continue
+            print(f"⚠️ No se pudo traer el correo {msg_id} desde Gmail: {fallidos.get(msg_id)}")
+            errores.append(msg_id)
+            continue
+        if label_id and label_id not in metadatos[msg_id].get('labelIds', []):
             continue
-        exc = resp.exception
-        if isinstance(exc, messaging.UnregisteredError) or 'not-registered' in str(getattr(exc, 'code', '')).lower():
-            db.collection('fcm_tokens').document(token).delete()
-            print(f"🧹 Token inválido eliminado: {token[:12]}…")
+        subject = message_header(metadatos[msg_id], 'Subject')
+        if looks_like_statement(subject):
+            extractos.append((msg_id, subject))
+        else:
+            a_procesar.append(msg_id)
+    return a_procesar, extractos, errores
+
+
+def preparar_correo(message_data, ctx):
+    """Etapa de CPU de un correo ya descargado: parseo y camino rápido por
+    plantilla. Devuelve el mismo dict que `analizar_correo`, o status
+    'pendiente' con el `texto` que hay que mandar a Gemini."""
+    msg_id = message_data.get('id')
+    result = {'id': msg_id, 'tx_dt': _email_datetime(message_data), 'datos': None}
+
+    with span('email_text'):
+        body_text = email_text(message_data.get('payload', {}), MAX_BODY_CHARS)
+    if not body_text:
+        return {**result, 'status': 'empty'}
+
+    # Limitar el tamaño del texto enviado al modelo
+    truncated_text = body_text[:MAX_BODY_CHARS]
+    print(f"📄 [{msg_id}] Texto detectado (resumen): {truncated_text[:100].replace(chr(10), ' ')}...")
+
+    # Camino rápido: plantillas conocidas + memoria de comercios, sin LLM.
+    with span('plantillas'):
+        datos, motivo = extract_with_template(truncated_text, ctx.memoria, ctx.cuentas,
+                                              ctx.monedas, index=ctx.indice, card_map=ctx.tarjetas,
+                                              classifier=ctx.clasificador)
+    if datos:
+        ctx.contar_plantilla()
+        count('plantillas')
+        print(f"⚡ [{msg_id}] Resuelto con la plantilla '{motivo}' sin llamar a Gemini.")
+        return {**result, 'status': 'ok', 'datos': datos}
+    if motivo != "sin plantilla":
+        print(f"↪️ [{msg_id}] Plantilla no concluyente ({motivo}); se usa Gemini.")
+    return {**result, 'status': 'pendiente', 'texto': truncated_text}
+
+
+def _con_datos(res, datos):
+    """Cierra un resultado 'pendiente' con lo que devolvió Gemini."""
+    res = {k: v for k, v in res.items() if k != 'texto'}
+    if not datos:
+        return {**res, 'status': 'ia_error'}
+    return {**res, 'status': 'ok', 'datos': datos}
+
+
+def analizar_correo(message_data, ctx, client):
+    """Etapas de CPU + modelo de un correo ya descargado: parseo y extracción
+    con Gemini.
+
+    No escribe nada (ni Firestore ni etiquetas), así que puede correr en un
+    hilo del pool. Devuelve un dict con `id` y `status`:
+      - 'empty':     no hay texto legible en el correo.
+      - 'ia_error':  el modelo falló o devolvió algo no interpretable.
+      - 'ok':        `datos` trae el JSON crudo del modelo y `tx_dt` la fecha.
+    """
+    res = preparar_correo(message_data, ctx)
+    if res['status'] != 'pendiente':
+        return res
+    return _con_datos(res, extraer_con_ia(res['texto'], ctx, client))
+
+
+def _analizar_por_lotes(descargados, ctx, client, pool, lote_ia):
+    """Analiza los correos agrupando de a `lote_ia` en cada llamada a Gemini
+    (ver `extraer_lote_con_ia`). Con `pool`, los lotes van en paralelo.
+    Devuelve los resultados en el orden de `descargados`."""
+    preparados = [preparar_correo(m, ctx) for m in descargados]
+    pendientes = [(r['id'], r['texto']) for r in preparados if r['status'] == 'pendiente']
+    grupos = [pendientes[i:i + lote_ia] for i in range(0, len(pendientes), lote_ia)]
+
+    def _extraer(grupo):
+        return extraer_lote_con_ia(grupo, ctx, client)
+
+    extraidos = {}
+    for datos in (pool.map(_extraer, grupos) if pool else map(_extraer, grupos)):
+        extraidos.update(datos)
+    return [_con_datos(r, extraidos.get(r['id'])) if r['status'] == 'pendiente' else r
+            for r in preparados]
+
+
+def pipeline_correos(ids, service, ctx, client, pool=None, lote_ia=1):
+    """Descarga y analiza un bloque de correos y genera los resultados EN ORDEN.
+
+    Los cuerpos se bajan con una request batch de Gmail (un round trip por
+    bloque). Sin `pool` el análisis es secuencial y perezoso: cada correo se
+    analiza solo cuando el anterior ya se guardó. Con un pool de hilos, el
+    parseo y la llamada a Gemini corren en paralelo mientras el llamador
+    persiste los resultados uno a uno, en el orden original; así se conserva
+    el orden guardar → quitar etiqueta → marcar procesado de cada correo. Los
+    correos que no se pudieron descargar salen con status 'error'.
+
+    Con `lote_ia > 1` se extraen varios correos por llamada a Gemini; el
+    bloque se analiza completo antes de empezar a guardar.
+    """
+    with span('get_messages'):
+        mensajes, fallidos = get_messages(service, ids, fmt='full')
+    for msg_id in ids:
+        if msg_id not in mensajes:
+            print(f"⚠️ No se pudo traer el correo {msg_id} desde Gmail: {fallidos.get(msg_id)}")
+
+    descargados = [mensajes[msg_id] for msg_id in ids if msg_id in mensajes]
+    if lote_ia > 1:
+        analizados = iter(_analizar_por_lotes(descargados, ctx, client, pool, lote_ia))
+    elif pool:
+        analizados = iter(pool.map(lambda m: analizar_correo(m, ctx, client), descargados))
+    else:
+        analizados = (analizar_correo(m, ctx, client) for m in descargados)
+
+    for msg_id in ids:
+        if msg_id in mensajes:
+            yield next(analizados)
+        else:
+            yield {'id': msg_id, 'status': 'error'}
 
 
-def mark_as_processed(service, msg_id, label_id_to_remove):
-    """Remueve la etiqueta del correo en Gmail."""
-    try:
-        service.users().messages().modify(
-            userId='me',
-            id=msg_id,
-            body={'removeLabelIds': [label_id_to_remove]}
-        ).execute()
-        print(f"✅ Etiqueta removida del correo {msg_id}")
-    except Exception as e:
-        print(f"⚠️ Error intentando remover etiqueta: {e}")
+def _pool(workers):
+    """Pool acotado de hilos para el análisis con Gemini (None si workers <= 1)."""
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='correo') if workers > 1 else None
 
 
-def reprocess_last_emails(db, service, client, n, dry_run):
+def reprocess_last_emails(db, service, client, n, dry_run, ctx=None, workers=1, cache=None,
+                          lote_ia=1, push=None):
     """Modo PRUEBA: re-procesa los últimos N correos ya procesados (ordenados por
     processedAt). Pensado para validar el pipeline en producción tras un merge,
     sin esperar a un correo real. Con dry_run=True NO escribe en Firestore, NO
     envía push y NO toca etiquetas de Gmail.
+
+    `ctx` es el `SyncContext` de la corrida; si no se pasa, se carga aquí una
+    sola vez para todos los correos. Con `cache`, los cuerpos ya analizados en
+    validaciones anteriores no vuelven a pasar por Gemini; con `push` (y sin
+    dry_run) se notifican las transacciones re-guardadas.
     """
     modo = "DRY-RUN (no escribe nada)" if dry_run else "⚠️ ESCRIBE en Firestore"
     print(f"🧪 Modo prueba — re-procesando los últimos {n} correos procesados · {modo}")
@@ -454,39 +920,40 @@ def reprocess_last_emails(db, service, client, n, dry_run):
         print("⚠️ No hay correos en el historial de procesados.")
         return
 
-    for i, msg_id in enumerate(ids, 1):
+    ids, extractos, _ = separar_extractos(service, ids)
+    for msg_id, subject in extractos:
+        print(f"🚫 {msg_id} sería ignorado por el gate de extractos ('{subject[:60]}').")
+    if not ids:
+        return
+
+    if ctx is None:
+        print("🧠 Obteniendo contexto desde Firestore...")
+        with span('_prefetch_context'):
+            ctx = _prefetch_context(db)
+    if cache is not None:
+        ctx.cache = cache
+    if push is not None:
+        ctx.push = push
+
+    pool = _pool(workers)
+    resultados = (res for i in range(0, len(ids), BATCH_SIZE)
+                  for res in pipeline_correos(ids[i:i + BATCH_SIZE], service, ctx, client, pool,
+                                                 lote_ia))
+    for i, res in enumerate(resultados, 1):
+        msg_id = res['id']
         print("\n" + "-" * 50)
         print(f"📩 [{i}/{len(ids)}] Re-procesando correo {msg_id}")
-        try:
-            message_data = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
-        except Exception as e:
-            print(f"⚠️ No se pudo traer el correo {msg_id} desde Gmail: {e}")
-            continue
-
-        payload = message_data.get('payload', {})
-        subject = next((h.get('value', '') for h in payload.get('headers', [])
-                        if h.get('name', '').lower() == 'subject'), '')
-        if looks_like_statement(subject):
-            print(f"🚫 Sería ignorado por el gate de extractos ('{subject[:60]}').")
-            continue
-
-        internal_date_ms = int(message_data.get('internalDate', 0))
-        tx_dt = (
-            datetime.datetime.fromtimestamp(internal_date_ms / 1000.0, tz=BOGOTA)
-            if internal_date_ms else datetime.datetime.now(BOGOTA)
-        )
-
-        body_text = extract_email_body(payload)
-        if not body_text:
+        if res['status'] == 'empty':
             print(f"⚠️ No se pudo extraer texto legible del correo {msg_id}")
-            continue
-
-        datos_ia, cat_tree = procesar_texto_con_ia(body_text[:MAX_BODY_CHARS], db, client)
-        if datos_ia:
-            registrar_transaccion(datos_ia, tx_dt, db, cat_tree, dry_run=dry_run)
-        else:
+        elif res['status'] == 'ia_error':
             print(f"⚠️ El correo {msg_id} falló en la interpretación por IA.")
+        elif res['status'] == 'ok':
+            datos_ia = enriquecer_transaccion(res['datos'], ctx)
+            registrar_transaccion(datos_ia, res['tx_dt'], db, ctx, dry_run=dry_run)
+    if pool:
+        pool.shutdown()
 
+    _resumen_ia(ctx)
     print("\n🧪 Fin del modo prueba.")
 
 
@@ -498,99 +965,231 @@ def main():
                         help="Modo PRUEBA: re-procesa los últimos N correos ya procesados (no toca la etiqueta).")
     parser.add_argument('--dry-run', action='store_true',
                         help="No escribe en Firestore ni envía push. Úsalo con --reprocess-last para validar tras un merge.")
+    parser.add_argument('--full-scan', action='store_true',
+                        help="Ignora el historyId guardado y escanea toda la etiqueta (re-siembra el sync incremental).")
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help="Correos que se analizan en paralelo con Gemini (por defecto 1: secuencial). "
+                             "El guardado sigue siendo uno a uno y en orden.")
+    parser.add_argument('--llm-batch', type=int, default=1, metavar='N',
+                        help="Correos que se extraen en una sola llamada a Gemini (por defecto 1). "
+                             "Útil con backlogs grandes: el prompt común se paga una vez por lote.")
+    parser.add_argument('--gemini-rpm', type=int, default=int(os.environ.get('GEMINI_RPM', DEFAULT_RPM)),
+                        metavar='N',
+                        help=f"Cuota de llamadas por minuto a Gemini (token bucket compartido; "
+                             f"por defecto $GEMINI_RPM o {DEFAULT_RPM}).")
+    parser.add_argument('--gemini-concurrency', type=int, default=DEFAULT_CONCURRENCY, metavar='N',
+                        help=f"Máximo de llamadas a Gemini en vuelo a la vez (por defecto {DEFAULT_CONCURRENCY}).")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="No usa la caché local de extracciones (fuerza una llamada a Gemini por correo).")
+    parser.add_argument('--metrics-out', metavar='ARCHIVO',
+                        help="Agrega el resumen de métricas de la corrida (una línea JSON) a ARCHIVO.")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Mide el pico de memoria con tracemalloc (más lento).")
+    parser.add_argument('--push-digest', action='store_true',
+                        help="Junta los movimientos pendientes de la corrida en una sola notificación push.")
+    parser.add_argument('--profile', metavar='ARCHIVO',
+                        help="Corre bajo cProfile, guarda las estadísticas en ARCHIVO y muestra las funciones más costosas.")
     args = parser.parse_args()
+    metrics.reset(trace_memory=args.trace_memory)
 
     gemini_key = os.environ.get('GEMINI_API_KEY')
     if not gemini_key:
         print("❌ Falta la variable de entorno GEMINI_API_KEY.")
         raise SystemExit(1)
-    client = genai.Client(api_key=gemini_key)
-
-    db = conectar_db()
+    # El cliente de Gemini se construye recién con el primer correo a analizar.
+    client = GeminiExtractor(None, GEMINI_MODEL, rpm=args.gemini_rpm,
+                             concurrency=args.gemini_concurrency,
+                             client_factory=lambda: gemini_client(gemini_key))
+    cache = None if args.no_cache else ExtractionCache()
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler:
+            profiler.runcall(_ejecutar, args, client, cache)
+        else:
+            _ejecutar(args, client, cache)
+    finally:
+        client.close()
+        if cache is not None:
+            metrics.count('cache.hits', cache.hits)
+            metrics.count('cache.misses', cache.misses)
+            cache.close()
+        if profiler:
+            profiler.dump_stats(args.profile)
+            print(f"\n🔬 Perfil guardado en {args.profile}. Funciones más costosas:")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        _reportar_metricas(args.metrics_out)
+
+
+def _reportar_metricas(path=None):
+    """Imprime (y opcionalmente guarda) el resumen de métricas de la corrida."""
+    resumen = metrics.write_summary(path) if path else metrics.summary()
+    print("\n📊 Métricas de la corrida:")
+    print(json.dumps(resumen, ensure_ascii=False))
+
+
+def _ejecutar(args, client, cache):
+    """Cuerpo de `main` una vez resueltos los argumentos y los clientes."""
+    with span('conectar_db'):
+        db = conectar_db()
 
     print("🔑 Iniciando conexión con Gmail...")
-    service = authenticate_gmail(db)
+    with span('authenticate_gmail'):
+        service = authenticate_gmail(db)
 
+    # Los push salen en segundo plano; se esperan (y se manda el resumen, en
+    # modo digest) al terminar la corrida.
+    push = PushSender(db, digest=args.push_digest)
+    try:
+        _correr(args, db, service, client, cache, push)
+    finally:
+        with span('push_cerrar'):
+            push.cerrar()
+
+
+def _correr(args, db, service, client, cache, push):
+    """Re-proceso de prueba o sync normal, con los clientes ya conectados."""
     # Modo prueba: re-procesar los últimos N correos (validar el pipeline en
     # producción tras un merge, idealmente con --dry-run).
     if args.reprocess_last > 0:
-        reprocess_last_emails(db, service, client, args.reprocess_last, args.dry_run)
+        reprocess_last_emails(db, service, client, args.reprocess_last, args.dry_run,
+                              workers=args.workers, cache=cache, lote_ia=args.llm_batch, push=push)
         return
 
+    # El ID de la etiqueta se guarda en el estado del sync: una corrida sin
+    # correos nuevos es una lectura de Firestore y un `history().list`.
+    # `--full-scan` lo vuelve a buscar.
     label_name = args.label
-    print(f"🔍 Buscando el ID interno para la etiqueta '{label_name}'...")
-    label_id = get_label_id(service, label_name)
+    state = _load_sync_state(db)
+    guardada = label_name in (state.get('labels') or {}) and not args.full_scan
+    label_id, etiquetas = resolver_etiqueta(service, label_name, state, refrescar=args.full_scan)
     if not label_id:
         print(f"❌ No se encontró la etiqueta '{label_name}' en tu cuenta de Gmail.")
         print("Asegúrate de haberla creado en la interfaz de Gmail.")
         return
-    print(f"✅ Etiqueta encontrada en servidor: {label_id}")
-
-    print(f"📫 Buscando correos con la etiqueta '{label_name}'...")
-    query = f"label:{label_name}"
-    results = service.users().messages().list(userId='me', q=query).execute()
-    messages = results.get('messages', [])
+    print(f"✅ Etiqueta '{label_name}': {label_id}" + (" (guardada)" if guardada else ""))
 
+    try:
+        with span('listar_candidatos'):
+            messages, history_id = listar_candidatos(service, label_name, label_id, state, args.full_scan)
+    except Exception as e:
+        # Un ID guardado deja de valer si la etiqueta se borra y se vuelve a crear.
+        if not guardada or http_status(e) != 400:
+            raise
+        print(f"⚠️ Gmail rechazó el ID guardado de la etiqueta ({e}). Se vuelve a buscar.")
+        label_id, etiquetas = resolver_etiqueta(service, label_name, state, refrescar=True)
+        if not label_id:
+            print(f"❌ No se encontró la etiqueta '{label_name}' en tu cuenta de Gmail.")
+            return
+        with span('listar_candidatos'):
+            messages, history_id = listar_candidatos(service, label_name, label_id, state, args.full_scan)
+    # Los correos que quedan etiquetados sin resolver se guardan para
+    # reintentarlos: el modo incremental no los volvería a ver. Si la corrida
+    # se cae, el estado no avanza y la siguiente repite el mismo tramo.
+    reintentar = _sincronizar(db, service, client, label_id, messages, args.workers, cache,
+                              args.llm_batch, push)
+    nuevo_estado = {'historyId': history_id, 'retryIds': reintentar, 'labels': etiquetas}
+    if nuevo_estado != {k: state.get(k) for k in nuevo_estado}:
+        _save_sync_state(db, nuevo_estado)
+
+
+def _sincronizar(db, service, client, label_id, messages, workers, cache=None, lote_ia=1,
+                 push=None):
+    """Procesa los correos candidatos y devuelve los IDs que quedaron
+    pendientes de reintento (fallo de descarga, de IA o de guardado)."""
     if not messages:
         print("✅ No se encontraron correos pendientes para procesar.")
-        return
-
-    for msg in messages:
-        msg_id = msg['id']
-
-        if is_processed(db, msg_id):
+        return []
+
+    # Deduplicación en bloque: una sola lectura para todos los IDs listados.
+    with span('processed_ids'):
+        ya_procesados = processed_ids(db, messages)
+    lote = SyncBatch(db, service, label_id)
+    pendientes = []
+    for msg_id in messages:
+        if msg_id in ya_procesados:
             print(f"⏭️ El correo {msg_id} ya fue procesado pero sigue etiquetado. Removiendo etiqueta...")
-            mark_as_processed(service, msg_id, label_id)
-            continue
-
-        print("\n" + "-" * 50)
-        print(f"📩 Procesando nuevo correo: {msg_id}")
+            lote.marcar_procesado(msg_id, guardar=False)
+        else:
+            pendientes.append(msg_id)
 
-        # Descargar el correo completo
-        message_data = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
-        payload = message_data.get('payload', {})
+    with span('separar_extractos'):
+        pendientes, extractos, reintentar = separar_extractos(service, pendientes, label_id)
+    for msg_id, subject in extractos:
+        print(f"🚫 El correo {msg_id} parece un extracto/estado de cuenta ('{subject[:60]}'). Se ignora sin descargarlo ni llamar al LLM.")
+        lote.marcar_procesado(msg_id)
+    if not lote.confirmar():
+        reintentar += [msg_id for msg_id, _ in extractos]
 
-        # Gate barato pre-LLM: los extractos / estados de cuenta no son
-        # transacciones individuales. Se detectan por asunto y se descartan
-        # sin gastar una llamada al modelo.
-        subject = next((h.get('value', '') for h in payload.get('headers', [])
-                        if h.get('name', '').lower() == 'subject'), '')
-        if looks_like_statement(subject):
-            print(f"🚫 El correo parece un extracto/estado de cuenta ('{subject[:60]}'). Se ignora sin llamar al LLM.")
-            mark_as_processed(service, msg_id, label_id)
-            save_processed_email(db, msg_id)
-            continue
+    if not pendientes:
+        return reintentar
 
-        # Momento del correo (≈ momento de la transacción) en hora local de Colombia.
-        # internalDate viene en epoch ms UTC; lo convertimos a UTC-5 (Colombia no
-        # tiene horario de verano). De aquí salen la fecha y la hora que guardamos.
-        internal_date_ms = int(message_data.get('internalDate', 0))
-        tx_dt = (
-            datetime.datetime.fromtimestamp(internal_date_ms / 1000.0, tz=BOGOTA)
-            if internal_date_ms else datetime.datetime.now(BOGOTA)
-        )
+    # Contexto de análisis de la corrida: se carga una sola vez y solo si hay
+    # correos nuevos.
+    print("🧠 Obteniendo contexto desde Firestore...")
+    with span('_prefetch_context'):
+        ctx = _prefetch_context(db)
+    ctx.cache = cache
+    ctx.push = push
+
+    # El análisis con Gemini puede correr en paralelo; el guardado se hace
+    # aquí, en el hilo principal y en el orden original, y se confirma al
+    # final de cada bloque. La exclusión entre corridas la da el grupo de
+    # concurrencia `gmail-sync` del workflow.
+    pool = _pool(workers)
+    try:
+        for i in range(0, len(pendientes), BATCH_SIZE):
+            bloque = pendientes[i:i + BATCH_SIZE]
+            lote = SyncBatch(db, service, label_id, push)
+            fallidos = [res['id'] for res in pipeline_correos(bloque, service, ctx, client, pool, lote_ia)
+                        if not procesar_resultado(res, db, ctx, lote)]
+            reintentar += bloque if not lote.confirmar() else fallidos
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    _resumen_ia(ctx)
+    return reintentar
+
+
+def _resumen_ia(ctx):
+    """Imprime cuántos correos se resolvieron por plantilla y los tokens de
+    prompt enviados a Gemini en la corrida."""
+    if ctx.plantillas:
+        print(f"⚡ Plantillas: {ctx.plantillas} correo(s) resueltos sin llamar a Gemini.")
+    if ctx.cache is not None and (ctx.cache.hits or ctx.cache.misses):
+        print(f"♻️ Caché de extracciones: {ctx.cache.hits} acierto(s), {ctx.cache.misses} fallo(s).")
+    if ctx.llamadas_ia:
+        print(f"🧾 Prompts a Gemini: {ctx.llamadas_ia} llamada(s), {ctx.tokens_prompt} tokens "
+              f"(~{ctx.tokens_prompt // ctx.llamadas_ia} por llamada).")
+
+
+def procesar_resultado(res, db, ctx, lote):
+    """Persiste (en el lote del bloque) el resultado del análisis de un correo.
+
+    Devuelve False si el correo queda etiquetado para reintentarlo luego.
+    """
+    msg_id = res['id']
+    print("\n" + "-" * 50)
+    print(f"📩 Procesando nuevo correo: {msg_id}")
 
-        body_text = extract_email_body(payload)
-        if not body_text:
-            print(f"⚠️ No se pudo extraer texto legible del correo {msg_id}")
-            # Lo marcamos procesado de todas formas para no ciclar en correos vacíos
-            mark_as_processed(service, msg_id, label_id)
-            save_processed_email(db, msg_id)
-            continue
+    if res['status'] == 'error':
+        print(f"⚠️ Se mantendrá la etiqueta del correo {msg_id} para reintentar luego.")
+        return False
 
-        # Limitar el tamaño del texto enviado al modelo
-        truncated_text = body_text[:MAX_BODY_CHARS]
-        print(f"📄 Texto detectado (resumen): {truncated_text[:100].replace(chr(10), ' ')}...")
+    if res['status'] == 'empty':
+        print(f"⚠️ No se pudo extraer texto legible del correo {msg_id}")
+        # Lo marcamos procesado de todas formas para no ciclar en correos vacíos
+        lote.marcar_procesado(msg_id)
+        return True
 
-        datos_ia, cat_tree = procesar_texto_con_ia(truncated_text, db, client)
+    if res['status'] == 'ia_error':
+        print(f"⚠️ El correo {msg_id} falló en la interpretación por IA. Se mantendrá la etiqueta para reintentar luego.")
+        return False
 
-        if datos_ia:
-            success = registrar_transaccion(datos_ia, tx_dt, db, cat_tree)
-            if success:
-                mark_as_processed(service, msg_id, label_id)
-                save_processed_email(db, msg_id)
-        else:
-            print(f"⚠️ El correo {msg_id} falló en la interpretación por IA. Se mantendrá la etiqueta para reintentar luego.")
+    datos_ia = enriquecer_transaccion(res['datos'], ctx)
+    if registrar_transaccion(datos_ia, res['tx_dt'], db, ctx, lote=lote):
+        lote.marcar_procesado(msg_id)
+        return True
+    return False
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+"""
+Caché local (SQLite) de extracciones de Gemini.
+
+La clave es un hash del cuerpo del correo normalizado + versión del prompt +
+modelo: el mismo correo (p. ej. en cada `--reprocess-last`) no vuelve a pasar
+por la red. Las entradas vencen a los `ttl_days` días y, si se pasa de
+`max_entries`, se descartan las usadas hace más tiempo.
+
+Solo stdlib. Es seguro usarla desde los hilos del pool del sync.
+
+En GitHub Actions el archivo se conserva entre corridas con `actions/cache`
+(ver gmail_sync.yml). Ruta por defecto: `.cache/llm_extractions.sqlite`
+(variable de entorno `LLM_CACHE_PATH`).
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+DEFAULT_PATH = os.path.join('.cache', 'llm_extractions.sqlite')
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def cache_key(body, prompt_version, model):
+    """Hash del cuerpo normalizado (espacios colapsados) + versión + modelo."""
+    normalized = re.sub(r'\s+', ' ', body or '').strip()
+    raw = f"{model}\x00{prompt_version}\x00{normalized}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ExtractionCache:
+    """Caché clave → JSON extraído, con TTL y tamaño máximo."""
+
+    def __init__(self, path=None, ttl_days=DEFAULT_TTL_DAYS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.environ.get('LLM_CACHE_PATH') or DEFAULT_PATH
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """Valor cacheado (dict) o None si no existe o venció."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE extractions SET used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Guarda (o reemplaza) una extracción."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, value, created, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now))
+            self._conn.commit()
+
+    def evict(self):
+        """Borra lo vencido y, si sobra, lo menos usado. Devuelve cuántas
+        entradas se borraron."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM extractions WHERE created < ?", (time.time() - self.ttl,))
+            borradas = cur.rowcount
+            cur = self._conn.execute(
+                "DELETE FROM extractions WHERE key IN ("
+                " SELECT key FROM extractions ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            borradas += cur.rowcount
+            self._conn.commit()
+        return borradas
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    def close(self):
+        """Aplica la expulsión y cierra el archivo."""
+        self.evict()
+        self._conn.close()
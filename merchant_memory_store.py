@@ -0,0 +1,135 @@
+"""
+Memoria de comercios persistida en Firestore (`merchant_memory/index`).
+
+Guarda los conteos por comercio de `tx_enrich.merchant_counts` en un solo
+documento, de modo que el sync lee UNA lectura en vez de cientos de
+transacciones y la memoria cubre todo el historial, no solo las últimas N.
+
+- El pipeline la actualiza al guardar cada transacción (`increment_merchant`,
+  dentro del mismo WriteBatch que la transacción).
+- Las recategorizaciones hechas desde Python usan `recategorize_merchant`.
+- `rebuild` la recalcula desde cero con todo `finance_transactions`; cubre
+  también los cambios hechos desde la app. Correr con:
+      python3 merchant_memory_store.py --rebuild
+
+Firestore no admite nombres de campo vacíos, así que el valor '' (p. ej. sin
+subcategoría) se guarda como `EMPTY_KEY`. Un documento admite ~1 MiB: del orden
+de miles de comercios, de sobra para un uso personal.
+"""
+
+import argparse
+
+from firebase_admin import firestore
+
+from utils import conectar_db
+from tx_enrich import merchant_counts, merchant_fields, normalize_merchant
+
+MEMORY_COLLECTION = 'merchant_memory'
+MEMORY_DOC = 'index'
+
+# Marcador para el valor '' en las claves de los mapas de conteos.
+EMPTY_KEY = '(vacío)'
+
+
+def _ref(db):
+    return db.collection(MEMORY_COLLECTION).document(MEMORY_DOC)
+
+
+def _encode(value):
+    return value if value else EMPTY_KEY
+
+
+def _decode(value):
+    return '' if value == EMPTY_KEY else value
+
+
+def load_merchant_counts(db):
+    """Lee los conteos por comercio (None si el índice aún no existe)."""
+    doc = _ref(db).get()
+    if not doc.exists:
+        return None
+    counts = {}
+    for key, entry in (doc.to_dict().get('merchants') or {}).items():
+        counts[key] = {
+            'merchant': entry.get('merchant', ''),
+            'count': entry.get('count', 0),
+            **{field: {_decode(v): n for v, n in (entry.get(field) or {}).items()}
+               for field in ('type', 'category', 'subcategory', 'context')},
+        }
+    return counts
+
+
+def _delta(tx, sign):
+    """Actualización (con Increment) de los conteos de un comercio."""
+    key = normalize_merchant(tx.get('title', ''))
+    if not key:
+        return None
+    entry = {'count': firestore.Increment(sign)}
+    if sign > 0:
+        entry['merchant'] = tx.get('title', '')
+    for field, value in merchant_fields(tx).items():
+        entry[field] = {_encode(value): firestore.Increment(sign)}
+    return {'merchants': {key: entry}}
+
+
+def increment_merchant(db, tx, batch=None, sign=1):
+    """Suma (o resta, con `sign=-1`) una transacción al índice.
+
+    Si se pasa `batch`, la escritura va en ese WriteBatch (atómica con la
+    transacción); si no, se escribe al instante.
+    """
+    delta = _delta(tx, sign)
+    if delta is None:
+        return
+    if batch is not None:
+        batch.set(_ref(db), delta, merge=True)
+    else:
+        _ref(db).set(delta, merge=True)
+
+
+def recategorize_merchant(db, before, after, batch=None):
+    """Mueve una transacción recategorizada: resta su clasificación anterior
+    (`before`) y suma la nueva (`after`)."""
+    own_batch = batch is None
+    batch = db.batch() if own_batch else batch
+    increment_merchant(db, before, batch, sign=-1)
+    increment_merchant(db, after, batch, sign=1)
+    if own_batch:
+        batch.commit()
+
+
+def rebuild(db):
+    """Recalcula el índice completo desde `finance_transactions`."""
+    docs = db.collection('finance_transactions') \
+        .select(['title', 'type', 'category', 'subcategory', 'context', 'date']) \
+        .order_by('date', direction=firestore.Query.DESCENDING).stream()
+    counts = merchant_counts(d.to_dict() for d in docs)
+    merchants = {
+        key: {
+            'merchant': entry['merchant'],
+            'count': entry['count'],
+            **{field: {_encode(v): n for v, n in entry[field].items()}
+               for field in ('type', 'category', 'subcategory', 'context')},
+        }
+        for key, entry in counts.items()
+    }
+    _ref(db).set({'merchants': merchants, 'rebuiltAt': firestore.SERVER_TIMESTAMP})
+    return len(merchants), sum(e['count'] for e in counts.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria de comercios persistida en Firestore")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Recalcula merchant_memory/index desde todas las transacciones.")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    db = conectar_db()
+    n_merchants, n_txs = rebuild(db)
+    print(f"✅ Memoria de comercios reconstruida: {n_merchants} comercios a partir de {n_txs} transacciones.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Notificaciones push (Web Push/FCM) de movimientos pendientes de revisión.
+
+Lo usan el sync (gmail_finanzas_sync.py) y send_test_push.py. Solo depende
+de firebase-admin:
+
+- Los tokens de `fcm_tokens` (doc id == token) se leen una sola vez por
+  corrida, en el primer envío.
+- Los envíos corren en un hilo aparte: el sync encola y sigue con el
+  siguiente correo; `cerrar()` espera a que terminen.
+- Con `digest=True` los movimientos de la corrida se juntan en una sola
+  notificación al cerrar (si hay uno solo, sale la notificación normal con
+  su deep link `?editTx=<id>`).
+- Los tokens que FCM reporta como inválidos dejan de usarse en la corrida y
+  se borran juntos, en un WriteBatch, al cerrar.
+
+Los mensajes son data-only: el service worker (public/firebase-messaging-sw.js)
+arma la notificación.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from run_metrics import span, count
+
+# `firebase_admin.messaging` (se importa en el primer envío, ver `_messaging`).
+messaging = None
+
+TOKENS_COLLECTION = 'fcm_tokens'
+TITLE_PENDING = '🧾 Pendiente de revisión'
+# Movimientos que se listan en el cuerpo de un resumen; el resto se cuenta.
+DIGEST_MAX_LINES = 4
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def _monto(tx):
+    signo = '-' if tx.get('type') == 'debit' else '+'
+    try:
+        return f"{signo}{float(tx.get('amount', 0)):,.0f} {tx.get('currency', 'COP')}"
+    except (TypeError, ValueError):
+        return tx.get('currency', 'COP')
+
+
+def push_data(tx_id, tx):
+    """Payload `data` de la notificación de un movimiento."""
+    categoria = tx.get('category', '')
+    body = f"{_monto(tx)} · {tx.get('title', 'Movimiento')}" + (f" · {categoria}" if categoria else "")
+    return {'txId': str(tx_id), 'url': f"/?editTx={tx_id}", 'title': TITLE_PENDING, 'body': body}
+
+
+def digest_data(pendientes):
+    """Payload `data` de una notificación que resume varios movimientos
+    `(tx_id, tx)`. Abre la app en el inicio, donde están los pendientes."""
+    lineas = [f"{_monto(tx)} · {tx.get('title', 'Movimiento')}" for _, tx in pendientes[:DIGEST_MAX_LINES]]
+    resto = len(pendientes) - len(lineas)
+    if resto:
+        lineas.append(f"y {resto} más")
+    return {
+        'txId': '',
+        'txIds': ','.join(str(tx_id) for tx_id, _ in pendientes),
+        'url': '/',
+        'title': f"🧾 {len(pendientes)} movimientos pendientes de revisión",
+        'body': '\n'.join(lineas),
+    }
+
+
+def _messaging():
+    """`firebase_admin.messaging`, importado recién al enviar: tarda en
+    cargar y la mayoría de las corridas no manda ningún push."""
+    global messaging
+    if messaging is None:
+        from firebase_admin import messaging as modulo
+        messaging = modulo
+    return messaging
+
+
+def _token_invalido(exc):
+    return isinstance(exc, _messaging().UnregisteredError) or \
+        'not-registered' in str(getattr(exc, 'code', '')).lower()
+
+
+class PushSender:
+    """Envía los push de una corrida fuera del camino crítico del sync.
+
+    `notificar(tx_id, tx)` nunca bloquea ni lanza: el push es best-effort.
+    Con `background=False` envía en el mismo hilo (scripts de prueba).
+    """
+
+    def __init__(self, db, digest=False, background=True):
+        self.db = db
+        self.digest = digest
+        self.enviados = 0
+        self._tokens = None
+        self._invalidos = set()
+        self._pendientes = []
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='push') if background else None
+        self._futuros = []
+
+    def tokens(self):
+        """Tokens registrados (una sola lectura por corrida), sin los que FCM
+        ya reportó como inválidos."""
+        if self._tokens is None:
+            count('firestore.fcm_tokens')
+            self._tokens = [d.id for d in self.db.collection(TOKENS_COLLECTION).stream()]
+            if not self._tokens:
+                print("ℹ️ No hay dispositivos suscritos a notificaciones. Se omite push.")
+        return [t for t in self._tokens if t not in self._invalidos]
+
+    def notificar(self, tx_id, tx):
+        """Encola el push de un movimiento pendiente (o lo guarda para el
+        resumen, en modo digest)."""
+        if self.digest:
+            self._pendientes.append((tx_id, tx))
+        else:
+            self._despachar(push_data(tx_id, tx))
+
+    def _despachar(self, data):
+        if self._pool:
+            self._futuros.append(self._pool.submit(self._enviar, data))
+        else:
+            self._enviar(data)
+
+    def _enviar(self, data):
+        try:
+            tokens = self.tokens()
+            if not tokens:
+                return
+            fcm = _messaging()
+            message = fcm.MulticastMessage(
+                tokens=tokens,
+                # Data-only: el SW arma la notificación (evita duplicados en Chrome).
+                data=data,
+                # Sin fcm_options.link: FCM exige URL absoluta HTTPS ahí, pero el deep
+                # link lo resuelve nuestro service worker desde data.url (relativo OK).
+                webpush=fcm.WebpushConfig(headers={'Urgency': 'high'}),
+            )
+            count('fcm.send')
+            with span('enviar_push'):
+                response = fcm.send_each_for_multicast(message)
+            self.enviados += 1
+            print(f"🔔 Push enviado: {response.success_count} ok, {response.failure_count} fallidos.")
+            for token, resp in zip(tokens, response.responses):
+                if not resp.success:
+                    if _token_invalido(resp.exception):
+                        self._invalidos.add(token)
+                    else:
+                        print(f"   ❌ {token[:12]}… → {resp.exception}")
+        except Exception as e:
+            print(f"⚠️ No se pudo enviar la notificación push (no crítico): {e}")
+
+    def cerrar(self):
+        """Envía el resumen (modo digest), espera los envíos en curso y borra
+        los tokens inválidos."""
+        if self._pendientes:
+            pendientes, self._pendientes = self._pendientes, []
+            data = push_data(*pendientes[0]) if len(pendientes) == 1 else digest_data(pendientes)
+            self._despachar(data)
+        for futuro in self._futuros:
+            futuro.result()
+        self._futuros = []
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+        self._borrar_invalidos()
+
+    def _borrar_invalidos(self):
+        invalidos = sorted(self._invalidos)
+        try:
+            for i in range(0, len(invalidos), FIRESTORE_BATCH_LIMIT):
+                batch = self.db.batch()
+                for token in invalidos[i:i + FIRESTORE_BATCH_LIMIT]:
+                    batch.delete(self.db.collection(TOKENS_COLLECTION).document(token))
+                count('firestore.commit')
+                batch.commit()
+        except Exception as e:
+            print(f"⚠️ No se pudieron borrar los tokens inválidos (no crítico): {e}")
+            return
+        for token in invalidos:
+            print(f"🧹 Token inválido eliminado: {token[:12]}…")
@@ -0,0 +1,113 @@
+"""
+Instrumentación liviana de una corrida del sync (solo stdlib).
+
+- `span("etapa")` (context manager) y `@timed("etapa")` (decorador) miden la
+  duración de cada etapa; son seguros desde los hilos del pool.
+- `count("nombre", n)` suma contadores (llamadas a APIs, tokens, aciertos...).
+- `summary()` arma el resumen de la corrida: por etapa, n / total / p50 / p95
+  / máx en ms, los contadores y, si se activó `tracemalloc`, el pico de
+  memoria. `write_summary` lo agrega como una línea JSON a un archivo.
+
+Hay una sola instancia por proceso (`metrics`); `reset()` la deja lista
+para la siguiente corrida.
+"""
+
+import json
+import math
+import time
+import threading
+import functools
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+def percentile(values, q):
+    """Percentil `q` (0-100) por el método del rango más cercano."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+class RunMetrics:
+    """Duraciones por etapa y contadores de una corrida."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, trace_memory=False):
+        """Empieza una corrida nueva (opcionalmente midiendo memoria)."""
+        with self._lock:
+            self.spans = defaultdict(list)
+            self.counters = Counter()
+            self.started = time.perf_counter()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = trace_memory
+        if trace_memory:
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, stage):
+        """Mide la duración del bloque y la suma a `stage` (aunque falle)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.spans[stage].append(elapsed)
+
+    def timed(self, stage):
+        """Decorador equivalente a envolver la función en `span(stage)`."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def summary(self, **extra):
+        """Resumen de la corrida como dict serializable a JSON."""
+        with self._lock:
+            stages = {
+                stage: {
+                    'n': len(values),
+                    'total_ms': round(sum(values) * 1e3, 2),
+                    'p50_ms': round(percentile(values, 50) * 1e3, 2),
+                    'p95_ms': round(percentile(values, 95) * 1e3, 2),
+                    'max_ms': round(max(values) * 1e3, 2),
+                }
+                for stage, values in sorted(self.spans.items())
+            }
+            out = {
+                'ts': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'wall_ms': round((time.perf_counter() - self.started) * 1e3, 2),
+                'stages': stages,
+                'counters': dict(sorted(self.counters.items())),
+                **extra,
+            }
+        if self.trace_memory and tracemalloc.is_tracing():
+            out['tracemalloc_peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        return out
+
+    def write_summary(self, path, **extra):
+        """Agrega el resumen como una línea JSON a `path` y lo devuelve."""
+        data = self.summary(**extra)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False) + '\n')
+        return data
+
+
+metrics = RunMetrics()
+span = metrics.span
+timed = metrics.timed
+count = metrics.count
@@ -1,9 +1,10 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import sys
 
-cred = credentials.Certificate('firebase-adminsdk-fbsvc-bb7cb78f3e.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+from utils import conectar_db
+from bulk_ops import update_ids
+
+db = conectar_db()
+dry_run = '--dry-run' in sys.argv
 
 updates = {
     '0SAEWB9czXbw1ZjbHdNo': ('Estilo de Vida y Ocio', 'Suscripciones'),
@@ -18,12 +19,12 @@ updates = {
     'wgRVHJrv49cXge0Rm9sf': ('Salud y Bienestar', 'Medicamentos / Farmacia')
 }
 
-for doc_id, (cat, sub) in updates.items():
-    db.collection('finance_transactions').document(doc_id).update({
-        'category': cat,
-        'subcategory': sub
-    })
-    print(f'Updated {doc_id} -> {cat} / {sub}')
+n = update_ids(db, 'finance_transactions',
+               {doc_id: {'category': cat, 'subcategory': sub} for doc_id, (cat, sub) in updates.items()},
+               dry_run=dry_run)
+print(f'Updated {n} transactions')
+if dry_run:
+    sys.exit(0)
 
 settings_ref = db.collection('finance_settings').document('default')
 settings = settings_ref.get().to_dict()
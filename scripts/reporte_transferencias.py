@@ -3,8 +3,13 @@
 Reporte de transferencias a una cuenta — búsqueda directa en Gmail.
 
 Busca en Gmail (API directa) los correos de notificación de Bancolombia que
-reporten transferencias a una cuenta destino, extrae monto y fecha, y genera un
-PDF corporativo simple con el detalle y el total.
+reporten transferencias a una o varias cuentas destino, extrae monto y fecha, y
+genera un PDF corporativo simple por cuenta con el detalle y el total.
+
+Incremental: guarda en `.cache/transferencias.json` lo ya parseado de cada
+correo (por ID de mensaje) y, por cuenta, hasta qué día ya se buscó. Las
+corridas siguientes solo buscan desde esa marca y solo descargan los correos
+nuevos, en paralelo. Todas las `--account` se resuelven con una sola búsqueda.
 
 Self-contained: reutiliza la conexión a Firestore (utils.conectar_db) y el token
 de Gmail ya guardado, sin depender del pipeline de IA.
@@ -12,20 +17,31 @@ de Gmail ya guardado, sin depender del pipeline de IA.
 Uso:
     python3 scripts/reporte_transferencias.py
     python3 scripts/reporte_transferencias.py --account 3114096566 --after 2026/01/01
+    python3 scripts/reporte_transferencias.py --account 3114096566 --account 3001234567
     python3 scripts/reporte_transferencias.py --out ~/Desktop/reporte.pdf
+    python3 scripts/reporte_transferencias.py --no-cache      # ignora la caché local
+    python3 scripts/reporte_transferencias.py --format csv    # o xlsx
+
+El PDF se arma en tablas de una página (LongTable, con las filas que caben
+en el frame) y estilos precalculados; CSV y XLSX se escriben fila por fila, a medida que salen de
+la caché (sin armar la lista completa de filas).
 
 Dependencias: firebase-admin, google-api-python-client, google-auth,
-beautifulsoup4, reportlab.
+reportlab (openpyxl solo para --format xlsx).
 """
 
 import os
 import re
+import csv
 import sys
 import json
+import hashlib
 import argparse
+import itertools
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from bs4 import BeautifulSoup
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
@@ -33,26 +49,34 @@ from googleapiclient.discovery import build
 # conectar_db vive en la raíz del repo
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import conectar_db  # noqa: E402
+from gmail_fetch import BATCH_SIZE, list_message_ids, get_messages  # noqa: E402
+from email_text import email_text  # noqa: E402
+from tx_templates import TRANSFER_RE  # noqa: E402
 
 from reportlab.lib import colors  # noqa: E402
 from reportlab.lib.pagesizes import letter  # noqa: E402
 from reportlab.lib.units import mm  # noqa: E402
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle  # noqa: E402
 from reportlab.platypus import (  # noqa: E402
-    SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,
+    SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer,
 )
 
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 BOGOTA = datetime.timezone(datetime.timedelta(hours=-5))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(ROOT, '.cache', 'transferencias.json')
+# Formato de las entradas de `mensajes` (ver `parse_transfer`).
+CACHE_FORMAT = 2
+# Cambia si cambia el regex o el formato: lo ya parseado con otra versión no sirve.
+CACHE_VERSION = hashlib.sha256(f"{TRANSFER_RE.pattern}|{CACHE_FORMAT}".encode()).hexdigest()[:12]
+# Números del correo que pueden ser una cuenta (para atribuir los que no
+# tienen el formato esperado).
+NUMERO_RE = re.compile(r"\d{6,}")
+# Días que se vuelven a buscar antes de la marca (`after:` es por día y en
+# la zona horaria de Gmail).
+OVERLAP_DAYS = 2
 MESES = ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
 
-# "Transferiste $444,000.00 desde tu cuenta 2823 a la cuenta *3114096566 el 25/06/2026 a las 22:45."
-TRANSFER_RE = re.compile(
-    r"Transferiste\s*\$\s*([\d.,]+)\s*desde tu cuenta\s*(\w+)\s*"
-    r"a la cuenta\s*\*?(\d+)\s*el\s*(\d{2}/\d{2}/\d{4})\s*a las\s*(\d{1,2}:\d{2})",
-    re.IGNORECASE,
-)
-
 # Marca / colores corporativos
 INK = colors.HexColor('#0F3D3A')      # teal oscuro (header)
 ACCENT = colors.HexColor('#13ECDA')   # teal de marca
@@ -63,7 +87,7 @@ MUTED = colors.HexColor('#6B7B79')
 # ---------------------------------------------------------------------------
 # Gmail (auth mínima reutilizando el token de Firestore)
 # ---------------------------------------------------------------------------
-def gmail_service(db):
+def gmail_credentials(db):
     doc = db.collection('gmail_auth').document('token').get()
     if not doc.exists:
         raise RuntimeError("No hay token de Gmail en Firestore (gmail_auth/token).")
@@ -75,64 +99,163 @@ def gmail_service(db):
             db.collection('gmail_auth').document('token').set(json.loads(creds.to_json()))
         else:
             raise RuntimeError("Token de Gmail inválido y no refrescable.")
-    return build('gmail', 'v1', credentials=creds)
-
-
-def email_text(payload):
-    parts = []
-
-    def walk(p):
-        for part in p.get('parts', []):
-            mime = part.get('mimeType', '')
-            data = part.get('body', {}).get('data')
-            if mime == 'text/html' and data:
-                import base64
-                html = base64.urlsafe_b64decode(data).decode('utf-8', 'replace')
-                parts.append(BeautifulSoup(html, 'html.parser').get_text(' '))
-            elif mime == 'text/plain' and data:
-                import base64
-                parts.append(base64.urlsafe_b64decode(data).decode('utf-8', 'replace'))
-            elif 'parts' in part:
-                walk(part)
-
-    if 'parts' in payload:
-        walk(payload)
-    else:
-        data = payload.get('body', {}).get('data')
-        if data:
-            import base64
-            decoded = base64.urlsafe_b64decode(data).decode('utf-8', 'replace')
-            if 'html' in payload.get('mimeType', ''):
-                decoded = BeautifulSoup(decoded, 'html.parser').get_text(' ')
-            parts.append(decoded)
-    return re.sub(r'\s+', ' ', ' '.join(parts))
+    return creds
+
+
+def gmail_service(creds):
+    return build('gmail', 'v1', credentials=creds, cache_discovery=False)
+
+
+# ---------------------------------------------------------------------------
+# Caché local (correos ya parseados + marca por cuenta)
+# ---------------------------------------------------------------------------
+def _orden(item):
+    """Clave de orden de un item de `mensajes`: los que no son transferencia
+    van primero, el resto por fecha y hora."""
+    msg_id, tx = item
+    return tx["date"], tx["time"], msg_id
+
+
+class TransferCache:
+    """`mensajes`: {id de Gmail: lo parseado del correo (`parse_transfer`)},
+    guardado en orden de fecha y hora (el reporte lo recorre tal cual).
+    `cuentas`: {cuenta: {'desde': fecha, 'hasta': fecha}} — rango ya buscado."""
+
+    def __init__(self, path=CACHE_PATH, enabled=True):
+        self.path = path
+        self.mensajes, self.cuentas = {}, {}
+        if enabled and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self.mensajes, self.cuentas = data['mensajes'], data['cuentas']
+                self._ordenar()
+
+    def _ordenar(self):
+        items = iter(self.mensajes.items())
+        primero = next(items, None)
+        if primero is None:
+            return
+        anterior = _orden(primero)
+        for item in items:
+            clave = _orden(item)
+            if clave < anterior:
+                self.mensajes = dict(sorted(self.mensajes.items(), key=_orden))
+                return
+            anterior = clave
+
+    def agregar(self, parsed):
+        """Suma correos recién parseados manteniendo el orden de `mensajes`
+        (lo usual es que sean los más recientes y queden al final)."""
+        self.mensajes.update(parsed)
+        self._ordenar()
+
+    def desde(self, account, after):
+        """Fecha desde la que hay que buscar para `account` (YYYY-MM-DD)."""
+        rango = self.cuentas.get(account)
+        if not rango or rango['desde'] > after:
+            return after
+        hasta = datetime.date.fromisoformat(rango['hasta']) - datetime.timedelta(days=OVERLAP_DAYS)
+        return max(after, hasta.isoformat())
+
+    def marcar(self, account, after, hoy):
+        rango = self.cuentas.get(account)
+        desde = min(after, rango['desde']) if rango and rango['desde'] <= after else after
+        self.cuentas[account] = {'desde': desde, 'hasta': hoy}
+
+    def sin_formato(self, account, after):
+        """Correos de `account` desde `after` que no tienen el formato de una
+        transferencia: el mismo rango y la misma cuenta que `iter_transfers`."""
+        return sum(1 for tx in self.mensajes.values()
+                   if not es_transferencia(tx) and tx["date"] >= after
+                   and any(n.endswith(account[-6:]) for n in tx["numeros"]))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'mensajes': self.mensajes, 'cuentas': self.cuentas}, f)
+        os.replace(tmp, self.path)
 
 
 # ---------------------------------------------------------------------------
 # Búsqueda + parseo
 # ---------------------------------------------------------------------------
-def fetch_transfers(service, account, after):
-    query = f"{account} after:{after.replace('-', '/')}"
+def es_transferencia(tx):
+    return "amount" in tx
+
+
+def parse_transfer(message):
+    """Lo que se guarda de un correo (dict serializable): la transferencia o,
+    si no tiene el formato esperado, su fecha y hora y los números que
+    menciona (para contarlo en la cuenta que corresponda)."""
+    text = ' '.join(email_text(message.get('payload', {})).split())
+    match = TRANSFER_RE.search(text)
+    if not match:
+        ms = int(message.get('internalDate') or 0)
+        when = datetime.datetime.fromtimestamp(ms / 1000, tz=BOGOTA)
+        return {"date": when.date().isoformat(), "time": when.strftime("%H:%M"),
+                "numeros": sorted(set(NUMERO_RE.findall(text)))}
+    d = datetime.datetime.strptime(match.group(4), "%d/%m/%Y").date()
+    return {"date": d.isoformat(), "time": match.group(5), "amount": float(match.group(1).replace(',', '')),
+            "src": match.group(2), "dest": match.group(3)}
+
+
+def download(creds, ids, workers):
+    """Descarga y parsea `ids` en paralelo: cada hilo usa su propio cliente
+    de Gmail (el de googleapiclient no es thread-safe) y un batch por bloque.
+    Devuelve `({id: lo parseado}, errores)`."""
+    local = threading.local()
+
+    def _bloque(chunk):
+        if not hasattr(local, 'service'):
+            local.service = gmail_service(creds)
+        mensajes, errores = get_messages(local.service, chunk, fmt='full')
+        return {msg_id: parse_transfer(m) for msg_id, m in mensajes.items()}, len(errores)
+
+    chunks = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+    parsed, errores = {}, 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for res, n_err in pool.map(_bloque, chunks):
+            parsed.update(res)
+            errores += n_err
+    return parsed, errores
+
+
+def fetch_transfers(service, creds, accounts, after, cache, workers=4):
+    """Trae a la caché las transferencias a `accounts` desde `after` (YYYY-MM-DD).
+
+    Una sola búsqueda para todas las cuentas, desde la marca más antigua que
+    haga falta; solo se descargan los correos que no están en la caché.
+    Actualiza `cache` (los correos sin el formato esperado se cuentan por
+    cuenta con `TransferCache.sin_formato`)."""
+    start = min(cache.desde(a, after) for a in accounts)
+    terms = accounts[0] if len(accounts) == 1 else f"({' OR '.join(accounts)})"
+    query = f"{terms} after:{start.replace('-', '/')}"
     print(f"📫 Buscando en Gmail: {query!r}")
-    res = service.users().messages().list(userId='me', q=query, maxResults=200).execute()
-    msgs = res.get('messages', [])
-    print(f"   {len(msgs)} correos coinciden con la búsqueda.")
-
-    rows, unmatched = [], 0
-    for m in msgs:
-        data = service.users().messages().get(userId='me', id=m['id'], format='full').execute()
-        text = email_text(data.get('payload', {}))
-        match = TRANSFER_RE.search(text)
-        if not match or not match.group(3).endswith(account[-6:]):
-            unmatched += 1
-            continue
-        amount = float(match.group(1).replace(',', ''))
-        src, dest = match.group(2), match.group(3)
-        d = datetime.datetime.strptime(match.group(4), "%d/%m/%Y").date()
-        rows.append({"date": d, "time": match.group(5), "amount": amount, "src": src, "dest": dest})
+    msgs = list_message_ids(service, query=query)
+    nuevos = [m for m in msgs if m not in cache.mensajes]
+    print(f"   {len(msgs)} correos coinciden con la búsqueda; {len(nuevos)} nuevos por descargar.")
+
+    errores = 0
+    if nuevos:
+        parsed, errores = download(creds, nuevos, workers)
+        cache.agregar(parsed)
+    if errores:
+        # Sin mover la marca: la próxima corrida vuelve a buscar este rango.
+        print(f"   ⚠️ {errores} correos no se pudieron descargar (se reintentan en la próxima corrida).")
+    else:
+        hoy = datetime.datetime.now(BOGOTA).date().isoformat()
+        for account in accounts:
+            cache.marcar(account, after, hoy)
 
-    rows.sort(key=lambda r: (r["date"], r["time"]))
-    return rows, len(msgs), unmatched
+
+def iter_transfers(cache, account, after):
+    """Transferencias a `account` desde `after`, en orden de fecha y hora,
+    generadas una a una desde la caché (que ya está en ese orden)."""
+    for tx in cache.mensajes.values():
+        if es_transferencia(tx) and tx["date"] >= after and tx["dest"].endswith(account[-6:]):
+            yield {**tx, "date": datetime.date.fromisoformat(tx["date"])}
 
 
 def fmt_cop(n):
@@ -146,7 +269,78 @@ def fmt_date(d):
 # ---------------------------------------------------------------------------
 # PDF
 # ---------------------------------------------------------------------------
-def build_pdf(rows, account, after, out_path, n_emails, unmatched):
+COL_WIDTHS = [12 * mm, 38 * mm, 20 * mm, 40 * mm, 44 * mm]
+HEADER_ROW = ["#", "Fecha", "Hora", "Cuenta origen", "Monto"]
+# Relleno del Frame de SimpleDocTemplate (arriba + abajo): se descuenta del
+# alto de la página al calcular cuántas filas caben.
+FRAME_PADDING = 2 * 6
+# Espacio entre la banda de encabezado y la tabla.
+HEADER_GAP = 14
+
+# Estilo común a todas las tablas (precalculado: la cebra va con
+# ROWBACKGROUNDS en vez de un comando por fila).
+BODY_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), INK),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, ROW_ALT]),
+    ('FONTSIZE', (0, 0), (-1, -1), 9.5),
+    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+    ('ALIGN', (4, 0), (4, -1), 'RIGHT'),
+    ('ALIGN', (2, 0), (2, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('TOPPADDING', (0, 0), (-1, -1), 7), ('BOTTOMPADDING', (0, 0), (-1, -1), 7),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8), ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ('LINEBELOW', (0, 0), (-1, -1), 0.4, colors.HexColor('#DDE7E5')),
+])
+TOTAL_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), ACCENT),
+    ('FONTNAME', (3, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 11),
+    ('TEXTCOLOR', (0, 0), (-1, -1), INK),
+    ('ALIGN', (4, 0), (4, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('TOPPADDING', (0, 0), (-1, -1), 10), ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8), ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+])
+
+
+def _chunks(rows, sizes):
+    """Parte `rows` en listas con los tamaños que va dando `sizes`."""
+    chunk, size = [], next(sizes)
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk, size = [], next(sizes)
+    if chunk:
+        yield chunk
+
+
+def _row_height():
+    """Alto de una fila de la tabla de movimientos (todas son de una línea,
+    el encabezado incluido)."""
+    muestra = ["0000", fmt_date(datetime.date(2026, 12, 31)), "23:59", "*000000", fmt_cop(1e9)]
+    _, alto = Table([HEADER_ROW, muestra], colWidths=COL_WIDTHS, style=BODY_STYLE).wrap(0, 0)
+    return alto / 2
+
+
+def _header(doc, texto, h_title, h_sub):
+    header = Table([[Paragraph("Reporte de transferencias", h_title)],
+                    [Paragraph(texto, h_sub)]],
+                   colWidths=[doc.width])
+    header.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), INK),
+        ('LEFTPADDING', (0, 0), (-1, -1), 16), ('RIGHTPADDING', (0, 0), (-1, -1), 16),
+        ('TOPPADDING', (0, 0), (0, 0), 16), ('BOTTOMPADDING', (-1, -1), (-1, -1), 14),
+        ('LINEBELOW', (0, 0), (-1, 0), 0, INK),
+    ]))
+    return header
+
+
+def build_pdf(rows, account, after, out_path, unmatched):
+    """PDF con las transferencias de `rows` (cualquier iterable, en orden).
+    Devuelve `(total, cantidad)`."""
     doc = SimpleDocTemplate(
         out_path, pagesize=letter,
         leftMargin=18 * mm, rightMargin=18 * mm, topMargin=16 * mm, bottomMargin=16 * mm,
@@ -159,82 +353,123 @@ def build_pdf(rows, account, after, out_path, n_emails, unmatched):
                            fontSize=10, leading=14, alignment=0)
     foot = ParagraphStyle('f', parent=styles['Normal'], textColor=MUTED, fontSize=8, leading=11)
 
-    total = sum(r["amount"] for r in rows)
-    periodo = f"Desde {after} · {len(rows)} transferencias"
-
-    # Banda de encabezado
-    header = Table([[Paragraph("Reporte de transferencias", h_title)],
-                    [Paragraph(f"Cuenta destino <b>*{account}</b> &nbsp;·&nbsp; {periodo}", h_sub)]],
-                   colWidths=[doc.width])
-    header.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), INK),
-        ('LEFTPADDING', (0, 0), (-1, -1), 16), ('RIGHTPADDING', (0, 0), (-1, -1), 16),
-        ('TOPPADDING', (0, 0), (0, 0), 16), ('BOTTOMPADDING', (-1, -1), (-1, -1), 14),
-        ('LINEBELOW', (0, 0), (-1, 0), 0, INK),
-    ]))
-
-    # Tabla de movimientos
-    data = [["#", "Fecha", "Hora", "Cuenta origen", "Monto"]]
-    for i, r in enumerate(rows, 1):
-        data.append([str(i), fmt_date(r["date"]), r["time"], f"*{r['src']}", fmt_cop(r["amount"])])
-    data.append(["", "", "", "TOTAL", fmt_cop(total)])
-
-    tbl = Table(data, colWidths=[12 * mm, 38 * mm, 20 * mm, 40 * mm, 44 * mm], repeatRows=1)
-    style = [
-        ('BACKGROUND', (0, 0), (-1, 0), INK),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9.5),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (4, 0), (4, -1), 'RIGHT'),
-        ('ALIGN', (2, 0), (2, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 0), (-1, -1), 7), ('BOTTOMPADDING', (0, 0), (-1, -1), 7),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8), ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('LINEBELOW', (0, 0), (-1, -2), 0.4, colors.HexColor('#DDE7E5')),
-        # Fila total
-        ('BACKGROUND', (0, -1), (-1, -1), ACCENT),
-        ('FONTNAME', (3, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (3, -1), (-1, -1), 11),
-        ('TEXTCOLOR', (0, -1), (-1, -1), INK),
-        ('TOPPADDING', (0, -1), (-1, -1), 10), ('BOTTOMPADDING', (0, -1), (-1, -1), 10),
-    ]
-    for i in range(1, len(rows) + 1):  # zebra
-        if i % 2 == 0:
-            style.append(('BACKGROUND', (0, i), (-1, i), ROW_ALT))
-    tbl.setStyle(TableStyle(style))
+    def _texto(n):
+        return f"Cuenta destino <b>*{account}</b> &nbsp;·&nbsp; Desde {after} · {n} transferencias"
+
+    # Tabla de movimientos, un tramo por página: cada tramo llena lo que
+    # queda del frame (la primera página, debajo del encabezado), así ninguna
+    # tabla se parte ni repite el encabezado a mitad de página.
+    alto_frame = doc.height - FRAME_PADDING
+    _, alto_header = _header(doc, _texto(10 ** 6), h_title, h_sub).wrap(doc.width, alto_frame)
+    fila = _row_height()
+    primera = max(1, int((alto_frame - alto_header - HEADER_GAP) // fila) - 1)
+    resto = max(1, int(alto_frame // fila) - 1)
+
+    story, total, n = [], 0.0, 0
+    for chunk in _chunks(rows, itertools.chain([primera], itertools.repeat(resto))):
+        data = [HEADER_ROW]
+        for r in chunk:
+            n += 1
+            total += r["amount"]
+            data.append([str(n), fmt_date(r["date"]), r["time"], f"*{r['src']}", fmt_cop(r["amount"])])
+        story.append(LongTable(data, colWidths=COL_WIDTHS, repeatRows=1, style=BODY_STYLE))
+    story.append(Table([["", "", "", "TOTAL", fmt_cop(total)]], colWidths=COL_WIDTHS, style=TOTAL_STYLE))
+
+    # Banda de encabezado (va primero, pero el conteo se conoce al final)
+    header = _header(doc, _texto(n), h_title, h_sub)
 
     generado = datetime.datetime.now(BOGOTA).strftime("%d/%m/%Y %H:%M")
     nota = (f"Generado el {generado} (hora Colombia) a partir de la búsqueda directa en Gmail. "
-            f"{n_emails} correos coincidieron con la búsqueda; {len(rows)} se reconocieron como "
-            f"transferencias a la cuenta destino"
-            + (f"; {unmatched} no coincidieron con el formato esperado." if unmatched else "."))
+            f"{n} correos se reconocieron como transferencias a la cuenta destino"
+            + (f"; {unmatched} correos revisados no coincidieron con el formato esperado."
+               if unmatched else "."))
+
+    doc.build([header, Spacer(1, HEADER_GAP), *story, Spacer(1, 16), Paragraph(nota, foot)])
+    return total, n
 
-    doc.build([header, Spacer(1, 14), tbl, Spacer(1, 16), Paragraph(nota, foot)])
-    return total
+
+# ---------------------------------------------------------------------------
+# CSV / XLSX (fila por fila, memoria constante)
+# ---------------------------------------------------------------------------
+EXPORT_HEADER = ["fecha", "hora", "cuenta_origen", "cuenta_destino", "monto"]
+
+
+def _export_row(r):
+    return [r["date"].isoformat(), r["time"], r["src"], r["dest"], r["amount"]]
+
+
+def write_csv(rows, out_path):
+    """Escribe `rows` en CSV a medida que llegan. Devuelve `(total, cantidad)`."""
+    total, n = 0.0, 0
+    with open(out_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADER)
+        for r in rows:
+            writer.writerow(_export_row(r))
+            total += r["amount"]
+            n += 1
+    return total, n
+
+
+def write_xlsx(rows, out_path):
+    """Escribe `rows` en XLSX con el modo write-only de openpyxl (no guarda la
+    hoja en memoria). Devuelve `(total, cantidad)`."""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise SystemExit("❌ Error: La librería 'openpyxl' no está instalada. Ejecuta: pip install openpyxl")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Transferencias")
+    ws.append(EXPORT_HEADER)
+    total, n = 0.0, 0
+    for r in rows:
+        ws.append(_export_row(r))
+        total += r["amount"]
+        n += 1
+    ws.append(["", "", "", "TOTAL", total])
+    wb.save(out_path)
+    return total, n
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx}
 
 
 def main():
-    ap = argparse.ArgumentParser(description="Reporte PDF de transferencias a una cuenta (vía Gmail).")
-    ap.add_argument('--account', default='3114096566', help="Cuenta destino a buscar.")
+    ap = argparse.ArgumentParser(description="Reporte de transferencias a una cuenta (vía Gmail).")
+    ap.add_argument('--account', action='append', default=None,
+                    help="Cuenta destino a buscar (repetible; por defecto 3114096566).")
     ap.add_argument('--after', default='2026/01/01', help="Fecha desde (YYYY/MM/DD).")
-    ap.add_argument('--out', default=None, help="Ruta del PDF de salida.")
+    ap.add_argument('--format', choices=['pdf', 'csv', 'xlsx'], default='pdf',
+                    help="Formato de salida (xlsx requiere openpyxl).")
+    ap.add_argument('--out', default=None, help="Ruta del archivo de salida (con una sola cuenta).")
+    ap.add_argument('--workers', type=int, default=4, help="Descargas en paralelo (por defecto 4).")
+    ap.add_argument('--no-cache', action='store_true', help="Ignora la caché local y busca todo de nuevo.")
     args = ap.parse_args()
-
-    out = args.out or os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-        f"reporte_transferencias_{args.account}.pdf")
+    accounts = args.account or ['3114096566']
+    if args.out and len(accounts) > 1:
+        ap.error("--out solo se puede usar con una sola --account")
+    after = args.after.replace('/', '-')
 
     db = conectar_db()
-    service = gmail_service(db)
-    rows, n_emails, unmatched = fetch_transfers(service, args.account, args.after)
-    if not rows:
-        print("⚠️ No se encontraron transferencias que coincidan.")
-        return
-    total = build_pdf(rows, args.account, args.after, out, n_emails, unmatched)
-    print(f"\n✅ {len(rows)} transferencias · total {fmt_cop(total)}")
-    print(f"📄 PDF: {out}")
-
+    creds = gmail_credentials(db)
+    cache = TransferCache(enabled=not args.no_cache)
+    fetch_transfers(gmail_service(creds), creds, accounts, after, cache, args.workers)
+    cache.save()
+
+    for account in accounts:
+        rows = iter_transfers(cache, account, after)
+        primera = next(rows, None)
+        if primera is None:
+            print(f"⚠️ No se encontraron transferencias a *{account} que coincidan.")
+            continue
+        rows = itertools.chain([primera], rows)
+        out = args.out or os.path.join(ROOT, f"reporte_transferencias_{account}.{args.format}")
+        if args.format == 'pdf':
+            total, n = build_pdf(rows, account, args.after, out, cache.sin_formato(account, after))
+        else:
+            total, n = WRITERS[args.format](rows, out)
+        print(f"\n✅ *{account}: {n} transferencias · total {fmt_cop(total)}")
+        print(f"📄 {args.format.upper()}: {out}")
 
 if __name__ == '__main__':
     main()
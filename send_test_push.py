@@ -9,57 +9,24 @@ Pensado para dispararse manualmente desde GitHub Actions (workflow
 
 Uso:
     python send_test_push.py            # crea tx de prueba + envía push a todos los tokens
+    python send_test_push.py --count=3 --digest  # 3 tx de prueba en una sola notificación resumen
     python send_test_push.py --cleanup  # borra las tx de prueba creadas por este script
 
 Requisito: al menos un dispositivo con notificaciones activadas (token en la
-colección fcm_tokens). Solo depende de firebase-admin.
+colección fcm_tokens). Solo depende de firebase-admin (usa push_notify.py, el
+mismo módulo que el sync).
 """
 import sys
 import datetime
-from firebase_admin import messaging
 from utils import conectar_db
+from push_notify import PushSender
+from bulk_ops import run
 
 TEST_TITLE = "🧪 PRUEBA PUSH"
 
 
-def enviar_push_pending(db, tx_id, tx):
-    """Envía un push data-only a todos los tokens en fcm_tokens.
-
-    Misma forma que `enviar_push_pending` en gmail_finanzas_sync.py; se duplica
-    aquí para que el script no dependa de los módulos pesados de Gmail/Gemini.
-    """
-    tokens = [d.id for d in db.collection('fcm_tokens').stream()]
-    if not tokens:
-        print("⚠️ No hay tokens en fcm_tokens. Abre la app → Yo → Avisos → Activar.")
-        return
-    print(f"📱 Tokens registrados: {len(tokens)}")
-
-    signo = '-' if tx.get('type') == 'debit' else '+'
-    monto = f"{signo}{float(tx.get('amount', 0)):,.0f} {tx.get('currency', 'COP')}"
-    body = f"{monto} · {tx.get('title', 'Movimiento')} · {tx.get('category', '')}"
-    url = f"/?editTx={tx_id}"
-
-    message = messaging.MulticastMessage(
-        tokens=tokens,
-        data={'txId': str(tx_id), 'url': url, 'title': '🧾 Pendiente de revisión', 'body': body},
-        # Sin fcm_options.link (requiere URL absoluta HTTPS); el deep link lo
-        # resuelve el service worker desde data.url.
-        webpush=messaging.WebpushConfig(
-            headers={'Urgency': 'high'},
-        ),
-    )
-    resp = messaging.send_each_for_multicast(message)
-    print(f"🔔 Push enviado: {resp.success_count} ok, {resp.failure_count} fallidos.")
-    for token, r in zip(tokens, resp.responses):
-        if not r.success:
-            print(f"   ❌ {token[:12]}… → {r.exception}")
-
-
 def cleanup(db):
-    n = 0
-    for doc in db.collection('finance_transactions').where('title', '==', TEST_TITLE).stream():
-        doc.reference.delete()
-        n += 1
+    n = run(db, 'delete', 'finance_transactions', where=[('title', '==', TEST_TITLE)])
     print(f"🧹 Eliminadas {n} transacciones de prueba.")
 
 
@@ -86,6 +53,12 @@ def main():
         return
 
     count = _parse_count()
+    digest = '--digest' in sys.argv
+    push = PushSender(db, digest=digest, background=False)
+    if not push.tokens():
+        print("⚠️ No hay tokens en fcm_tokens. Abre la app → Yo → Avisos → Activar.")
+        return
+    print(f"📱 Tokens registrados: {len(push.tokens())}")
     categorias = ["Mercado", "Transporte", "Restaurantes", "Servicios", "Salud"]
     montos = [50000, 120000, 23500, 89900, 15000]
 
@@ -106,9 +79,11 @@ def main():
         }
         _, doc_ref = db.collection('finance_transactions').add(tx)
         print(f"✅ Tx de prueba {i + 1}/{count} creada (ID: {doc_ref.id})")
-        enviar_push_pending(db, doc_ref.id, tx)
+        push.notificar(doc_ref.id, tx)
+    push.cerrar()
 
-    print(f"\n👉 Revisa tu dispositivo: deberían llegar {count} notificación(es), una por tx.")
+    esperadas = "1 notificación resumen" if digest and count > 1 else f"{count} notificación(es), una por tx"
+    print(f"\n👉 Revisa tu dispositivo: deberían llegar {esperadas}.")
     print("   Para limpiar: vuelve a correr el workflow con cleanup=true (o `--cleanup` local).")
 
 
@@ -0,0 +1,169 @@
+"""Tests de bulk_ops (con una colección de Firestore en memoria). Corre con:
+    python3 test_bulk_ops.py      (o pytest)
+"""
+
+import os
+import tempfile
+import types
+
+from google.api_core.exceptions import FailedPrecondition
+from google.rpc import code_pb2
+
+import bulk_ops
+from benchmarks.fakes import FakeFirestore
+from bulk_ops import MAX_ATTEMPTS, _Writer, parse_where, run, update_ids
+
+
+class _DB(FakeFirestore):
+    """Sin `bulk_writer`: ejercita el camino de WriteBatch. `fail_at` corta
+    el n-ésimo commit."""
+
+    def __init__(self, n):
+        super().__init__()
+        self.data["txs"] = {f"t{i:03d}": {"title": "PRUEBA" if i % 2 else "real", "n": i} for i in range(n)}
+        self.fail_at = None
+
+    def _rpc(self, name, reads=0, latency=True):
+        super()._rpc(name, reads, latency)
+        if name == "commit" and self.rpc["commit"] == self.fail_at:
+            raise RuntimeError("corte simulado")
+
+
+def test_parse_where():
+    assert parse_where("title==🧪 PRUEBA PUSH") == ("title", "==", "🧪 PRUEBA PUSH")
+    assert parse_where("amount>=1000") == ("amount", ">=", 1000)
+    assert parse_where("reviewed!=true") == ("reviewed", "!=", True)
+
+
+def test_delete_with_filter_paginates():
+    db = _DB(25)
+    assert run(db, "delete", "txs", [("title", "==", "PRUEBA")], page_size=5) == 12
+    assert sorted(v["title"] for v in db.data["txs"].values()) == ["real"] * 13
+    assert db.rpc["query"] == 3  # 5 + 5 + 2
+    # Solo se leen los IDs.
+    assert db.rpc["docs_read"] == 12
+
+
+def test_dry_run_writes_nothing():
+    db = _DB(10)
+    assert run(db, "delete", "txs", dry_run=True, page_size=4) == 10
+    assert len(db.data["txs"]) == 10 and db.rpc["commit"] == 0
+
+
+def test_update_and_copy():
+    db = _DB(6)
+    assert run(db, "update", "txs", [("n", ">", 3)], data={"reviewed": True}) == 2
+    assert [k for k, v in db.data["txs"].items() if v.get("reviewed")] == ["t004", "t005"]
+    assert run(db, "copy", "txs", dest="backup") == 6
+    assert db.data["backup"] == db.data["txs"]
+    assert update_ids(db, "txs", {"t000": {"title": "x"}, "t001": {"title": "y"}}) == 2
+    assert db.data["txs"]["t001"]["title"] == "y"
+
+
+def test_resume_from_checkpoint():
+    db = _DB(20)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "ck.json")
+        db.fail_at = 3
+        try:
+            run(db, "update", "txs", data={"ok": True}, checkpoint=checkpoint, page_size=5)
+            raise AssertionError("debió cortarse")
+        except RuntimeError:
+            pass
+        assert os.path.exists(checkpoint)
+        assert sum(1 for v in db.data["txs"].values() if v.get("ok")) == 10
+        db.fail_at = None
+        reads = db.rpc["query"]
+        assert run(db, "update", "txs", data={"ok": True}, checkpoint=checkpoint, page_size=5) == 20
+        assert db.rpc["query"] - reads == 3  # solo las 2 páginas que faltaban (+1 vacía)
+        assert all(v.get("ok") for v in db.data["txs"].values())
+        assert not os.path.exists(checkpoint)
+
+
+def test_checkpoint_of_another_operation_is_refused():
+    db = _DB(20)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "ck.json")
+        db.fail_at = 2
+        try:
+            run(db, "copy", "txs", [("n", ">", 3)], dest="backup", checkpoint=checkpoint, page_size=5)
+            raise AssertionError("debió cortarse")
+        except RuntimeError:
+            pass
+        db.fail_at = None
+        for kw in ({"where": [("n", ">", 9)], "dest": "backup"},
+                   {"where": [("n", ">", 3)], "dest": "otra"}):
+            try:
+                run(db, "copy", "txs", checkpoint=checkpoint, page_size=5, **kw)
+                raise AssertionError("debió rechazar el checkpoint")
+            except ValueError as e:
+                assert "otra operación" in str(e)
+        assert run(db, "copy", "txs", [("n", ">", 3)], dest="backup",
+                   checkpoint=checkpoint, page_size=5) == 16
+        assert db.data["backup"] == {k: v for k, v in db.data["txs"].items() if v["n"] > 3}
+
+
+class _SinIndice(_DB):
+    """Rechaza el orden por ID con un filtro de desigualdad, como Firestore
+    sin el índice compuesto."""
+
+    def _rpc(self, name, reads=0, latency=True):
+        if name == "query":
+            raise FailedPrecondition("The query requires an index.")
+        super()._rpc(name, reads, latency)
+
+
+def test_inequality_without_index_explains_it():
+    db = _SinIndice(5)
+    try:
+        run(db, "delete", "txs", [("n", ">=", 2)])
+        raise AssertionError("debió fallar")
+    except ValueError as e:
+        assert "índice compuesto (n, __name__)" in str(e) and "requires an index" in str(e)
+    assert len(db.data["txs"]) == 5
+
+
+def test_delete_and_update_read_only_ids():
+    db = _DB(4)
+    leidos = []
+    original = bulk_ops.iter_pages
+
+    def _iter_pages(*args):
+        for page in original(*args):
+            leidos.extend(snap.to_dict() for snap in page)
+            yield page
+    bulk_ops.iter_pages = _iter_pages
+    try:
+        assert run(db, "update", "txs", data={"ok": True}) == 4
+    finally:
+        bulk_ops.iter_pages = original
+    assert leidos == [{}] * 4
+    # Proyección vacía = documento completo (por eso no se usa `select([])`).
+    assert db.collection("txs").select([]).stream()[0].to_dict()["title"] == "real"
+
+
+def _failure(code, attempts):
+    op = types.SimpleNamespace(attempts=attempts, reference=types.SimpleNamespace(id="t000"))
+    return types.SimpleNamespace(code=code, message="error", operation=op, attempts=attempts)
+
+
+def test_retries_only_transient_errors():
+    writer = _Writer(_DB(1))
+    assert writer._on_error(_failure(code_pb2.UNAVAILABLE, 1), None)
+    assert writer._on_error(_failure(code_pb2.ABORTED, MAX_ATTEMPTS - 1), None)
+    assert not writer._on_error(_failure(code_pb2.ABORTED, MAX_ATTEMPTS), None)
+    assert not writer._on_error(_failure(code_pb2.INVALID_ARGUMENT, 1), None)
+    assert not writer._on_error(_failure(code_pb2.PERMISSION_DENIED, 1), None)
+    assert writer.fallidos == 3
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
@@ -0,0 +1,74 @@
+"""Tests de email_text (solo stdlib). Corre con:
+    python3 test_email_text.py      (o pytest)
+"""
+
+import base64
+import os
+
+from email_text import email_text, html_to_text
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures")
+
+
+def _b64(text, encoding="utf-8"):
+    return base64.urlsafe_b64encode(text.encode(encoding)).decode("ascii").rstrip("=")
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_html_drops_head_style_script():
+    html = _fixture("bancolombia_compra.html")
+    text = html_to_text(html)
+    assert "Compraste $125.900,00 en RAPPI COLOMBIA*DL con tu T.Cred *7761" in text
+    assert "encuéntranos" in text  # entidades y acentos
+    assert "mso-table" not in text and "_tracking" not in text and "<" not in text
+    assert "\n\n" not in text and "  " not in text
+
+
+def test_prefers_plain_over_html():
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        {"mimeType": "text/plain", "body": {"data": _b64("Compraste $1 en  TIENDA")}},
+        {"mimeType": "text/html", "body": {"data": _b64("<p>versión HTML</p>")}},
+    ]}
+    assert email_text(payload) == "Compraste $1 en TIENDA"
+
+
+def test_nested_html_and_attachments():
+    payload = {"mimeType": "multipart/mixed", "parts": [
+        {"mimeType": "multipart/related", "parts": [
+            {"mimeType": "text/html", "body": {"data": _b64("<div>Pagaste<br>$5</div>")}},
+            {"mimeType": "image/png", "body": {"attachmentId": "x"}},
+        ]},
+        {"mimeType": "application/pdf", "body": {"attachmentId": "y"}},
+    ]}
+    assert email_text(payload) == "Pagaste\n$5"
+
+
+def test_charset_and_single_part():
+    payload = {"mimeType": "text/plain",
+               "headers": [{"name": "Content-Type", "value": 'text/plain; charset="ISO-8859-1"'}],
+               "body": {"data": _b64("Transacción aprobada", "latin-1")}}
+    assert email_text(payload) == "Transacción aprobada"
+    assert email_text({"mimeType": "text/html", "body": {}}) == ""
+
+
+def test_max_chars_stops_early():
+    html = "<html><body>" + "".join(f"<p>línea {i}</p>" for i in range(20000)) + "</body></html>"
+    text = html_to_text(html, max_chars=100)
+    assert 100 <= len(text) < 20000
+    assert text.startswith("línea 0\nlínea 1")
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
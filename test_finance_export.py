@@ -0,0 +1,51 @@
+"""Tests de finance_export (normalización y plan de particiones, sin pyarrow). Corre con:
+    python3 test_finance_export.py      (o pytest)
+"""
+
+import datetime
+
+from finance_export import NO_MONTH, TEXT_FIELDS, normalize_category, normalize_tx, plan_changes
+
+BOGOTA = datetime.timezone(datetime.timedelta(hours=-5))
+
+
+def test_normalize_category():
+    assert normalize_category("Comida") == "Comida"
+    assert normalize_category({"name": "Transporte", "icon": "bus"}) == "Transporte"
+    assert normalize_category({"icon": "x"}) == "general"
+    assert normalize_category(None) == "general" and normalize_category("") == "general"
+
+
+def test_normalize_tx():
+    ts = datetime.datetime(2026, 10, 1, 20, 30, tzinfo=BOGOTA)
+    row = normalize_tx("a1", {"date": "2026-10-01", "amount": "12000", "category": {"name": "Comida"},
+                              "timestamp": ts, "extra": [1, 2]})
+    assert set(row) == {"id", "month", "amount", "timestamp", *TEXT_FIELDS}
+    assert row["month"] == "2026-10" and row["category"] == "Comida" and row["amount"] == 12000.0
+    assert row["timestamp"] == ts and row["timestamp"].tzinfo == datetime.timezone.utc
+    assert row["currency"] == "COP" and row["subcategory"] == ""
+
+    vieja = normalize_tx("b2", {"amount": "x", "timestamp": "2026-10-01"})
+    assert vieja["month"] == NO_MONTH and vieja["amount"] is None and vieja["timestamp"] is None
+
+
+def test_plan_changes_moves_between_months():
+    index = {"a1": "2026-09", "b2": "2026-10"}
+    rows = [normalize_tx("a1", {"date": "2026-10-02"}), normalize_tx("c3", {"date": "2026-10-03"}),
+            normalize_tx("b2", {"date": "2026-10-04"})]
+    upserts, removals = plan_changes(index, rows)
+    assert sorted(upserts) == ["2026-10"] and sorted(upserts["2026-10"]) == ["a1", "b2", "c3"]
+    assert removals == {"2026-09": {"a1"}}
+    assert index == {"a1": "2026-10", "b2": "2026-10", "c3": "2026-10"}
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
@@ -0,0 +1,75 @@
+"""Tests de finance_insights (métricas con NumPy, sin Firestore). Corre con:
+    python3 test_finance_insights.py      (o pytest)
+"""
+
+import datetime
+
+from finance_insights import EXCHANGE_RATE, Columns, compute_insights, window_start
+
+TODAY = datetime.date(2026, 10, 17)
+
+TXS = [
+    {"date": "2026-10-17", "amount": 10000, "type": "debit", "category": "Comida",
+     "context": "personal", "title": "Almuerzo"},
+    {"date": "2026-10-16", "amount": 5, "currency": "USD", "type": "debit",
+     "category": {"name": "Software"}, "context": "business", "title": "SaaS"},
+    {"date": "2026-10-01", "amount": 1000000, "type": "credit", "category": "Ingresos", "context": "personal"},
+    {"date": "2026-09-10", "amount": 800000, "type": "credit", "category": "Ingresos", "context": "personal"},
+    {"date": "2026-09-12", "amount": "20000", "type": "debit", "category": "Comida", "context": "personal"},
+    {"date": "2026-10-15", "amount": 50000, "type": "transfer", "context": "personal",
+     "destinationContext": "business"},
+    {"date": "sin fecha", "amount": 1},
+    {"date": "2026-10-10", "amount": "x"},
+]
+
+
+def test_columns():
+    cols = Columns(TXS)
+    assert cols.n == 8 and list(cols.valid) == [True] * 6 + [False, False]
+    assert cols.amount[1] == 5 * EXCHANGE_RATE and cols.amount[4] == 20000
+    assert cols.categories[cols.cat[1]] == "Software"
+
+
+def test_month_and_cashflow():
+    doc = compute_insights(TXS, TODAY)
+    assert doc["windowStart"] == window_start(TODAY) == "2026-04-01"
+    unified = doc["contexts"]["unified"]
+    assert unified["month"]["spent"] == 10000 + 5 * EXCHANGE_RATE
+    assert unified["month"]["income"] == 1000000
+    assert round(unified["month"]["prevSavings"], 2) == 97.5
+    assert unified["cashflow"][-2] == {"month": "2026-09", "income": 800000.0, "expenses": 20000.0}
+    assert [c["name"] for c in unified["categories"]] == ["Software", "Comida"]
+    comida = unified["topFugas"][1]
+    assert comida["prevAmount"] == 20000 and comida["trend"] == -50.0
+    assert unified["topFugas"][0]["trend"] is None
+    personal = doc["contexts"]["personal"]
+    assert personal["month"]["spent"] == 10000 and personal["todayCount"] == 1
+
+
+def test_daily_biggest_and_streak():
+    doc = compute_insights(TXS, TODAY)
+    business = doc["contexts"]["business"]
+    assert business["daily"][-2] == 5 * EXCHANGE_RATE and business["todayTotal"] == 0
+    assert business["biggest"] == {"title": "SaaS", "amount": 5.0 * EXCHANGE_RATE, "date": "2026-10-16"}
+    # Hoy sin movimientos en 'business': la racha cuenta desde ayer (16 y 15,
+    # la transferencia entrante).
+    assert business["streak"] == 2
+    assert doc["contexts"]["unified"]["streak"] == 3
+
+
+def test_empty():
+    unified = compute_insights([], TODAY)["contexts"]["unified"]
+    assert unified["month"]["savings"] == 0 and unified["streak"] == 0
+    assert unified["biggest"] is None and unified["categories"] == []
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
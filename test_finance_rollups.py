@@ -0,0 +1,79 @@
+"""Tests de finance_rollups (cálculo puro y deltas con Increment). Corre con:
+    python3 test_finance_rollups.py      (o pytest)
+"""
+
+from finance_rollups import EMPTY_KEY, _delta, compute_rollups, month_of
+
+TXS = [
+    {"date": "2026-10-01", "type": "debit", "amount": 12000, "currency": "COP",
+     "context": "personal", "category": "Transporte", "card": "Visa"},
+    {"date": "2026-10-15", "type": "debit", "amount": 50000, "currency": "COP",
+     "context": "business", "category": "Comida", "card": "Visa"},
+    {"date": "2026-10-20", "type": "credit", "amount": 1000000, "currency": "COP",
+     "context": "personal", "category": "Ingresos", "card": ""},
+    {"date": "2026-10-21", "type": "debit", "amount": "9.99", "currency": "USD",
+     "context": "personal", "category": "Servicios", "card": "Visa"},
+    {"date": "2026-11-02", "type": "debit", "amount": 8000, "currency": "COP",
+     "context": "personal", "category": "Transporte", "card": "Visa"},
+    {"date": "", "amount": 1},             # sin fecha: no suma
+    {"date": "2026-11-03", "amount": "x"},  # monto inválido: no suma
+]
+
+
+def test_month_of():
+    assert month_of({"date": "2026-10-01"}) == "2026-10"
+    assert month_of({"date": "01/10/2026"}) is None and month_of({}) is None
+
+
+def test_compute_rollups():
+    rollups = compute_rollups(TXS)
+    assert sorted(rollups) == ["2026-10", "2026-11"]
+    oct_ = rollups["2026-10"]
+    assert oct_["count"] == 4
+    assert oct_["currencies"]["COP"] == {"debit": 62000.0, "credit": 1000000.0, "count": 3}
+    assert oct_["currencies"]["USD"] == {"debit": 9.99, "credit": 0.0, "count": 1}
+    assert oct_["contexts"]["business"]["COP"]["debit"] == 50000
+    assert oct_["cards"]["Visa"]["COP"]["count"] == 2 and oct_["cards"]["Visa"]["USD"]["debit"] == 9.99
+    assert oct_["cards"][EMPTY_KEY]["COP"]["credit"] == 1000000
+    assert type(oct_["categories"]) is dict  # sin defaultdict: serializable
+    assert rollups["2026-11"]["categories"]["Transporte"]["COP"]["debit"] == 8000
+
+
+def test_delta_matches_rebuild_shape():
+    month, delta = _delta(TXS[0], -1)
+    assert month == "2026-10"
+    assert delta["count"].value == -1
+    bucket = delta["categories"]["Transporte"]["COP"]
+    assert bucket["debit"].value == -12000 and bucket["count"].value == -1
+    assert set(delta) == {"month", "count", "currencies", "contexts", "categories", "cards"}
+    assert _delta(TXS[5], 1) == (None, None)
+
+
+def test_transfers_skipped_and_object_category_by_name():
+    txs = TXS + [
+        {"date": "2026-10-05", "type": "transfer", "amount": 300000, "currency": "COP",
+         "context": "personal", "destinationContext": "business", "category": "Transferencia"},
+        {"date": "2026-10-06", "type": "debit", "isTransfer": True, "amount": 70000, "currency": "COP",
+         "context": "personal", "category": "Transferencia"},
+        {"date": "2026-10-07", "type": "debit", "amount": 3000, "currency": "COP", "context": "personal",
+         "category": {"name": "Transporte", "icon": "bus"}, "card": "Visa"},
+    ]
+    oct_ = compute_rollups(txs)["2026-10"]
+    assert oct_["count"] == 5
+    assert oct_["currencies"]["COP"] == {"debit": 65000.0, "credit": 1000000.0, "count": 4}
+    assert "Transferencia" not in oct_["categories"]
+    assert oct_["categories"]["Transporte"]["COP"]["debit"] == 15000
+    assert _delta(txs[-3], 1) == (None, None) and _delta(txs[-2], 1) == (None, None)
+    assert "Transporte" in _delta(txs[-1], 1)[1]["categories"]
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
@@ -0,0 +1,129 @@
+"""Tests de gemini_client (con un cliente de Gemini simulado). Corre con:
+    python3 test_gemini_client.py      (o pytest)
+"""
+
+import json
+import random
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from gemini_client import (
+    BATCH_SCHEMA, TRANSACTION_SCHEMA, GeminiExtractor, RateLimiter, backoff_delay, is_retryable,
+)
+
+
+class _Error(Exception):
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+class _Client:
+    """`genai.Client` falso: devuelve `respuestas` en orden (las excepciones
+    se lanzan) y después `{"type": "debit"}`."""
+
+    def __init__(self, respuestas=()):
+        self.respuestas = list(respuestas)
+        self.configs = []
+        self.aio = types.SimpleNamespace(models=types.SimpleNamespace(generate_content=self._generate))
+
+    async def _generate(self, model, contents, config):
+        self.configs.append(config)
+        r = self.respuestas.pop(0) if self.respuestas else '{"type": "debit"}'
+        if isinstance(r, Exception):
+            raise r
+        return types.SimpleNamespace(text=r, usage_metadata=None)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limiter_burst_then_rate():
+    clock = _Clock()
+    limiter = RateLimiter(rpm=60, burst=2, clock=clock)
+    assert limiter.wait_time() == 0 and limiter.wait_time() == 0
+    assert limiter.wait_time() == 1.0      # 1 ficha por segundo
+    clock.now = 1.0
+    assert limiter.wait_time() == 0
+
+
+def test_backoff_and_retryable():
+    rnd = random.Random(1)
+    delays = [backoff_delay(i, base=1, cap=5, rnd=rnd) for i in range(10)]
+    assert all(0 <= d <= min(5, 2 ** i) for i, d in enumerate(delays))
+    assert is_retryable(_Error(429)) and is_retryable(_Error(503))
+    assert is_retryable(json.JSONDecodeError("x", "", 0))
+    assert not is_retryable(_Error(400)) and not is_retryable(ValueError("x"))
+
+
+def test_retries_transient_errors_with_schema():
+    client = _Client([_Error(429), "no es json", '{"type": "credit", "amount": 5}'])
+    gemini = GeminiExtractor(client, "modelo", rpm=6000, backoff_base=0)
+    try:
+        datos, _ = gemini.generate_json("prompt")
+    finally:
+        gemini.close()
+    assert datos == {"type": "credit", "amount": 5}
+    assert gemini.reintentos == 2
+    assert client.configs[0].response_schema is not None
+    assert client.configs[0].response_mime_type == "application/json"
+    assert TRANSACTION_SCHEMA["required"] == ["type"] and BATCH_SCHEMA["type"] == "ARRAY"
+
+
+def test_gives_up_on_permanent_error_or_after_max_retries():
+    gemini = GeminiExtractor(_Client([_Error(400)]), "modelo", backoff_base=0)
+    try:
+        gemini.generate_json("prompt")
+        raise AssertionError("debió fallar")
+    except _Error as e:
+        assert e.code == 400 and gemini.reintentos == 0
+    finally:
+        gemini.close()
+
+    gemini = GeminiExtractor(_Client([_Error(503)] * 3), "modelo", max_retries=2, backoff_base=0)
+    try:
+        gemini.generate_json("prompt")
+        raise AssertionError("debió fallar")
+    except _Error:
+        assert gemini.reintentos == 2
+    finally:
+        gemini.close()
+
+
+def test_malformed_json_retried_once():
+    gemini = GeminiExtractor(_Client(["no es json", "{tampoco", '{"type": "debit"}']),
+                             "modelo", backoff_base=0)
+    try:
+        gemini.generate_json("prompt")
+        raise AssertionError("debió fallar")
+    except json.JSONDecodeError:
+        assert gemini.reintentos == 1
+    finally:
+        gemini.close()
+
+
+def test_shared_by_threads():
+    gemini = GeminiExtractor(_Client(), "modelo", rpm=6000, concurrency=2)
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            resultados = list(pool.map(lambda i: gemini.generate_json(f"p{i}")[0], range(8)))
+    finally:
+        gemini.close()
+    assert resultados == [{"type": "debit"}] * 8
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
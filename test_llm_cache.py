@@ -0,0 +1,58 @@
+"""Tests de llm_cache (solo stdlib). Corre con:
+    python3 test_llm_cache.py      (o pytest)
+"""
+
+import os
+import tempfile
+import time
+
+from llm_cache import ExtractionCache, cache_key
+
+
+def _cache(**kwargs):
+    return ExtractionCache(os.path.join(tempfile.mkdtemp(), "cache.sqlite"), **kwargs)
+
+
+def test_key_normalizes_whitespace_and_versions():
+    assert cache_key("Compraste  $1\n en X", 2, "m") == cache_key(" Compraste $1 en X ", 2, "m")
+    assert cache_key("Compraste $1 en X", 2, "m") != cache_key("Compraste $1 en X", 3, "m")
+    assert cache_key("Compraste $1 en X", 2, "m") != cache_key("Compraste $1 en X", 2, "otro")
+
+
+def test_hit_miss_and_persistence():
+    cache = _cache()
+    assert cache.get("k") is None
+    cache.put("k", {"type": "debit", "title": "Café"})
+    assert cache.get("k") == {"type": "debit", "title": "Café"}
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    again = ExtractionCache(cache.path)
+    assert again.get("k")["title"] == "Café"
+
+
+def test_ttl_and_size_eviction():
+    cache = _cache(ttl_days=1, max_entries=2)
+    for i in range(4):
+        cache.put(f"k{i}", {"i": i})
+        time.sleep(0.01)
+    cache.get("k0")  # recién usada: sobrevive a la expulsión por tamaño
+    assert cache.evict() == 2
+    assert cache.get("k0") == {"i": 0} and cache.get("k3") == {"i": 3}
+    assert cache.get("k1") is None
+
+    cache.ttl = 0
+    assert cache.get("k0") is None
+    assert cache.evict() == 2 and len(cache) == 0
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
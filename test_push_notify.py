@@ -0,0 +1,79 @@
+"""Tests de push_notify (FCM y Firestore en memoria de benchmarks/fakes.py).
+Corre con:
+    python3 test_push_notify.py      (o pytest)
+"""
+
+import push_notify
+from benchmarks.fakes import FakeFirestore, FakeMessaging
+from push_notify import PushSender, digest_data, push_data
+
+
+def _sender(tokens, **kwargs):
+    """PushSender sobre Firestore y FCM en memoria: el token "muerto" falla
+    como no registrado."""
+    fake = FakeMessaging(invalid=["muerto"])
+    push_notify.messaging = fake
+    db = FakeFirestore()
+    db.data["fcm_tokens"] = {t: {"platform": "web"} for t in tokens}
+    return PushSender(db, **kwargs), db, fake
+
+
+TX = {"type": "debit", "amount": 12000, "currency": "COP", "title": "UBER", "category": "Transporte"}
+
+
+def test_push_data():
+    data = push_data("tx1", TX)
+    assert data == {"txId": "tx1", "url": "/?editTx=tx1", "title": "🧾 Pendiente de revisión",
+                    "body": "-12,000 COP · UBER · Transporte"}
+    assert all(isinstance(v, str) for v in digest_data([("a", TX)] * 6).values())
+
+
+def test_tokens_loaded_once_and_invalid_deleted_in_one_batch():
+    sender, db, fake = _sender(["bueno", "muerto"])
+    for i in range(3):
+        sender.notificar(f"tx{i}", TX)
+    sender.cerrar()
+    assert db.rpc["query"] == 1
+    assert len(fake.sent) == 3
+    # Tras el primer fallo el token inválido ya no se usa en la corrida.
+    assert [m.tokens for m in fake.sent[1:]] == [["bueno"], ["bueno"]]
+    assert db.rpc["commit"] == 1 and list(db.data["fcm_tokens"]) == ["bueno"]
+
+
+def test_digest_folds_run_into_one_notification():
+    sender, db, fake = _sender(["bueno"], digest=True)
+    for i in range(6):
+        sender.notificar(f"tx{i}", TX)
+    assert fake.sent == []
+    sender.cerrar()
+    assert len(fake.sent) == 1
+    data = fake.sent[0].data
+    assert data["txIds"] == "tx0,tx1,tx2,tx3,tx4,tx5" and data["url"] == "/"
+    assert data["title"].startswith("🧾 6 movimientos") and data["body"].endswith("y 2 más")
+
+
+def test_digest_with_single_tx_keeps_deep_link():
+    sender, _, fake = _sender(["bueno"], digest=True, background=False)
+    sender.notificar("tx9", TX)
+    sender.cerrar()
+    assert fake.sent[0].data["url"] == "/?editTx=tx9"
+
+
+def test_no_tokens_sends_nothing():
+    sender, db, fake = _sender([])
+    sender.notificar("tx1", TX)
+    sender.notificar("tx2", TX)
+    sender.cerrar()
+    assert fake.sent == [] and db.rpc["query"] == 1 and db.rpc["commit"] == 0
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
@@ -0,0 +1,117 @@
+"""Tests de la caché de scripts/reporte_transferencias.py (Gmail en memoria).
+Corre con:
+    python3 test_reporte_transferencias.py      (o pytest)
+"""
+
+import os
+import json
+import tempfile
+
+from benchmarks.fakes import FakeGmail, make_emails
+from scripts import reporte_transferencias as reporte
+from scripts.reporte_transferencias import TransferCache, fetch_transfers, iter_transfers
+
+CUENTA = "3114096566"
+AFTER = "2026-01-01"
+
+
+def _path():
+    return os.path.join(tempfile.mkdtemp(), "transferencias.json")
+
+
+def _fetch(gmail, cache):
+    original, reporte.gmail_service = reporte.gmail_service, lambda creds: gmail
+    try:
+        return fetch_transfers(gmail, None, [CUENTA], AFTER, cache, workers=2)
+    finally:
+        reporte.gmail_service = original
+
+
+def _tx(date, time, dest=CUENTA):
+    return {"date": date, "time": time, "amount": 1000.0, "src": "2823", "dest": dest}
+
+
+def test_miss_then_hit():
+    emails = make_emails(30)
+    gmail, path = FakeGmail(emails), _path()
+    cache = TransferCache(path)
+    _fetch(gmail, cache)
+    assert set(cache.mensajes) == set(emails) and gmail.rpc["messages.get"] == 30
+    assert cache.cuentas[CUENTA]["desde"] == AFTER
+    cache.save()
+
+    gmail = FakeGmail(emails)
+    cache = TransferCache(path)
+    _fetch(gmail, cache)
+    assert gmail.rpc["messages.get"] == 0 and gmail.rpc["messages.list"] == 1
+    assert len(list(iter_transfers(cache, CUENTA, AFTER))) == sum(
+        1 for tx in cache.mensajes.values() if "amount" in tx)
+
+    # Un correo nuevo: solo ese se descarga.
+    emails["nuevo"] = {**emails["msg00000"], "id": "nuevo"}
+    gmail = FakeGmail(emails)
+    _fetch(gmail, cache)
+    assert gmail.rpc["messages.get"] == 1 and "nuevo" in cache.mensajes
+
+
+def test_invalidated_by_regex_version():
+    path = _path()
+    cache = TransferCache(path)
+    cache.agregar({"a": _tx("2026-02-01", "10:00")})
+    cache.marcar(CUENTA, AFTER, "2026-02-02")
+    cache.save()
+    assert TransferCache(path).mensajes == {"a": _tx("2026-02-01", "10:00")}
+    assert TransferCache(path, enabled=False).mensajes == {}
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["version"] = "otra"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    cache = TransferCache(path)
+    assert cache.mensajes == {} and cache.cuentas == {}
+    assert cache.desde(CUENTA, AFTER) == AFTER
+
+
+def _otro(date, time, *numeros):
+    return {"date": date, "time": time, "numeros": list(numeros)}
+
+
+def test_unmatched_per_account_and_range():
+    emails = make_emails(30)
+    cache = TransferCache(_path())
+    _fetch(FakeGmail(emails), cache)
+    # Los correos de prueba sin el formato no mencionan la cuenta.
+    assert cache.sin_formato(CUENTA, AFTER) == 0
+
+    cache.agregar({"viejo": _otro("2025-12-31", "10:00", CUENTA),
+                   "nuevo": _otro("2026-02-01", "10:00", "0000" + CUENTA[-6:]),
+                   "ajeno": _otro("2026-02-01", "11:00", "3000000000")})
+    assert cache.sin_formato(CUENTA, AFTER) == 1
+    assert cache.sin_formato(CUENTA, "2025-12-01") == 2
+    assert cache.sin_formato("3000000000", AFTER) == 1
+    # No son filas del reporte.
+    assert all(r["amount"] for r in iter_transfers(cache, CUENTA, "2025-12-01"))
+
+
+def test_stored_in_date_order():
+    cache = TransferCache(_path())
+    cache.agregar({"b": _tx("2026-03-01", "09:00"), "x": _otro("2026-01-15", "12:00")})
+    cache.agregar({"c": _tx("2026-03-02", "08:00"), "a": _tx("2026-02-28", "23:00"),
+                   "otra": _tx("2026-03-01", "10:00", dest="3000000000")})
+    assert list(cache.mensajes) == ["x", "a", "b", "otra", "c"]
+    rows = list(iter_transfers(cache, CUENTA, "2026-03-01"))
+    assert [(r["date"].isoformat(), r["time"]) for r in rows] == [("2026-03-01", "09:00"),
+                                                                   ("2026-03-02", "08:00")]
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
@@ -0,0 +1,67 @@
+"""Tests de run_metrics (solo stdlib). Corre con:
+    python3 test_run_metrics.py      (o pytest)
+"""
+
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from run_metrics import RunMetrics, percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) == 0.0
+
+
+def test_spans_counters_and_summary():
+    m = RunMetrics()
+    m.reset(trace_memory=True)
+
+    @m.timed("etapa")
+    def trabajo(i):
+        m.count("llamadas")
+        return i
+
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(trabajo, range(50))) == list(range(50))
+    try:
+        with m.span("falla"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    data = m.summary(modo="test")
+    assert data["stages"]["etapa"]["n"] == 50 and data["stages"]["falla"]["n"] == 1
+    assert data["stages"]["etapa"]["p50_ms"] <= data["stages"]["etapa"]["p95_ms"]
+    assert data["counters"] == {"llamadas": 50}
+    assert data["modo"] == "test" and data["tracemalloc_peak_kb"] > 0
+    m.reset()
+
+
+def test_write_summary_appends_json_lines():
+    m = RunMetrics()
+    path = os.path.join(tempfile.mkdtemp(), "metrics.jsonl")
+    m.count("x")
+    m.write_summary(path)
+    m.reset()
+    m.write_summary(path)
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["counters"] for line in lines] == [{"x": 1}, {}]
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
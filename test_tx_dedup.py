@@ -0,0 +1,125 @@
+"""Tests de tx_dedup (índice de duplicados, sin Firestore). Corre con:
+    python3 test_tx_dedup.py      (o pytest)
+"""
+
+import datetime
+
+from benchmarks.fakes import FakeFirestore
+from tx_dedup import (
+    BUCKET_MINUTES, DUPLICATE, POSSIBLE, DedupIndex, dedup_entry, load_dedup_index, prune_dedup,
+    record_dedup,
+)
+
+BOGOTA = datetime.timezone(datetime.timedelta(hours=-5))
+T0 = datetime.datetime(2026, 10, 17, 12, 59, tzinfo=BOGOTA)
+
+
+def _tx(minutes=0, **kw):
+    tx = {"amount": 45900.0, "currency": "COP", "card": "Visa", "type": "debit",
+          "title": "RAPPI COLOMBIA", "date": "2026-10-17",
+          "timestamp": T0 + datetime.timedelta(minutes=minutes)}
+    tx.update(kw)
+    return tx
+
+
+def test_entry():
+    e = dedup_entry(_tx())
+    assert e["a"] == 4590000 and e["m"] == "rappi colombia" and e["t"] % BUCKET_MINUTES != 0
+    assert dedup_entry(_tx(), timed=False)["t"] is None
+    assert dedup_entry(_tx(amount="x")) is None
+
+
+def test_same_purchase_notified_twice():
+    index = DedupIndex()
+    index.add("a1", _tx())
+    # Otro tramo de 15 minutos, pero dentro de la ventana.
+    assert index.match(_tx(minutes=2, title="rappi  colombia.")) == (DUPLICATE, "a1")
+    # Comercio abreviado: solo se marca.
+    assert index.match(_tx(minutes=2, title="Rappi")) == (POSSIBLE, "a1")
+    assert index.match(_tx(minutes=BUCKET_MINUTES + 1)) == (POSSIBLE, "a1")
+    assert index.match(_tx(minutes=2, card="Ahorros")) == (POSSIBLE, "a1")
+    assert index.match(_tx(minutes=2, type="credit")) is None
+    assert index.match(_tx(minutes=2, title="Uber")) is None
+    assert index.match(_tx(minutes=2, amount=45901)) is None
+
+
+def test_empty_merchant_is_never_dropped():
+    index = DedupIndex()
+    index.add("a1", _tx())
+    assert index.match(_tx(minutes=3, title="")) == (POSSIBLE, "a1")
+    index = DedupIndex()
+    index.add("sin", _tx(title=""))
+    assert index.match(_tx(minutes=3)) == (POSSIBLE, "sin")
+    assert index.match(_tx(minutes=3, title="")) == (POSSIBLE, "sin")
+
+
+def test_manual_entry_only_matches_by_day():
+    index = DedupIndex()
+    index.add("m1", _tx(card="Bancolombia", timestamp=None), timed=False)
+    assert index.match(_tx()) == (POSSIBLE, "m1")
+    assert index.match(_tx(date="2026-10-18")) is None
+
+
+def test_roundtrip_and_stale():
+    index = DedupIndex()
+    index.add("old", _tx(minutes=-7 * 24 * 60, date="2026-10-10"))
+    index.add("new", _tx())
+    copia = DedupIndex(dict(index.entries))
+    assert copia.match(_tx(minutes=1)) == (DUPLICATE, "new")
+    assert copia.stale(datetime.date(2026, 10, 17)) == ["old"]
+
+
+def test_remove():
+    index = DedupIndex()
+    index.add("a1", _tx())
+    index.add("a2", _tx(minutes=24 * 60, date="2026-10-18"))
+    index.remove("a1")
+    index.remove("nunca")
+    assert index.match(_tx(minutes=1)) is None
+    assert index.match(_tx(minutes=24 * 60 + 1, date="2026-10-18")) == (DUPLICATE, "a2")
+
+
+def test_failed_block_drops_its_fingerprints():
+    from gmail_finanzas_sync import SyncBatch
+
+    class _SinCommit(FakeFirestore):
+        def _rpc(self, name, reads=0, latency=True):
+            super()._rpc(name, reads, latency)
+            if name == "commit":
+                raise RuntimeError("corte simulado")
+
+    index = DedupIndex()
+    lote = SyncBatch(_SinCommit(), None, None)
+    lote.agregar_transaccion(_tx(), index)
+    # El resto del bloque ya la ve...
+    assert index.match(_tx(minutes=1))[0] == DUPLICATE
+    # ...pero si el bloque no se guarda, el reintento no se descarta.
+    assert lote.confirmar() is False
+    assert index.match(_tx(minutes=1)) is None and index.entries == {}
+
+
+def test_load_is_read_only_and_prune_goes_in_batch():
+    db = FakeFirestore()
+    record_dedup(db, "old", dedup_entry(_tx(date="2026-10-10")))
+    record_dedup(db, "new", dedup_entry(_tx()))
+    db.rpc.clear()
+    index = load_dedup_index(db, datetime.date(2026, 10, 17))
+    assert set(index.entries) == {"new"} and index.podadas == {"old"}
+    assert db.rpc["set"] == 0 and db.rpc["commit"] == 0
+
+    batch = db.batch()
+    prune_dedup(db, index.podadas, batch)
+    batch.commit()
+    assert set(db.data["dedup_index"]["recent"]["entries"]) == {"new"}
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
@@ -2,9 +2,15 @@
     python3 test_tx_enrich.py      (o pytest)
 """
 
+import difflib
+import random
+import time
+
 from tx_enrich import (
     normalize_merchant, looks_like_statement, build_merchant_memory,
     apply_merchant_memory, validate_classification, memory_for_prompt,
+    merchant_counts, add_to_merchant_counts, memory_from_counts, FuzzyIndex,
+    MerchantClassifier, apply_classifier,
 )
 
 HISTORY = [
@@ -39,6 +45,35 @@ def test_memory_majority():
     assert mem["uber"]["ctx_agree"] == 1.0
 
 
+def test_incremental_counts_match_full_rebuild():
+    counts = merchant_counts(HISTORY[:-1])
+    add_to_merchant_counts(counts, HISTORY[-1])
+    assert memory_from_counts(counts) == build_merchant_memory(HISTORY)
+
+
+def test_object_category_counts_by_name():
+    # Forma antigua: la categoría guardada como objeto {name, icon, ...}.
+    history = HISTORY + [{"title": "UBER", "category": {"name": "Transporte", "icon": "bus"},
+                          "subcategory": "Uber/Taxi", "context": "personal"}]
+    counts = merchant_counts(history)
+    assert counts["uber"]["category"] == {"Transporte": 4}
+    assert build_merchant_memory(history)["uber"]["cat_agree"] == 1.0
+
+
+def test_counts_recategorize_and_remove():
+    counts = merchant_counts(HISTORY)
+    uber = {"title": "UBER", "category": "Transporte", "subcategory": "Uber/Taxi", "context": "personal"}
+    add_to_merchant_counts(counts, uber, sign=-1)
+    add_to_merchant_counts(counts, {**uber, "context": "business"})
+    mem = memory_from_counts(counts)
+    assert mem["uber"]["count"] == 3
+    assert mem["uber"]["ctx_agree"] == 2 / 3
+    # un comercio sin transacciones sale de la memoria
+    only = merchant_counts([uber])
+    add_to_merchant_counts(only, uber, sign=-1)
+    assert memory_from_counts(only) == {}
+
+
 def test_apply_overrides_when_confident():
     mem = build_merchant_memory(HISTORY)
     datos = {"type": "debit", "title": "UBER", "category": "Otros",
@@ -70,12 +105,156 @@ def test_validate_classification():
     assert out["card"] == "Rappi Visa *3315"  # fuzzy-snap a cuenta válida
 
 
+def test_apply_with_index_matches_difflib():
+    mem = build_merchant_memory(HISTORY)
+    datos = {"type": "debit", "title": "UBERR", "category": "Otros",
+             "subcategory": "", "context": "business"}
+    assert apply_merchant_memory(datos, mem, index=FuzzyIndex(mem)) == apply_merchant_memory(datos, mem)
+
+
+def test_fuzzy_index_same_as_difflib():
+    rng = random.Random(7)
+    alphabet = "abcde fgh"   # alfabeto chico → muchos trigramas repetidos
+    for _ in range(500):
+        keys = list({"".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+                     for _ in range(rng.randint(1, 30))})
+        index = FuzzyIndex(keys)
+        query = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        for cutoff in (0.6, 0.8, 0.9):
+            expected = difflib.get_close_matches(query, keys, n=1, cutoff=cutoff)
+            assert index.best_match(query, cutoff) == (expected[0] if expected else None)
+
+
+def _fake_merchants(rng, n):
+    """Nombres de comercio sintéticos: 1-3 palabras al azar, a veces con sucursal."""
+    letters = "abcdefghijklmnopqrstuvwxyzñ"
+    word = lambda: "".join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+    return list({" ".join(word() for _ in range(rng.randint(1, 3)))
+                 + (f" {rng.randint(1, 99)}" if rng.random() < 0.3 else "")
+                 for _ in range(n)})
+
+
+def test_fuzzy_index_benchmark_10k():
+    """Micro-benchmark: 10k comercios, consultas con typos. Mismos resultados
+    que difflib y bastante más rápido."""
+    rng = random.Random(42)
+    keys = _fake_merchants(rng, 12000)[:10000]
+    queries = []
+    for key in rng.sample(keys, 60):
+        chars = list(key)
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        queries.append("".join(chars))
+    queries += [f"comercio nuevo {i}" for i in range(20)]
+
+    t0 = time.perf_counter()
+    expected = [difflib.get_close_matches(q, keys, n=1, cutoff=0.9) for q in queries]
+    t_difflib = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = FuzzyIndex(keys)
+    t_build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    got = [index.best_match(q, 0.9) for q in queries]
+    t_index = time.perf_counter() - t0
+
+    assert got == [e[0] if e else None for e in expected]
+    print(f"\n  difflib: {t_difflib / len(queries) * 1e3:.2f} ms/consulta · "
+          f"índice: {t_index / len(queries) * 1e3:.3f} ms/consulta "
+          f"(construcción {t_build * 1e3:.0f} ms) · ×{t_difflib / t_index:.0f}")
+    assert t_index < t_difflib
+
+
 def test_memory_for_prompt_shape():
     mem = build_merchant_memory(HISTORY)
     rows = memory_for_prompt(mem, top_n=10)
     assert rows[0]["comercio"] and "category" in rows[0] and "visto" in rows[0]
 
 
+def test_classifier_generalizes_by_words():
+    history = HISTORY + [{"title": "AWS EMEA", "category": "Software", "subcategory": "Cloud",
+                          "context": "business"}] * 6
+    clf = MerchantClassifier.train(history)
+    label, _ = clf.predict("UBER")
+    assert label == {"type": "debit", "category": "Transporte", "subcategory": "Uber/Taxi",
+                     "context": "personal"}
+    # Variante nunca vista: comparte la palabra "aws".
+    label, confidence = clf.predict("AWS US-EAST")
+    assert label["category"] == "Software" and label["context"] == "business"
+    assert confidence > 0.5
+    assert clf.predict("ZARA") is None
+
+
+def test_classifier_predicts_whole_classification():
+    history = [{"title": "NOMINA ACME", "type": "credit", "category": "Ingresos", "subcategory": "Salario",
+                "context": "business"}] * 8 + \
+              [{"title": "ACME STORE", "type": "debit", "category": "Compras", "subcategory": "",
+                "context": "personal"}] * 8
+    clf = MerchantClassifier.train(history)
+    # Cada predicción es la clasificación de algún comercio, nunca una mezcla.
+    for title in ("ACME", "ACME NOMINA", "ACME STORE BOGOTA", "NOMINA STORE"):
+        label, _ = clf.predict(title)
+        assert label in ({"type": "credit", "category": "Ingresos", "subcategory": "Salario",
+                          "context": "business"},
+                         {"type": "debit", "category": "Compras", "subcategory": "", "context": "personal"})
+    # Tipo distinto al de la plantilla: no se aplica.
+    datos = {"type": "debit", "title": "NOMINA ACME SAS", "category": None, "subcategory": None,
+             "context": None}
+    assert clf.predict("NOMINA ACME SAS")[0]["type"] == "credit"
+    assert apply_classifier(datos, clf) == (datos, None)
+    out, _ = apply_classifier({**datos, "type": "credit"}, clf)
+    assert out["category"] == "Ingresos" and out["type"] == "credit"
+
+
+def test_classifier_inconsistent_merchant_is_mixed():
+    history = [{"title": "TIENDA CENTRO", "category": c, "subcategory": "", "context": "personal"}
+               for c in ("Hogar", "Ropa", "Comida", "Hogar", "Ropa", "Comida")] * 3
+    clf = MerchantClassifier.train(history)
+    label, confidence = clf.predict("TIENDA CENTRO NORTE")
+    assert label is None and confidence > 0.5
+    datos = {"type": "debit", "title": "TIENDA CENTRO NORTE", "category": None, "subcategory": None,
+             "context": None}
+    assert apply_classifier(datos, clf, min_confidence=0.0) == (datos, None)
+
+
+def test_classifier_counts_without_type_fall_back():
+    # Conteos persistidos antes de contar el tipo: se clasifica con los demás
+    # campos y el tipo no se compara hasta el rebuild.
+    typed = MerchantClassifier.train(HISTORY * 3)
+    counts = merchant_counts(HISTORY * 3)
+    for entry in counts.values():
+        del entry["type"]
+    clf = MerchantClassifier.from_counts(counts)
+    label, confidence = clf.predict("UBER")
+    assert label == {**typed.predict("UBER")[0], "type": None}
+    assert confidence == typed.predict("UBER")[1]
+    datos = {"type": "credit", "title": "UBER", "category": None, "subcategory": None, "context": None}
+    assert apply_classifier(datos, clf)[0]["category"] == label["category"]
+    # Una transacción nueva no completa el tipo de las viejas.
+    clf.add(HISTORY[-1])
+    assert clf.predict("UBER")[0]["type"] is None
+
+
+def test_classifier_incremental_matches_training():
+    clf = MerchantClassifier()
+    for tx in HISTORY:
+        clf.add(tx)
+    assert clf.predict("rappi") == MerchantClassifier.train(HISTORY).predict("rappi")
+    # Restar lo sumado deja el clasificador sin evidencia.
+    for tx in HISTORY:
+        clf.add(tx, sign=-1)
+    assert clf.predict("rappi") is None
+
+
+def test_apply_classifier_needs_confidence():
+    clf = MerchantClassifier.train(HISTORY * 3)
+    datos = {"type": "debit", "title": "UBER", "category": None, "subcategory": None, "context": None}
+    out, info = apply_classifier(datos, clf)
+    assert out["category"] == "Transporte" and info["confidence"] >= 0.9
+    assert apply_classifier(datos, clf, min_confidence=1.0) == (datos, None)
+    assert apply_classifier({**datos, "type": "ignore"}, clf) == ({**datos, "type": "ignore"}, None)
+    assert apply_classifier(datos, None) == (datos, None)
+
+
 def _run():
     fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
     for fn in fns:
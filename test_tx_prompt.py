@@ -0,0 +1,136 @@
+"""Tests de tx_prompt (puro, sin Firebase/Gemini). Corre con:
+    python3 test_tx_prompt.py      (o pytest)
+"""
+
+import json
+import threading
+
+from tx_enrich import build_merchant_memory, memory_for_prompt
+from tx_prompt import (
+    MerchantSelector, select_merchants, select_categories, build_prompt,
+    build_batch_prompt, parse_batch_response, estimate_tokens, compact_json,
+)
+
+HISTORY = (
+    [{"title": "RAPPI", "category": "Comida", "subcategory": "Domicilios/Rappi", "context": "personal"}] * 5
+    + [{"title": "UBER RIDES", "category": "Transporte", "subcategory": "Uber/Taxi", "context": "personal"}] * 4
+    + [{"title": f"COMERCIO {i:03d}", "category": "Hogar", "subcategory": "Mercado", "context": "personal"}
+       for i in range(80) for _ in range(3)]
+)
+
+CAT_TREE = [
+    {"name": "Comida", "subcategories": ["Domicilios/Rappi", "Restaurantes"]},
+    {"name": "Transporte", "subcategories": ["Uber/Taxi", "Gasolina"]},
+    {"name": "Hogar", "subcategories": ["Mercado", "Servicios"]},
+    {"name": "Otros", "subcategories": []},
+]
+
+EMAIL = "Bancolombia: Compraste $25.000 en UBER RIDES con tu T.Cred *1234, el 09/10/2025."
+
+
+def _memory():
+    mem = build_merchant_memory(HISTORY)
+    return mem, MerchantSelector(mem)
+
+
+def test_selector_picks_relevant_merchant():
+    mem, selector = _memory()
+    assert selector.select(EMAIL, mem)[0] == "uber rides"
+    # Un typo en el correo también encuentra al comercio (fuzzy por palabra).
+    assert "uber rides" in selector.select("Compraste en UBERR RIDES", mem)
+    assert selector.select("Compraste en un sitio desconocido", mem) == []
+
+
+def test_selector_add():
+    mem, selector = _memory()
+    mem = {**mem, "netflix": {**mem["rappi"], "merchant": "NETFLIX"}}
+    selector.add("netflix")
+    assert selector.select("Pago a NETFLIX.COM", mem) == ["netflix"]
+
+
+def test_selector_add_while_selecting():
+    """`add` desde el hilo principal mientras los hilos del pool llaman a
+    `select` (como `SyncContext.recordar` con --workers)."""
+    mem, selector = _memory()
+    errores, listo = [], threading.Event()
+
+    def leer():
+        try:
+            while not listo.is_set():
+                selector.select("Compraste en COMERCIO 001 con tu tarjeta", mem)
+        except Exception as e:  # noqa: BLE001
+            errores.append(e)
+
+    hilos = [threading.Thread(target=leer) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for i in range(3000):
+        selector.add(f"comercio nuevo {i}")
+    listo.set()
+    for h in hilos:
+        h.join()
+    assert errores == []
+
+
+def test_select_merchants_relevant_first_then_frequent():
+    mem, selector = _memory()
+    rows = select_merchants(EMAIL, mem, selector, relevant=5, frequent=3)
+    assert rows[0]["comercio"] == "UBER RIDES"
+    assert len(rows) == 4 and rows[1]["comercio"] == "RAPPI"
+
+
+def test_select_categories_trims_subcategories():
+    mem, selector = _memory()
+    rows = select_merchants(EMAIL, mem, selector, frequent=0)
+    tree = select_categories(EMAIL, CAT_TREE, rows)
+    assert [c["name"] for c in tree] == [c["name"] for c in CAT_TREE]
+    assert tree[1]["subcategories"] == ["Uber/Taxi", "Gasolina"]
+    assert "subcategories" not in tree[0]
+    # Sin nada relevante se manda el árbol completo.
+    assert select_categories("hola", CAT_TREE, []) == CAT_TREE
+
+
+def test_prompt_smaller_than_full_context():
+    mem, selector = _memory()
+    recientes = HISTORY[:20]
+    prompt = build_prompt(EMAIL, CAT_TREE, ["Visa"], ["COP"], mem, recientes, selector)
+    assert EMAIL in prompt and '"comercio":"UBER RIDES"' in prompt
+
+    completo = (json.dumps(CAT_TREE, ensure_ascii=False, indent=2)
+                + json.dumps(memory_for_prompt(mem), ensure_ascii=False, indent=2)
+                + json.dumps(recientes, ensure_ascii=False, indent=2))
+    seleccion = compact_json(select_merchants(EMAIL, mem, selector))
+    assert estimate_tokens(seleccion) * 3 < estimate_tokens(completo)
+    assert estimate_tokens(prompt) < estimate_tokens(completo)
+
+
+def test_batch_prompt_shares_context():
+    mem, selector = _memory()
+    correos = [(f"id{i}", EMAIL.replace("25.000", f"{i}.000")) for i in range(10)]
+    prompt = build_batch_prompt(correos, CAT_TREE, ["Visa"], ["COP"], mem, HISTORY[:20], selector)
+    assert all(f'<correo id="id{i}">' in prompt for i in range(10))
+    assert prompt.count("Reglas para los campos") == 1
+
+    uno = build_prompt(EMAIL, CAT_TREE, ["Visa"], ["COP"], mem, HISTORY[:20], selector)
+    assert estimate_tokens(prompt) < 3 * estimate_tokens(uno)
+
+
+def test_parse_batch_response():
+    ok = {"type": "debit", "amount": 1}
+    texto = json.dumps([{**ok, "id": "a"}, {"id": "b", "type": "ignore"}, {"id": "x", **ok}, {"id": "c"}])
+    assert parse_batch_response(texto, ["a", "b", "c"]) == {"a": ok, "b": {"type": "ignore"}}
+    assert parse_batch_response([{**ok, "id": "a"}], ["a"]) == {"a": ok}
+    assert parse_batch_response("[{roto", ["a"]) == {}
+    assert parse_batch_response(json.dumps(ok), ["a"]) == {}
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
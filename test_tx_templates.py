@@ -0,0 +1,99 @@
+"""Tests de tx_templates (puro, sin Firebase/Gemini). Corre con:
+    python3 test_tx_templates.py      (o pytest)
+"""
+
+from tx_enrich import build_merchant_memory, FuzzyIndex, MerchantClassifier
+from tx_templates import parse_amount, match_template, resolve_card, extract_with_template
+
+HISTORY = (
+    [{"title": "UBER RIDES", "category": "Transporte", "subcategory": "Uber/Taxi", "context": "personal"}] * 4
+    + [{"title": "Tienda Nueva", "category": "Hogar", "subcategory": "", "context": "personal"},
+       {"title": "Tienda Nueva", "category": "Otros", "subcategory": "", "context": "business"},
+       {"title": "Tienda Nueva", "category": "Ropa", "subcategory": "", "context": "personal"}]
+)
+ACCOUNTS = ["Visa *1234", "Ahorros 2823", "Mastercard *9876"]
+
+COMPRA = ("Bancolombia: Compraste $25.000,00 en UBER RIDES con tu T.Cred *1234, "
+          "el 09/10/2025 a las 14:05. Si tienes dudas, encuentranos aqui.")
+TRANSFER = ("Bancolombia: Transferiste $444,000.00 desde tu cuenta 2823 a la cuenta "
+            "*3114096566 el 25/06/2026 a las 22:45.")
+
+
+def test_parse_amount():
+    assert parse_amount("444,000.00") == 444000.0
+    assert parse_amount("25.000") == 25000.0
+    assert parse_amount("25.000,50") == 25000.5
+    assert parse_amount("1234") == 1234.0
+    assert parse_amount("12.5") == 12.5
+
+
+def test_match_templates():
+    name, fields = match_template(COMPRA)
+    assert name == "bancolombia_compra"
+    assert fields["amount"] == 25000.0 and fields["merchant"] == "UBER RIDES" and fields["card"] == "1234"
+
+    name, fields = match_template(TRANSFER)
+    assert name == "bancolombia_transferencia"
+    assert fields["amount"] == 444000.0 and fields["card"] == "2823"
+
+    assert match_template("Tu compra por $10.000 en UBER no fue exitosa") == (None, None)
+    assert match_template("Hola, tu extracto está listo") == (None, None)
+
+
+def test_resolve_card():
+    assert resolve_card("1234", ACCOUNTS) == "Visa *1234"
+    assert resolve_card("5555", ACCOUNTS) is None
+    assert resolve_card("7761", ["Visa", "Ahorros"], {"7761": "Visa"}) == "Visa"
+
+
+def test_fast_path_uses_memory():
+    mem = build_merchant_memory(HISTORY)
+    datos, motivo = extract_with_template(COMPRA, mem, ACCOUNTS, ["COP", "USD"], index=FuzzyIndex(mem))
+    assert motivo == "bancolombia_compra"
+    assert datos == {
+        "type": "debit", "amount": 25000.0, "title": "UBER RIDES", "currency": "COP",
+        "category": "Transporte", "subcategory": "Uber/Taxi", "context": "personal",
+        "card": "Visa *1234", "comments": "Compra en UBER RIDES con la tarjeta *1234",
+    }
+
+
+def test_fast_path_falls_back():
+    mem = build_merchant_memory(HISTORY)
+    # Comercio sin memoria consistente → Gemini.
+    texto = COMPRA.replace("UBER RIDES", "Tienda Nueva")
+    assert extract_with_template(texto, mem, ACCOUNTS)[0] is None
+    # Tarjeta que no corresponde a ninguna cuenta → Gemini.
+    assert extract_with_template(COMPRA.replace("*1234", "*5555"), mem, ACCOUNTS)[0] is None
+    # Un ingreso de un comercio que la memoria conoce por sus compras → Gemini.
+    recibida = "Bancolombia: Recibiste $25.000,00 de UBER RIDES en tu cuenta *2823."
+    assert extract_with_template(recibida, mem, ACCOUNTS)[0] is None
+    # Sin plantilla → Gemini.
+    assert extract_with_template("Hola", mem, ACCOUNTS) == (None, "sin plantilla")
+
+
+def test_fast_path_uses_classifier():
+    history = HISTORY + [{"title": "UBER TRIP", "category": "Transporte", "subcategory": "Uber/Taxi",
+                          "context": "personal"}] * 3
+    mem = build_merchant_memory(history)
+    clf = MerchantClassifier.train(history)
+    # "UBER HELP" no está en la memoria, pero el clasificador lo reconoce.
+    texto = COMPRA.replace("UBER RIDES", "UBER HELP")
+    assert extract_with_template(texto, mem, ACCOUNTS)[0] is None
+    datos, motivo = extract_with_template(texto, mem, ACCOUNTS, classifier=clf)
+    assert motivo == "bancolombia_compra+clasificador"
+    assert (datos["title"], datos["category"], datos["subcategory"]) == ("UBER HELP", "Transporte", "Uber/Taxi")
+    # Comercio con historial inconsistente: tampoco lo resuelve el clasificador.
+    assert extract_with_template(COMPRA.replace("UBER RIDES", "Tienda Nueva"), mem, ACCOUNTS,
+                                 classifier=clf)[0] is None
+
+
+def _run():
+    fns = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for fn in fns:
+        fn()
+        print(f"  ✓ {fn.__name__}")
+    print(f"OK — {len(fns)} tests")
+
+
+if __name__ == "__main__":
+    _run()
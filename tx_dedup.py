@@ -0,0 +1,166 @@
+"""
+Detección de transacciones duplicadas al importar, sin recorrer la colección.
+
+Los bancos a veces mandan dos notificaciones de la misma compra (la de la
+tarjeta y la de la cuenta), y el usuario puede haberla registrado ya a mano
+en la app. `DedupIndex` guarda una huella por transacción y responde en O(1)
+por correo con dos diccionarios:
+
+- por (monto, moneda, tarjeta, tipo, tramo de `BUCKET_MINUTES`): misma compra
+  notificada dos veces. Se miran el tramo del correo y los dos vecinos, y
+  el comercio normalizado tiene que estar en las dos y ser el mismo. Es un
+  `DUPLICATE`: el sync no la guarda ni manda push. Si falta el comercio en
+  alguna, o uno contiene al otro, solo es `POSSIBLE`.
+- por (monto, moneda, tipo, día): misma compra el mismo día con el mismo
+  comercio, p. ej. registrada a mano (la hora de esas no es la de la
+  compra, y la cuenta puede tener otro nombre). Puede ser una compra real
+  repetida, así que solo se marca: `POSSIBLE` → se guarda con
+  `possibleDuplicateOf`.
+
+El índice vive en memoria durante la corrida y se persiste en
+`dedup_index/recent` (un documento, ventana móvil de `WINDOW_DAYS` días): cada
+transacción guardada suma su huella en el mismo WriteBatch. Al cargarlo
+(solo lectura) se apartan las viejas en `podadas`, y se borran del documento
+con el primer WriteBatch que guarda algo (`prune_dedup`). Las transacciones recientes que el sync ya lee para el
+prompt completan el índice con las registradas desde la app.
+"""
+
+import datetime
+from collections import defaultdict
+
+from firebase_admin import firestore
+
+from tx_enrich import normalize_merchant
+
+DEDUP_COLLECTION = 'dedup_index'
+DEDUP_DOC = 'recent'
+
+BUCKET_MINUTES = 15
+WINDOW_DAYS = 3
+
+DUPLICATE = 'duplicate'
+POSSIBLE = 'possible'
+
+
+def dedup_entry(tx, timed=True):
+    """Huella de una transacción (dict serializable) o None si no tiene monto.
+
+    Con `timed=False` se ignora su `timestamp` (transacciones manuales)."""
+    try:
+        cents = int(round(float(tx.get('amount')) * 100))
+    except (TypeError, ValueError):
+        return None
+    ts = tx.get('timestamp') if timed else None
+    return {
+        'a': cents,
+        'c': tx.get('currency') or 'COP',
+        'k': tx.get('card') or '',
+        'y': tx.get('type') or 'debit',
+        't': int(ts.timestamp() // 60) if isinstance(ts, datetime.datetime) else None,
+        'd': str(tx.get('date') or ''),
+        'm': normalize_merchant(tx.get('title', '')),
+    }
+
+
+def _comercio_parecido(a, b):
+    """Falta en alguna o una contiene a la otra ("rappi" / "rappi colombia")."""
+    return not a or not b or a in b or b in a
+
+
+class DedupIndex:
+    """Huellas de las transacciones recientes, indexadas por hora y por día."""
+
+    def __init__(self, entries=None):
+        self.entries = {}
+        # Huellas viejas que ya no están en `entries` pero siguen en Firestore.
+        self.podadas = set()
+        self._por_tramo = defaultdict(list)
+        self._por_dia = defaultdict(list)
+        for tx_id, entry in (entries or {}).items():
+            self._indexar(tx_id, entry)
+
+    def _indexar(self, tx_id, e):
+        self.entries[tx_id] = e
+        if e['t'] is not None:
+            self._por_tramo[(e['a'], e['c'], e['k'], e['y'], e['t'] // BUCKET_MINUTES)].append(tx_id)
+        self._por_dia[(e['a'], e['c'], e['y'], e['d'])].append(tx_id)
+
+    def add(self, tx_id, tx, timed=True):
+        """Suma una transacción al índice y devuelve su huella (o None)."""
+        entry = dedup_entry(tx, timed)
+        if entry is not None:
+            self._indexar(tx_id, entry)
+        return entry
+
+    def remove(self, tx_id):
+        """Saca una transacción del índice (p. ej. si no se llegó a guardar)."""
+        e = self.entries.pop(tx_id, None)
+        if e is None:
+            return
+        if e['t'] is not None:
+            self._por_tramo[(e['a'], e['c'], e['k'], e['y'], e['t'] // BUCKET_MINUTES)].remove(tx_id)
+        self._por_dia[(e['a'], e['c'], e['y'], e['d'])].remove(tx_id)
+
+    def match(self, tx):
+        """`(DUPLICATE | POSSIBLE, id)` de la transacción que coincide, o None."""
+        e = dedup_entry(tx)
+        if e is None:
+            return None
+        posible = None
+        if e['t'] is not None:
+            tramo = e['t'] // BUCKET_MINUTES
+            for t in (tramo - 1, tramo, tramo + 1):
+                for tx_id in self._por_tramo.get((e['a'], e['c'], e['k'], e['y'], t), ()):
+                    otra = self.entries[tx_id]
+                    if abs(otra['t'] - e['t']) > BUCKET_MINUTES:
+                        continue
+                    # Solo se descarta si las dos traen el mismo comercio.
+                    if e['m'] and otra['m'] == e['m']:
+                        return DUPLICATE, tx_id
+                    if posible is None and _comercio_parecido(otra['m'], e['m']):
+                        posible = tx_id
+        if posible is not None:
+            return POSSIBLE, posible
+        for tx_id in self._por_dia.get((e['a'], e['c'], e['y'], e['d']), ()):
+            otra = self.entries[tx_id]['m']
+            if e['m'] and otra and (otra in e['m'] or e['m'] in otra):
+                return POSSIBLE, tx_id
+        return None
+
+    def stale(self, today, days=WINDOW_DAYS):
+        """IDs de huellas de antes de la ventana."""
+        desde = (today - datetime.timedelta(days=days)).isoformat()
+        return [tx_id for tx_id, e in self.entries.items() if e['d'] < desde]
+
+
+def _ref(db):
+    return db.collection(DEDUP_COLLECTION).document(DEDUP_DOC)
+
+
+def load_dedup_index(db, today):
+    """Lee el índice persistido sin las huellas viejas (quedan en `podadas`;
+    no escribe nada, ver `prune_dedup`)."""
+    doc = _ref(db).get()
+    entries = (doc.to_dict().get('entries') or {}) if doc.exists else {}
+    viejas = set(DedupIndex(entries).stale(today))
+    index = DedupIndex({tx_id: e for tx_id, e in entries.items() if tx_id not in viejas})
+    index.podadas = viejas
+    return index
+
+
+def prune_dedup(db, tx_ids, batch):
+    """Borra del documento las huellas `tx_ids` (en `batch`)."""
+    if tx_ids:
+        batch.set(_ref(db), {'entries': {tx_id: firestore.DELETE_FIELD for tx_id in tx_ids}},
+                  merge=True)
+
+
+def record_dedup(db, tx_id, entry, batch=None):
+    """Persiste la huella de una transacción guardada (en `batch`, si se pasa)."""
+    if entry is None:
+        return
+    delta = {'entries': {tx_id: entry}}
+    if batch is not None:
+        batch.set(_ref(db), delta, merge=True)
+    else:
+        _ref(db).set(delta, merge=True)
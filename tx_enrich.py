@@ -6,18 +6,46 @@ Módulo puro (solo stdlib): se puede testear sin Firebase ni Gemini.
 - Memoria de comercios: clasificación habitual (categoría/subcategoría/contexto)
   por comercio, derivada del historial. Se usa como (a) prior en el prompt y
   (b) post-corrección determinista de la salida del LLM cuando hay confianza.
+  Se construye a partir de conteos por comercio (`merchant_counts`), que se
+  pueden persistir y actualizar de a una transacción (`add_to_merchant_counts`).
+- Búsqueda fuzzy de comercios/cuentas (`FuzzyIndex`): índice de trigramas
+  que devuelve lo mismo que `difflib.get_close_matches(..., n=1)` sin
+  recorrer todas las claves en cada consulta.
+- Clasificador local (`MerchantClassifier`): Naive Bayes multinomial sobre
+  n-gramas hasheados del comercio. Predice la clasificación completa (tipo,
+  categoría, subcategoría y contexto, como una sola etiqueta) de comercios
+  que la memoria no conoce (o no lo bastante).
 - Gate de no-transacciones: detecta extractos por asunto.
 - Validación contra catálogos al guardar.
 """
 
 import re
+import math
+import zlib
 import difflib
-from collections import Counter
+import functools
+import threading
+from collections import Counter, defaultdict
+
+# Similitud mínima (SequenceMatcher.ratio) para el match fuzzy de comercios y cuentas.
+MERCHANT_FUZZY_CUTOFF = 0.9
+ACCOUNT_FUZZY_CUTOFF = 0.8
 
 # Umbrales para auto-aplicar la memoria de comercios sobre la salida del LLM.
 MEMORY_MIN_COUNT = 3      # nº mínimo de precedentes del comercio
 MEMORY_MIN_AGREE = 0.70   # acuerdo mínimo del campo en el historial
 
+# Clasificador local: cubetas del hashing, suavizado de Laplace, nitidez
+# (cuántas "evidencias independientes" vale el promedio por n-grama; con 1 el
+# promedio subestima y con la suma de Naive Bayes sobreestima, porque los
+# n-gramas de una palabra no son independientes) y confianza mínima para
+# usar una predicción.
+CLASSIFIER_BUCKETS = 1 << 18
+CLASSIFIER_ALPHA = 1.0
+CLASSIFIER_SHARPNESS = 3.0
+CLASSIFIER_MIN_CONFIDENCE = 0.9
+CLASSIFIER_FIELDS = ("type", "category", "subcategory", "context")
+
 _TOKEN_RE = re.compile(r"[a-z0-9áéíóúñü]+")
 # Asuntos que NO son una transacción individual (extractos / estados de cuenta).
 # OJO: "Resumen de transacción" SÍ es una transacción → no se filtra por "resumen".
@@ -31,47 +59,99 @@ def normalize_merchant(title):
     return re.sub(r"\s+", " ", t).strip()
 
 
+def normalize_category(category):
+    """Igual que `normalizeCategory` del frontend: objeto → su `name`."""
+    if category and isinstance(category, dict):
+        return str(category.get("name") or "general")
+    return str(category) if category else "general"
+
+
 def looks_like_statement(subject):
     """True si el asunto parece un extracto/estado de cuenta (no una transacción)."""
     return bool(_STATEMENT_RE.search(subject or ""))
 
 
-def build_merchant_memory(transactions):
-    """Construye la memoria de comercios desde el historial.
+def add_to_merchant_counts(counts, tx, sign=1):
+    """Suma (o resta, con `sign=-1`) una transacción a los conteos por comercio.
 
-    `transactions` es una lista de dicts con al menos
-    {title, category, subcategory, context}. Devuelve
-    {clave_comercio: {merchant, count, category, cat_agree, subcategory,
-                      sub_agree, context, ctx_agree}}.
+    Modifica `counts` en el lugar y devuelve la clave del comercio (None si el
+    título no produce clave). `counts` tiene la forma
+    {clave_comercio: {merchant, count, type: {valor: n}, category: {valor: n},
+                      subcategory: {valor: n}, context: {valor: n}}}.
     """
-    groups = {}
+    key = normalize_merchant(tx.get("title", ""))
+    if not key:
+        return None
+    entry = counts.setdefault(key, {
+        "merchant": tx.get("title", ""), "count": 0,
+        "type": {}, "category": {}, "subcategory": {}, "context": {},
+    })
+    entry["count"] += sign
+    for field, value in merchant_fields(tx).items():
+        # Conteos guardados antes de contar el tipo no traen ese mapa.
+        values = entry.setdefault(field, {})
+        values[value] = values.get(value, 0) + sign
+    return key
+
+
+def merchant_fields(tx):
+    """Valores de clasificación que se cuentan por comercio. Una categoría
+    guardada como objeto (forma antigua) cuenta por su nombre."""
+    category = tx.get("category", "")
+    return {
+        "type": tx.get("type", "debit") or "debit",
+        "category": normalize_category(category) if isinstance(category, dict) else (category or ""),
+        "subcategory": tx.get("subcategory", "") or "",
+        "context": tx.get("context", "personal") or "personal",
+    }
+
+
+def merchant_counts(transactions):
+    """Conteos por comercio de todo el historial (ver `add_to_merchant_counts`)."""
+    counts = {}
     for tx in transactions:
-        key = normalize_merchant(tx.get("title", ""))
-        if not key:
-            continue
-        gg = groups.setdefault(key, {
-            "display": tx.get("title", ""), "count": 0,
-            "cat": Counter(), "sub": Counter(), "ctx": Counter(),
-        })
-        gg["count"] += 1
-        gg["cat"][tx.get("category", "")] += 1
-        gg["sub"][tx.get("subcategory", "") or ""] += 1
-        gg["ctx"][tx.get("context", "personal") or "personal"] += 1
+        add_to_merchant_counts(counts, tx)
+    return counts
+
+
+def memory_entry(entry):
+    """Entrada de la memoria (valor mayoritario y acuerdo por campo) a partir
+    de los conteos de un comercio. None si no le quedan transacciones.
+    `type` es None si los conteos no traen el tipo (ver `_majority`)."""
+    total = entry.get("count", 0)
+    if total <= 0:
+        return None
+    out = {"merchant": entry.get("merchant", ""), "count": total,
+           "type": (_majority(entry, "type") or (None,))[0]}
+    for field, agree in (("category", "cat_agree"), ("subcategory", "sub_agree"),
+                         ("context", "ctx_agree")):
+        value, n = _majority(entry, field)
+        out[field] = value
+        out[agree] = n / total
+    return out
 
+
+def memory_from_counts(counts):
+    """Memoria de comercios a partir de los conteos persistidos."""
     memory = {}
-    for key, gg in groups.items():
-        cat, catn = gg["cat"].most_common(1)[0]
-        sub, subn = gg["sub"].most_common(1)[0]
-        ctx, ctxn = gg["ctx"].most_common(1)[0]
-        memory[key] = {
-            "merchant": gg["display"], "count": gg["count"],
-            "category": cat, "cat_agree": catn / gg["count"],
-            "subcategory": sub, "sub_agree": subn / gg["count"],
-            "context": ctx, "ctx_agree": ctxn / gg["count"],
-        }
+    for key, entry in counts.items():
+        m = memory_entry(entry)
+        if m:
+            memory[key] = m
     return memory
 
 
+def build_merchant_memory(transactions):
+    """Construye la memoria de comercios desde el historial.
+
+    `transactions` es una lista de dicts con al menos
+    {title, type, category, subcategory, context}. Devuelve
+    {clave_comercio: {merchant, count, type, category, cat_agree, subcategory,
+                      sub_agree, context, ctx_agree}}.
+    """
+    return memory_from_counts(merchant_counts(transactions))
+
+
 def memory_for_prompt(memory, top_n=60):
     """Versión compacta de la memoria para inyectar en el prompt: los comercios
     más frecuentes con su clasificación habitual."""
@@ -88,27 +168,358 @@ def memory_for_prompt(memory, top_n=60):
     ]
 
 
-def _lookup_merchant(title, memory):
-    """Busca el comercio en la memoria: exacto y, si falla, fuzzy (>=0.9)."""
+def _trigrams(text):
+    return Counter(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _min_matches(total, cutoff):
+    """Mínimo de caracteres coincidentes M con 2*M/total >= cutoff (misma
+    aritmética que SequenceMatcher.ratio)."""
+    m = max(0, int(cutoff * total / 2) - 1)
+    while 2.0 * m / total < cutoff:
+        m += 1
+    return m
+
+
+class FuzzyIndex:
+    """Índice invertido de trigramas para el match fuzzy de una lista de claves.
+
+    `best_match(q, cutoff)` devuelve exactamente lo mismo que
+    `difflib.get_close_matches(q, claves, n=1, cutoff=cutoff)` (la clave con
+    mayor ratio; en empate, la mayor), pero solo verifica con SequenceMatcher
+    los candidatos que pueden alcanzar el umbral:
+
+    - Longitud: ratio = 2M/(|q|+|c|) <= 2·min/(|q|+|c|), que acota |c|.
+    - Trigramas: con M coincidencias, cada carácter no coincidente de q rompe
+      a lo sumo 3 trigramas de q y cada corte entre bloques coincidentes
+      (que exige un carácter no coincidente de c) rompe a lo sumo 2; el resto
+      aparece también en c. Así q y c comparten al menos
+      T = (|q|-2) - 3(|q|-M) - 2(|c|-M) trigramas (o lo simétrico).
+    - Prefijo: quien comparte >= T de los Q trigramas de q tiene que aparecer
+      en alguno de sus Q-T+1 trigramas más raros, así que solo se recorren
+      esas listas del índice invertido.
+    """
+
+    def __init__(self, keys=()):
+        self._keys = []
+        self._ids = {}
+        self._grams = []                     # id -> Counter de trigramas
+        self._postings = defaultdict(list)   # trigrama -> [id]
+        self._by_len = defaultdict(list)     # longitud -> [id]
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def add(self, key):
+        """Añade una clave (idempotente)."""
+        if key in self._ids:
+            return
+        kid = len(self._keys)
+        grams = _trigrams(key)
+        self._keys.append(key)
+        self._ids[key] = kid
+        self._grams.append(grams)
+        self._by_len[len(key)].append(kid)
+        for gram in grams:
+            self._postings[gram].append(kid)
+
+    def _candidates(self, query, cutoff):
+        lq = len(query)
+        qgrams = _trigrams(query)
+        bounds = {}          # longitud -> mínimo de trigramas compartidos
+        candidates = []
+        for lc in list(self._by_len):
+            total = lq + lc
+            m = _min_matches(total, cutoff) if total else 0
+            if m > min(lq, lc):
+                continue
+            bound = max((lq - 2) - 3 * (lq - m) - 2 * (lc - m),
+                        (lc - 2) - 3 * (lc - m) - 2 * (lq - m))
+            if bound <= 0:
+                candidates.extend(self._by_len[lc])
+            else:
+                bounds[lc] = bound
+        if not bounds:
+            return candidates
+
+        # Trigramas más raros primero, hasta cubrir Q - T_min + 1 apariciones.
+        need = sum(qgrams.values()) - min(bounds.values()) + 1
+        seen = set()
+        for gram in sorted(qgrams, key=lambda g: len(self._postings.get(g, ()))):
+            if need <= 0:
+                break
+            need -= qgrams[gram]
+            for kid in self._postings.get(gram, ()):
+                if kid in seen:
+                    continue
+                seen.add(kid)
+                bound = bounds.get(len(self._keys[kid]))
+                if bound is None:
+                    continue
+                grams = self._grams[kid]
+                if sum(min(n, grams[g]) for g, n in qgrams.items() if g in grams) >= bound:
+                    candidates.append(kid)
+        return candidates
+
+    def best_match(self, query, cutoff=0.6):
+        """La clave más parecida a `query` con ratio >= cutoff, o None."""
+        best = None
+        s = difflib.SequenceMatcher()
+        s.set_seq2(query)
+        for kid in self._candidates(query, cutoff):
+            key = self._keys[kid]
+            s.set_seq1(key)
+            if s.real_quick_ratio() >= cutoff and s.quick_ratio() >= cutoff:
+                score = s.ratio()
+                if score >= cutoff and (best is None or (score, key) > best):
+                    best = (score, key)
+        return best[1] if best else None
+
+
+def _bucket(gram):
+    return zlib.crc32(gram.encode()) & (CLASSIFIER_BUCKETS - 1)
+
+
+def merchant_features(title):
+    """Cubetas de los n-gramas de un comercio: `(palabras, todas)`.
+
+    Se usan palabras, pares de palabras y trigramas de caracteres de cada
+    palabra (estos acercan variantes como "uber rides" / "uber trip").
+    `todas` va ordenada y sin repetidos."""
+    return _features(normalize_merchant(title))
+
+
+@functools.lru_cache(maxsize=4096)
+def _features(key):
+    words = key.split()
+    word_buckets = {_bucket(f"w:{w}") for w in words}
+    grams = {f"b:{a} {b}" for a, b in zip(words, words[1:])}
+    for w in words:
+        if not w.isdigit():
+            padded = f" {w} "
+            grams.update(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return frozenset(word_buckets), tuple(sorted(word_buckets | {_bucket(g) for g in grams}))
+
+
+def _majority(entry, field):
+    """`(valor, n)` mayoritario de un campo de los conteos de un comercio.
+
+    None para el tipo si los conteos no lo traen para todas sus transacciones
+    (se guardaron antes de contarlo; el rebuild diario los completa)."""
+    values = entry.get(field) or {}
+    if field == "type" and sum(values.values()) < entry.get("count", 0):
+        return None
+    # Empates: gana el primero en aparecer (como Counter.most_common).
+    return max((values or {"": 0}).items(), key=lambda kv: kv[1])
+
+
+# Etiqueta de las transacciones de comercios con historial inconsistente
+# (ver `_joint_labels`): el clasificador la puede predecir, pero nunca se aplica.
+_MIXED = None
+
+
+def _joint_labels(entry):
+    """Transacciones de un comercio por etiqueta conjunta (tupla con los
+    valores de `CLASSIFIER_FIELDS`).
+
+    Los conteos guardan cada campo por separado, así que a la clasificación
+    mayoritaria solo se le cuentan las transacciones que seguro la tienen
+    completa (Σ mayorías − (campos − 1)·total); el resto va a `_MIXED`.
+    Si el tipo no está contado (`_majority`), la etiqueta lo lleva en None
+    y el acuerdo sale de los demás campos."""
+    total = entry.get("count", 0)
+    if total <= 0:
+        return {}
+    label, agree, campos = [], 0, 0
+    for field in CLASSIFIER_FIELDS:
+        value, n = _majority(entry, field) or (None, 0)
+        label.append(value)
+        if value is not None:
+            agree += n
+            campos += 1
+    n = max(0, agree - (campos - 1) * total)
+    return {k: v for k, v in ((tuple(label), n), (_MIXED, total - n)) if v}
+
+
+class MerchantClassifier:
+    """Naive Bayes multinomial sobre `merchant_features` que predice la
+    clasificación completa de un comercio: los `CLASSIFIER_FIELDS` van juntos
+    en una sola etiqueta, así que una predicción nunca combina, p. ej., el
+    tipo de un comercio con la categoría de otro.
+
+    Cada comercio aporta su clasificación mayoritaria y, si su historial no
+    es consistente, una parte a la etiqueta "mixta" (`_joint_labels`); un
+    comercio nuevo que se parece a esos se deja al LLM. Se entrena con los
+    mismos conteos por comercio que la memoria (`from_counts`: cada comercio
+    pesa lo que sus transacciones) y se actualiza de a una transacción
+    (`add`, que rehace el aporte de ese comercio). Los conteos por n-grama
+    son dispersos (cubeta → {etiqueta: n}) y la predicción solo recorre las
+    etiquetas vistas con cada n-grama; la parte que no depende del comercio
+    (prior y normalización) se recalcula solo después de un `add`.
+
+    La confianza es el posterior con la verosimilitud promediada por n-grama
+    y escalada por `CLASSIFIER_SHARPNESS`, que está mejor calibrado que el de
+    Naive Bayes tal cual. `add` y `predict` se pueden llamar desde hilos
+    distintos.
+    """
+
+    def __init__(self, alpha=CLASSIFIER_ALPHA):
+        self.alpha = alpha
+        self._log_alpha = math.log(alpha)
+        # Conteos por comercio (como `merchant_counts`) y lo que aporta cada uno.
+        self._conteos = {}
+        self._aportes = {}
+        # Por etiqueta: transacciones y n-gramas; por cubeta: {etiqueta: n}.
+        self._docs = Counter()
+        self._grams = Counter()
+        self._counts = defaultdict(Counter)
+        self._seen = Counter()   # cubeta → nº de transacciones que la tienen
+        self._base = None        # {etiqueta: término fijo del score}
+        self._weights = {}       # cubeta → ((etiqueta, log(n + α) − log α), ...), de a poco
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_counts(cls, counts, **kw):
+        """Clasificador entrenado con los conteos de `merchant_counts`."""
+        clf = cls(**kw)
+        for key, entry in counts.items():
+            clf._conteos[key] = {**entry, **{f: dict(entry.get(f) or {}) for f in CLASSIFIER_FIELDS}}
+            clf._update(key)
+        return clf
+
+    @classmethod
+    def train(cls, transactions, **kw):
+        """Clasificador entrenado con una lista de transacciones."""
+        return cls.from_counts(merchant_counts(transactions), **kw)
+
+    def add(self, tx, sign=1):
+        """Suma (o resta, con `sign=-1`) una transacción."""
+        with self._lock:
+            key = add_to_merchant_counts(self._conteos, tx, sign)
+            if key:
+                self._update(key)
+
+    def _update(self, key):
+        """Reemplaza el aporte del comercio `key` por el de sus conteos actuales."""
+        entry = self._conteos.get(key)
+        new = _joint_labels(entry) if entry else {}
+        old = self._aportes.pop(key, {})
+        if new:
+            self._aportes[key] = new
+        _, feats = merchant_features(key)
+        if not feats:
+            return
+        self._base = None
+        n = sum(new.values()) - sum(old.values())
+        for b in feats:
+            self._seen[b] += n
+            self._weights.pop(b, None)
+        for label in set(new) | set(old):
+            k = new.get(label, 0) - old.get(label, 0)
+            if not k:
+                continue
+            self._docs[label] += k
+            self._grams[label] += k * len(feats)
+            for b in feats:
+                self._counts[b][label] += k
+
+    def _base_scores(self):
+        """log P(etiqueta) + nitidez · (log α − log(n-gramas de la etiqueta + α·cubetas))."""
+        total = sum(n for n in self._docs.values() if n > 0)
+        return {label: math.log(n / total) + CLASSIFIER_SHARPNESS * (
+                    self._log_alpha - math.log(self._grams[label] + self.alpha * CLASSIFIER_BUCKETS))
+                for label, n in self._docs.items() if n > 0}
+
+    def predict(self, title):
+        """`(clasificación, confianza)` para un comercio, o None si ninguna de
+        sus palabras se vio al entrenar (no hay evidencia). `clasificación`
+        es `{campo: valor}` de `CLASSIFIER_FIELDS`, o None si gana la
+        etiqueta mixta."""
+        words, feats = merchant_features(title)
+        with self._lock:
+            if not any(self._seen.get(b, 0) > 0 for b in words):
+                return None
+            if self._base is None:
+                self._base = self._base_scores()
+            if not self._base:
+                return None
+            # Σ (log(n + α) − log α) de los n-gramas vistos con cada etiqueta.
+            extra = defaultdict(float)
+            for b in feats:
+                weights = self._weights.get(b)
+                if weights is None:
+                    weights = self._weights[b] = tuple(
+                        (label, math.log(n + self.alpha) - self._log_alpha)
+                        for label, n in self._counts.get(b, {}).items() if n > 0)
+                for label, w in weights:
+                    extra[label] += w
+            k = CLASSIFIER_SHARPNESS / len(feats)
+            scores = {label: b + k * extra.get(label, 0.0) for label, b in self._base.items()}
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(sc - top) for sc in scores.values())
+        return (None if best is _MIXED else dict(zip(CLASSIFIER_FIELDS, best))), confidence
+
+
+def apply_classifier(datos, classifier, min_confidence=CLASSIFIER_MIN_CONFIDENCE):
+    """Completa categoría/subcategoría/contexto con el clasificador local,
+    solo si confía en la clasificación y su tipo es el de `datos` (el de la
+    plantilla; un tipo None, de conteos sin tipo, no se compara). No aplica
+    a 'ignore'.
+
+    Devuelve (datos_clasificados, info|None) — info trae la confianza."""
+    if classifier is None or datos.get("type") == "ignore":
+        return datos, None
+    pred = classifier.predict(datos.get("title", ""))
+    if not pred:
+        return datos, None
+    label, confidence = pred
+    if label is None or confidence < min_confidence or label["type"] not in (None, datos.get("type")):
+        return datos, None
+    out = dict(datos)
+    for field in ("category", "subcategory", "context"):
+        out[field] = label[field]
+    return out, {"confidence": confidence}
+
+
+def _lookup_merchant(title, memory, index=None):
+    """Busca el comercio en la memoria: exacto y, si falla, fuzzy (>=0.9).
+
+    `index` es un `FuzzyIndex` con las claves de `memory`; sin él se recurre
+    a difflib sobre todas las claves.
+    """
     key = normalize_merchant(title)
     if key in memory:
         return memory[key]
-    match = difflib.get_close_matches(key, list(memory.keys()), n=1, cutoff=0.9)
+    if index is not None:
+        match = index.best_match(key, MERCHANT_FUZZY_CUTOFF)
+        return memory.get(match) if match else None
+    match = difflib.get_close_matches(key, list(memory.keys()), n=1, cutoff=MERCHANT_FUZZY_CUTOFF)
     return memory[match[0]] if match else None
 
 
 def apply_merchant_memory(datos, memory,
-                          min_count=MEMORY_MIN_COUNT, min_agree=MEMORY_MIN_AGREE):
+                          min_count=MEMORY_MIN_COUNT, min_agree=MEMORY_MIN_AGREE, index=None):
     """Post-corrección determinista: si el comercio es conocido y consistente,
     fija categoría/subcategoría/contexto desde la memoria (por campo, según su
-    acuerdo). No toca amount/title/comments. No aplica a 'ignore'.
+    acuerdo). No toca amount/title/comments. No aplica a 'ignore' ni si el
+    tipo mayoritario del comercio no es el de `datos` (p. ej. un reintegro de
+    un comercio de compras), igual que `apply_classifier`.
+
+    `index` (opcional) es un `FuzzyIndex` de las claves de `memory`, para no
+    recorrerlas todas en el match fuzzy.
 
     Devuelve (datos_corregidos, info|None) — info trae lo que cambió.
     """
     if not memory or datos.get("type") == "ignore":
         return datos, None
-    m = _lookup_merchant(datos.get("title", ""), memory)
-    if not m or m["count"] < min_count:
+    m = _lookup_merchant(datos.get("title", ""), memory, index)
+    if not m or m["count"] < min_count or m.get("type") not in (None, datos.get("type")):
         return datos, None
 
     out = dict(datos)
@@ -128,15 +539,21 @@ def apply_merchant_memory(datos, memory,
     return out, {"merchant": m["merchant"], "count": m["count"], "changed": changed}
 
 
-def validate_classification(datos, category_names, accounts):
+def validate_classification(datos, category_names, accounts, account_index=None):
     """Asegura que la categoría exista en el catálogo (si no, 'Otros') y que la
-    cuenta exista (si no, la acerca por fuzzy a una cuenta válida). Pura."""
+    cuenta exista (si no, la acerca por fuzzy a una cuenta válida). Pura.
+
+    `account_index` (opcional) es un `FuzzyIndex` de `accounts`."""
     out = dict(datos)
     if category_names and out.get("category") not in category_names:
         out["category"] = "Otros" if "Otros" in category_names else (out.get("category") or "general")
     card = out.get("card")
     if accounts and card and card not in accounts:
-        match = difflib.get_close_matches(str(card), list(accounts), n=1, cutoff=0.8)
+        if account_index is not None:
+            match = account_index.best_match(str(card), ACCOUNT_FUZZY_CUTOFF)
+        else:
+            match = next(iter(difflib.get_close_matches(
+                str(card), list(accounts), n=1, cutoff=ACCOUNT_FUZZY_CUTOFF)), None)
         if match:
-            out["card"] = match[0]
+            out["card"] = match
     return out
@@ -0,0 +1,270 @@
+"""
+Armado del prompt de extracción para Gemini.
+
+Módulo puro (solo stdlib + tx_enrich): se puede testear sin Firebase ni Gemini.
+
+En vez de mandar en cada correo todo el árbol de categorías y los 60
+comercios más frecuentes con `indent=2`, el prompt lleva solo lo relevante
+para ESE correo y en JSON compacto:
+
+- Comercios: los que comparten palabras con el texto del correo (exactas o,
+  si hay typos, por fuzzy contra el vocabulario de la memoria), completados
+  con unos pocos de los más frecuentes como prior general.
+- Categorías: todos los nombres (el modelo debe poder elegir cualquiera),
+  pero las subcategorías solo de las categorías relevantes (las de los
+  comercios elegidos y las que se mencionan en el correo).
+"""
+
+import json
+import threading
+from collections import Counter, defaultdict
+
+from tx_enrich import FuzzyIndex, _TOKEN_RE
+
+# Versión del prompt: cambiarla invalida resultados cacheados por prompt.
+PROMPT_VERSION = 3
+
+# Comercios relevantes al correo y comercios frecuentes de relleno.
+MAX_RELEVANT_MERCHANTS = 15
+MAX_FREQUENT_MERCHANTS = 10
+
+# Transacciones recientes que se incluyen como muestra.
+MAX_RECENT = 10
+
+# Similitud mínima para aceptar un token del correo como typo de un token
+# de la memoria (p. ej. "rappii" → "rappi").
+TOKEN_FUZZY_CUTOFF = 0.85
+
+# Palabras que aparecen en casi todos los correos bancarios y no dicen nada
+# del comercio.
+_STOPWORDS = frozenset("""
+de del la las el los en con por para tu su sus un una al que se es y o a
+compra compraste pago pagaste transferencia transferiste cuenta tarjeta
+valor banco bancolombia notificacion alerta informa fecha hora cop usd
+""".split())
+
+
+def _tokens(text):
+    """Palabras útiles para relacionar un correo con un comercio (sin
+    números: montos, fechas y dígitos de tarjeta no identifican comercios)."""
+    return [t for t in _TOKEN_RE.findall((text or "").lower())
+            if len(t) >= 3 and not t.isdigit() and t not in _STOPWORDS]
+
+
+def compact_json(value):
+    """JSON sin espacios ni indentación (menos tokens)."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def estimate_tokens(text):
+    """Estimación rápida de tokens (~4 caracteres por token)."""
+    return (len(text) + 3) // 4
+
+
+class MerchantSelector:
+    """Índice palabra → comercios de la memoria, para elegir los relevantes
+    a un correo sin recorrer toda la memoria.
+
+    `select` corre en los hilos del pool mientras el hilo principal suma
+    comercios con `add` (`SyncContext.recordar`): un lock serializa ambos."""
+
+    def __init__(self, memory_keys=()):
+        self._by_token = defaultdict(set)
+        self._n_tokens = {}
+        self._vocab = FuzzyIndex()
+        self._lock = threading.Lock()
+        for key in memory_keys:
+            self.add(key)
+
+    def add(self, key):
+        """Añade un comercio (clave normalizada de la memoria)."""
+        with self._lock:
+            if key in self._n_tokens:
+                return
+            toks = set(_tokens(key))
+            self._n_tokens[key] = len(toks)
+            for tok in toks:
+                self._by_token[tok].add(key)
+                self._vocab.add(tok)
+
+    def select(self, text, memory, limit=MAX_RELEVANT_MERCHANTS):
+        """Claves de los comercios más relevantes al texto: fracción de sus
+        palabras que aparecen en el correo; desempata la frecuencia."""
+        hits = Counter()
+        with self._lock:
+            for tok in set(_tokens(text)):
+                if tok not in self._by_token:
+                    tok = self._vocab.best_match(tok, TOKEN_FUZZY_CUTOFF) if len(tok) >= 4 else None
+                    if not tok:
+                        continue
+                for key in self._by_token[tok]:
+                    hits[key] += 1
+            scored = [
+                (hits[key] / self._n_tokens[key], memory[key]["count"], key)
+                for key in hits if key in memory and self._n_tokens[key]
+            ]
+        scored.sort(reverse=True)
+        return [key for score, _, key in scored if score >= 0.5][:limit]
+
+
+def select_merchants(text, memory, selector, relevant=MAX_RELEVANT_MERCHANTS,
+                     frequent=MAX_FREQUENT_MERCHANTS):
+    """Filas de memoria para el prompt: relevantes al correo + frecuentes."""
+    keys = selector.select(text, memory, relevant) if selector else []
+    chosen, total = set(keys), len(keys) + frequent
+    for m_key, _ in sorted(memory.items(), key=lambda kv: kv[1]["count"], reverse=True):
+        if len(keys) >= total:
+            break
+        if m_key not in chosen:
+            keys.append(m_key)
+            chosen.add(m_key)
+    return [
+        {
+            "comercio": memory[k]["merchant"],
+            "category": memory[k]["category"],
+            "subcategory": memory[k]["subcategory"],
+            "context": memory[k]["context"],
+            "visto": memory[k]["count"],
+        }
+        for k in keys
+    ]
+
+
+def select_categories(text, cat_tree, merchant_rows):
+    """Árbol de categorías para el prompt: todas las categorías, con sus
+    subcategorías solo si son relevantes al correo. Si ninguna lo es, se
+    manda el árbol completo."""
+    text_tokens = set(_tokens(text))
+    relevant = {row["category"] for row in merchant_rows[:MAX_RELEVANT_MERCHANTS]
+                if row.get("category")}
+    for c in cat_tree:
+        words = set(_tokens(c["name"]))
+        for sub in c.get("subcategories", []):
+            words.update(_tokens(sub))
+        if words & text_tokens:
+            relevant.add(c["name"])
+    if not relevant & {c["name"] for c in cat_tree}:
+        return cat_tree
+    return [c if c["name"] in relevant else {"name": c["name"]} for c in cat_tree]
+
+
+def _contexto(texto, cat_tree, cuentas, monedas, memory, recientes, selector, relevant):
+    """Bloque común a los prompts: catálogos, memoria, recientes y reglas."""
+    merchants = select_merchants(texto, memory, selector, relevant=relevant)
+    tree = select_categories(texto, cat_tree, merchants)
+    nombres_categorias = [c["name"] for c in cat_tree]
+    recientes = [{k: v for k, v in tx.items() if v not in (None, "")}
+                 for tx in recientes[:MAX_RECENT]]
+
+    return f"""Categorías disponibles (con sus subcategorías válidas cuando son relevantes a este correo):
+{compact_json(tree)}
+
+Cuentas/tarjetas disponibles: {compact_json(cuentas)}
+Monedas disponibles: {compact_json(monedas)}
+
+Memoria de comercios (clasificación HABITUAL por comercio — úsala como prior fuerte para
+categoría, subcategoría y contexto, y para imitar cómo se suele titular cada comercio):
+{compact_json(merchants)}
+
+Transacciones recientes (muestra adicional para inferir contexto):
+{compact_json(recientes)}
+
+Reglas para los campos:
+- type: 'debit' (gasto), 'credit' (ingreso) o 'ignore' (fallida/declinada o no-transacción).
+- amount: el monto numérico exacto, positivo y sin símbolos de moneda.
+- title: un resumen muy corto del concepto/comercio. Si el comercio aparece en la memoria, titúlalo igual que ahí.
+- currency: elige una opción de las monedas disponibles, o 'COP' si el texto usa $, pesos, etc.
+- category: elige una opción de {compact_json(nombres_categorias)}. Si no aplica ninguna, usa 'Otros'.
+- subcategory: elige una subcategoría VÁLIDA de la categoría que elegiste (ver lista de arriba). Si ninguna aplica o esa categoría no tiene subcategorías listadas, usa "".
+- card: elige una opción de las cuentas disponibles según la data del correo.
+- context: 'personal' o 'business'. Infiérelo del título, el correo y el historial; por defecto 'personal'.
+- comments: nota con el DETALLE concreto que aparezca en el correo, no un genérico. Si el correo
+  lista productos (p. ej. un domicilio), enuméralos; si es un transporte e incluye origen/destino, ponlos;
+  si es una transferencia, indica la contraparte (quién envía o recibe). Si el correo no trae detalle
+  específico, resume brevemente la transacción."""
+
+
+_INTRO = """Eres un experto asistente financiero que lee correos de notificaciones bancarias.
+Ignora firmas, saludos, publicidad o información legal. Céntrate en la transacción (quién cobró y cuánto).
+Si el correo es una notificación de un pago que TÚ hiciste, type = 'debit'.
+
+¡MUY IMPORTANTE! El resultado de un correo es únicamente {"type": "ignore"} si el correo:
+- indica que la transacción "no fue exitosa", fue "Rechazada", "Fallida", "Declinada", etc.; o
+- NO es una transacción individual: extractos / estados de cuenta, resúmenes mensuales,
+  alertas de saldo o de cupo disponible, códigos OTP, publicidad o avisos de seguridad."""
+
+
+def build_prompt(texto, cat_tree, cuentas, monedas, memory, recientes, selector=None):
+    """Prompt de extracción para un correo (ver docstring del módulo)."""
+    contexto = _contexto(texto, cat_tree, cuentas, monedas, memory, recientes,
+                         selector, MAX_RELEVANT_MERCHANTS)
+    return f"""{_INTRO}
+Extrae los datos de la transacción descrita en el correo y devuelve ÚNICAMENTE un objeto JSON válido.
+
+{contexto}
+
+Texto del correo:
+"{texto}"
+
+Devuelve solo el JSON, sin explicación ni markdown. Formato esperado:
+{{"type": "", "amount": 0, "title": "", "currency": "", "category": "", "subcategory": "", "card": "", "context": "", "comments": ""}}
+
+Si la transacción no fue exitosa o no es una transacción individual, devuelve únicamente:
+{{"type": "ignore"}}
+"""
+
+
+def build_batch_prompt(correos, cat_tree, cuentas, monedas, memory, recientes, selector=None):
+    """Prompt de extracción para varios correos a la vez.
+
+    `correos` es una lista de `(id, texto)`. Catálogos, memoria y reglas van
+    una sola vez; la respuesta esperada es un arreglo JSON con un objeto por
+    correo, marcado con su `id` (ver `parse_batch_response`).
+    """
+    unido = "\n".join(texto for _, texto in correos)
+    contexto = _contexto(unido, cat_tree, cuentas, monedas, memory, recientes, selector,
+                         MAX_RELEVANT_MERCHANTS * min(len(correos), 4))
+    bloques = "\n\n".join(f'<correo id="{msg_id}">\n{texto}\n</correo>' for msg_id, texto in correos)
+    return f"""{_INTRO}
+Vas a recibir {len(correos)} correos independientes, cada uno marcado con su id. Extrae la
+transacción de CADA correo por separado y devuelve ÚNICAMENTE un arreglo JSON válido con un
+objeto por correo, en el mismo orden.
+
+{contexto}
+
+Correos:
+{bloques}
+
+Devuelve solo el arreglo JSON, sin explicación ni markdown. Cada objeto lleva el id de su correo:
+[{{"id": "", "type": "", "amount": 0, "title": "", "currency": "", "category": "", "subcategory": "", "card": "", "context": "", "comments": ""}}]
+
+Para un correo cuya transacción no fue exitosa o que no es una transacción individual, su objeto es:
+{{"id": "", "type": "ignore"}}
+"""
+
+
+def parse_batch_response(data, ids):
+    """Resultados por id de la respuesta a `build_batch_prompt` (texto JSON o
+    ya parseado).
+
+    Devuelve `{id: datos}` solo con los correos que vinieron bien formados
+    (objeto con un `id` pedido y un `type`). Los que falten se deben extraer
+    uno a uno. Una respuesta ilegible devuelve `{}`.
+    """
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return {}
+    if isinstance(data, dict):
+        data = data.get("results") or data.get("transacciones") or [data]
+    if not isinstance(data, list):
+        return {}
+    pedidos, out = set(ids), {}
+    for item in data:
+        if not isinstance(item, dict) or not item.get("type"):
+            continue
+        msg_id = str(item.get("id", ""))
+        if msg_id in pedidos and msg_id not in out:
+            out[msg_id] = {k: v for k, v in item.items() if k != "id"}
+    return out
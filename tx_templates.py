@@ -0,0 +1,178 @@
+"""
+Plantillas deterministas de correos bancarios (camino rápido sin LLM).
+
+Módulo puro (solo stdlib + tx_enrich): se puede testear sin Firebase ni Gemini.
+
+La mayoría de los correos del día son las mismas notificaciones de siempre
+("Compraste $X en COMERCIO con tu T.Cred *1234..."). Para esas, una regex
+saca monto, tarjeta y comercio, y la clasificación sale de la memoria de
+comercios (`apply_merchant_memory`) o, si la memoria no conoce el comercio
+lo bastante, del clasificador local (`apply_classifier`). Solo si ninguna
+plantilla aplica, la tarjeta no corresponde a una cuenta conocida o ninguno
+de los dos es concluyente, el correo sigue a Gemini.
+
+Cada plantilla es una regex compilada más una función que convierte el match
+en campos de la transacción. Para soportar otro banco basta con registrar
+otra:
+
+    @template("mi_banco_compra", r"Usaste tu tarjeta (\\d{4}) por \\$([\\d.,]+) en (.+?)\\.")
+    def _mi_banco(m):
+        return {"type": "debit", "amount": parse_amount(m.group(2)),
+                "merchant": m.group(3), "card": m.group(1)}
+"""
+
+import re
+
+from tx_enrich import apply_merchant_memory, apply_classifier
+
+# Plantillas registradas, en orden de prioridad.
+TEMPLATES = []
+
+# Correos de transacciones fallidas: nunca por el camino rápido (el modelo
+# decide si se ignoran).
+_DECLINED_RE = re.compile(r"no fue exitosa|rechazad|fallid|declinad", re.IGNORECASE)
+
+# "Transferiste $444,000.00 desde tu cuenta 2823 a la cuenta *3114096566 el 25/06/2026 a las 22:45."
+TRANSFER_RE = re.compile(
+    r"Transferiste\s*\$\s*([\d.,]+)\s*desde tu cuenta\s*(\w+)\s*"
+    r"a la cuenta\s*\*?(\d+)\s*el\s*(\d{2}/\d{2}/\d{4})\s*a las\s*(\d{1,2}:\d{2})",
+    re.IGNORECASE,
+)
+
+
+class Template:
+    """Una plantilla: nombre, regex compilada y `build(match) -> dict`."""
+
+    def __init__(self, name, pattern, build):
+        self.name = name
+        self.pattern = pattern
+        self.build = build
+
+    def match(self, text):
+        m = self.pattern.search(text)
+        return self.build(m) if m else None
+
+
+def template(name, pattern, flags=re.IGNORECASE):
+    """Decorador que registra una plantilla en `TEMPLATES`."""
+    def decorator(build):
+        TEMPLATES.append(Template(name, re.compile(pattern, flags), build))
+        return build
+    return decorator
+
+
+def parse_amount(raw):
+    """Monto de un correo bancario a float: acepta "444,000.00", "25.000",
+    "25.000,50" y "1234"."""
+    raw = raw.strip().rstrip(".,")
+    if "," in raw and "." in raw:
+        decimal = "," if raw.rfind(",") > raw.rfind(".") else "."
+    elif re.fullmatch(r"\d{1,3}([.,]\d{3})+", raw):
+        decimal = None  # solo separadores de miles
+    else:
+        decimal = "," if "," in raw else "."
+    thousands = {",", "."} - {decimal}
+    for sep in thousands:
+        raw = raw.replace(sep, "")
+    return float(raw.replace(",", ".")) if raw else 0.0
+
+
+def _currency(text):
+    return "USD" if re.search(r"\bUS\$|\bUSD\b", text) else "COP"
+
+
+# --- Bancolombia ---
+
+@template("bancolombia_compra",
+          r"Compraste\s*(?:US)?\$\s*([\d.,]+)\s*en\s+(.+?)\s+con\s+tu\s+[\w. ]*?\*(\d{4})")
+def _bancolombia_compra(m):
+    return {"type": "debit", "amount": parse_amount(m.group(1)),
+            "merchant": m.group(2), "card": m.group(3),
+            "comments": f"Compra en {m.group(2).strip()} con la tarjeta *{m.group(3)}"}
+
+
+@template("bancolombia_pago",
+          r"Pagaste\s*\$\s*([\d.,]+)\s*a\s+(.+?)\s+desde\s+tu\s+[\w. ]*?\*(\d{4})")
+def _bancolombia_pago(m):
+    return {"type": "debit", "amount": parse_amount(m.group(1)),
+            "merchant": m.group(2), "card": m.group(3),
+            "comments": f"Pago a {m.group(2).strip()} desde el producto *{m.group(3)}"}
+
+
+@template("bancolombia_transferencia", TRANSFER_RE.pattern)
+def _bancolombia_transferencia(m):
+    return {"type": "debit", "amount": parse_amount(m.group(1)),
+            "merchant": f"Transferencia {m.group(3)}", "card": m.group(2)[-4:],
+            "comments": f"Transferencia a la cuenta *{m.group(3)}"}
+
+
+@template("bancolombia_recibida",
+          r"Recibiste\s+(?:una\s+transferencia\s+)?(?:por\s+)?\$\s*([\d.,]+)\s*de\s+(.+?)\s+en\s+tu\s+cuenta\s*\**(\d{4})")
+def _bancolombia_recibida(m):
+    return {"type": "credit", "amount": parse_amount(m.group(1)),
+            "merchant": m.group(2), "card": m.group(3),
+            "comments": f"Transferencia recibida de {m.group(2).strip()}"}
+
+
+def match_template(text, templates=None):
+    """Primera plantilla que reconoce el texto: `(nombre, campos)` o
+    `(None, None)`."""
+    if _DECLINED_RE.search(text):
+        return None, None
+    for tpl in TEMPLATES if templates is None else templates:
+        fields = tpl.match(text)
+        if fields and fields.get("amount"):
+            return tpl.name, fields
+    return None, None
+
+
+def resolve_card(digits, accounts, card_map=None):
+    """Cuenta de una tarjeta según sus últimos dígitos: la del mapa explícito
+    `card_map` ({"1234": "Visa"}) o la única cuenta cuyo nombre los contiene.
+    None si no se puede decidir."""
+    if card_map and card_map.get(digits) in accounts:
+        return card_map[digits]
+    found = [a for a in accounts if digits and digits in str(a)]
+    return found[0] if len(found) == 1 else None
+
+
+def extract_with_template(text, memory, accounts, currencies=None, index=None, card_map=None,
+                          classifier=None):
+    """Extrae la transacción sin LLM si es posible.
+
+    `card_map` asocia los últimos dígitos de cada tarjeta a su cuenta (ver
+    `resolve_card`). `classifier` (opcional) es un
+    `tx_enrich.MerchantClassifier` para los comercios que la memoria no
+    resuelve.
+
+    Devuelve `(datos, motivo)`: `datos` en el mismo formato que devuelve el
+    modelo (o None) y `motivo` explica por qué no se pudo (o el nombre de la
+    plantilla usada).
+    """
+    name, fields = match_template(text)
+    if not name:
+        return None, "sin plantilla"
+    card = resolve_card(fields["card"], accounts, card_map)
+    if not card:
+        return None, f"{name}: tarjeta *{fields['card']} sin cuenta"
+    currency = _currency(text)
+    if currencies and currency not in currencies:
+        return None, f"{name}: moneda {currency} no configurada"
+
+    datos = {
+        "type": fields["type"], "amount": fields["amount"],
+        "title": fields["merchant"].strip(), "currency": currency,
+        "category": None, "subcategory": None, "context": None,
+        "card": card, "comments": fields.get("comments", ""),
+    }
+    # Solo vale si la memoria fija los tres campos de la clasificación.
+    clasificado, info = apply_merchant_memory(datos, memory, index=index)
+    if info and set(info["changed"]) == {"category", "subcategory", "context"}:
+        clasificado["title"] = info["merchant"]
+        return clasificado, name
+    # Si no, el clasificador local, solo si confía en la clasificación completa
+    # y su tipo es el de la plantilla.
+    clasificado, info = apply_classifier(datos, classifier)
+    if info:
+        return clasificado, f"{name}+clasificador"
+    return None, f"{name}: memoria insuficiente para '{datos['title']}'"